@@ -0,0 +1,313 @@
+# === api_server.py - SERVEUR HTTP SANS INTERFACE (MULTI-UTILISATEURS) ===
+# Expose pp_agent en HTTP/JSON pour plusieurs interfaces ou intégrations, dans un seul processus
+# qui charge une fois le modèle d'embeddings, l'index FAISS et les agents :
+# - un historique par conversation (plus de chat_history global partagé entre utilisateurs)
+# - un pool borné de workers pour les réponses + une file d'attente bornée
+# - file pleine : réponse 429 (Retry-After) au lieu d'empiler les requêtes
+# - réponses en streaming (Server-Sent Events) ou en un bloc (JSON)
+#
+# Routes :
+#   POST   /v1/conversations                       -> {"conversation_id"}
+#   GET    /v1/conversations/<id>                  -> {"conversation_id", "messages"}
+#   DELETE /v1/conversations/<id>
+#   POST   /v1/conversations/<id>/messages         {"question", "stream": false} -> {"answer", "request_id"}
+#                                                  "stream": true -> text/event-stream (événements token / done)
+#   GET    /health                                 -> état du pool
+#   GET    /metrics                                -> pool, histogrammes des étapes, writer MCP
+#
+# Usage : python api_server.py [--host 127.0.0.1] [--port 8000] [--workers 4] [--queue-size 16]
+
+# === Importations ===
+import os, re, json, time, uuid, queue, logging, argparse, threading  # Config, routes, JSON, files, CLI, threads
+from concurrent.futures import ThreadPoolExecutor                       # Pool de workers des réponses
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler     # Serveur HTTP (bibliothèque standard)
+import pp_agent                                                         # Pipeline de réponse (RAG / Web / LLM)
+from tracing import request_trace, histograms                           # Identifiant de requête, métriques
+from mcp_client import mcp_stats                                        # État du writer MCP
+
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", "8000"))
+API_WORKERS = int(os.environ.get("API_WORKERS", "4"))                  # Réponses calculées simultanément
+API_QUEUE_SIZE = int(os.environ.get("API_QUEUE_SIZE", "16"))           # Réponses en attente d'un worker
+API_RETRY_AFTER = int(os.environ.get("API_RETRY_AFTER", "2"))          # En-tête Retry-After des 429 (s)
+API_MAX_CONVERSATIONS = int(os.environ.get("API_MAX_CONVERSATIONS", "1000"))
+API_CONVERSATION_TTL = float(os.environ.get("API_CONVERSATION_TTL", "3600"))  # Inactivité avant oubli (s)
+API_MAX_BODY = 64 * 1024                                               # Taille max d'une requête (octets)
+
+class PoolSaturated(Exception):
+    """Tous les workers sont occupés et la file d'attente est pleine"""
+
+class AnswerPool:
+    """Pool de workers borné : au plus workers réponses en cours et queue_size en attente"""
+
+    def __init__(self, workers=API_WORKERS, queue_size=API_QUEUE_SIZE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-worker")
+        self._lock = threading.Lock()
+        self.pending = 0    # En cours + en attente
+        self.rejected = 0   # Requêtes refusées (429)
+        self.completed = 0
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                raise PoolSaturated()
+            self.pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "capacity": self.capacity, "pending": self.pending,
+                    "queued": max(0, self.pending - self.workers), "completed": self.completed,
+                    "rejected": self.rejected}
+
+class Conversation:
+    """Historique propre à une conversation ; une seule question traitée à la fois"""
+
+    def __init__(self, conversation_id):
+        self.id = conversation_id
+        self.history = []                 # [(question, réponse)] (lecture ; le prompt utilise la mémoire pp_agent)
+        self.busy = threading.Lock()
+        self.last_used = time.monotonic()
+
+class ConversationRegistry:
+    """Conversations en mémoire, oubliées après API_CONVERSATION_TTL d'inactivité"""
+
+    def __init__(self, max_conversations=API_MAX_CONVERSATIONS, ttl=API_CONVERSATION_TTL):
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        with self._lock:
+            dropped = self._expire()
+            if len(self._items) >= self.max_conversations:  # Oublie la moins récemment utilisée
+                oldest = min(self._items.values(), key=lambda c: c.last_used)
+                del self._items[oldest.id]
+                dropped.append(oldest.id)
+            conv = Conversation(uuid.uuid4().hex)
+            self._items[conv.id] = conv
+        self._forget(dropped)
+        return conv
+
+    def get(self, conversation_id):
+        with self._lock:
+            conv = self._items.get(conversation_id)
+            if conv is not None: conv.last_used = time.monotonic()
+            return conv
+
+    def delete(self, conversation_id):
+        with self._lock:
+            deleted = self._items.pop(conversation_id, None) is not None
+        if deleted: self._forget([conversation_id])
+        return deleted
+
+    def _expire(self):
+        limit = time.monotonic() - self.ttl
+        expired = [cid for cid, c in self._items.items() if c.last_used < limit and not c.busy.locked()]
+        for cid in expired:
+            del self._items[cid]
+        return expired
+
+    @staticmethod
+    def _forget(conversation_ids):
+        """Résumés de conversation (pp_agent.get_memory) des conversations oubliées"""
+        for cid in conversation_ids:
+            try: pp_agent.get_memory().forget(cid)
+            except Exception as e: logger.error(f"Erreur suppression mémoire: {e}")
+
+    def __len__(self):
+        return len(self._items)
+
+# === Exécution des réponses (threads du pool) ===
+_END = object()  # Fin du flux de jetons
+
+def _answer(conv, question, request_id):
+    with request_trace("api_answer", request_id):
+        answer = pp_agent.answer_question(question, conv.history, conversation_id=conv.id)
+    conv.history.append((question, answer))
+    return answer
+
+def _answer_stream(conv, question, request_id, tokens, cancelled):
+    """Pousse les jetons dans tokens (lus par le thread HTTP) ; s'arrête si le client se déconnecte"""
+    parts = []
+    try:
+        with request_trace("api_answer", request_id):
+            gen = pp_agent.answer_question_stream(question, conv.history, conversation_id=conv.id)
+            try:
+                for token in gen:
+                    if cancelled.is_set(): break
+                    parts.append(token)
+                    tokens.put(token)
+                else:
+                    conv.history.append((question, "".join(parts)))  # Tour annulé : absent de l'historique
+            finally:
+                gen.close()  # Interrompu : journalisé (partial) sans cache sémantique ni mémoire
+    except Exception as e:
+        logger.error(f"Erreur réponse streaming: {e}")
+        tokens.put(e)
+    finally:
+        tokens.put(_END)
+
+# === Handler HTTP ===
+_CONV_RE = re.compile(r"^/v1/conversations/([0-9a-f]{32})(/messages)?/?$")
+
+class APIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive ; streaming en encodage chunked
+    pool = None                    # AnswerPool (affecté par make_server)
+    conversations = None           # ConversationRegistry
+
+    def log_message(self, fmt, *args):
+        logger.debug("%s - " + fmt, self.address_string(), *args)
+
+    # --- Utilitaires ---
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items(): self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, headers=None):
+        self._send_json(status, {"error": message}, headers)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > API_MAX_BODY: raise ValueError("Requête trop volumineuse")
+        data = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(data, dict): raise ValueError("Objet JSON attendu")
+        return data
+
+    def _saturated(self):
+        self._error(429, "Serveur saturé, réessayez plus tard", {"Retry-After": str(API_RETRY_AFTER)})
+
+    # --- Routes ---
+    def do_GET(self):
+        if self.path == "/health":
+            return self._send_json(200, {"status": "ok", "pool": self.pool.stats(),
+                                         "conversations": len(self.conversations)})
+        if self.path == "/metrics":
+            return self._send_json(200, {"pool": self.pool.stats(), "stages_ms": histograms(),
+                                         "embedding_scheduler": pp_agent.embedding_scheduler_stats(),
+                                         "mcp": mcp_stats(), "startup": pp_agent.STARTUP_TIMINGS})
+        m = _CONV_RE.match(self.path)
+        if not m or m.group(2): return self._error(404, "Route inconnue")
+        conv = self.conversations.get(m.group(1))
+        if conv is None: return self._error(404, "Conversation inconnue")
+        self._send_json(200, {"conversation_id": conv.id,
+                              "messages": [{"question": q, "answer": a} for q, a in conv.history]})
+
+    def do_DELETE(self):
+        m = _CONV_RE.match(self.path)
+        if not m or m.group(2): return self._error(404, "Route inconnue")
+        if not self.conversations.delete(m.group(1)): return self._error(404, "Conversation inconnue")
+        self._send_json(200, {"deleted": m.group(1)})
+
+    def do_POST(self):
+        if self.path.rstrip("/") == "/v1/conversations":
+            return self._send_json(201, {"conversation_id": self.conversations.create().id})
+        m = _CONV_RE.match(self.path)
+        if not m or not m.group(2): return self._error(404, "Route inconnue")
+        try:
+            body = self._read_json()
+        except ValueError as e:
+            return self._error(400, str(e))
+        question = str(body.get("question", "")).strip()
+        if not question: return self._error(400, "Champ 'question' manquant")
+        conv = self.conversations.get(m.group(1))
+        if conv is None: return self._error(404, "Conversation inconnue")
+        if not conv.busy.acquire(blocking=False):  # L'historique dépend de la réponse précédente
+            return self._error(409, "Une question est déjà en cours dans cette conversation")
+        try:
+            request_id = uuid.uuid4().hex[:16]
+            if body.get("stream"): self._stream(conv, question, request_id)
+            else: self._blocking(conv, question, request_id)
+        finally:
+            conv.busy.release()
+
+    def _blocking(self, conv, question, request_id):
+        try:
+            future = self.pool.submit(_answer, conv, question, request_id)
+        except PoolSaturated:
+            return self._saturated()
+        try:
+            answer = future.result()
+        except Exception as e:
+            logger.error(f"Erreur réponse API: {e}")
+            return self._error(500, "Erreur interne", {"X-Request-Id": request_id})
+        self._send_json(200, {"answer": answer, "request_id": request_id, "conversation_id": conv.id},
+                        {"X-Request-Id": request_id})
+
+    def _stream(self, conv, question, request_id):
+        tokens, cancelled = queue.Queue(), threading.Event()
+        try:
+            self.pool.submit(_answer_stream, conv, question, request_id, tokens, cancelled)
+        except PoolSaturated:
+            return self._saturated()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Request-Id", request_id)
+        self.end_headers()
+        try:
+            while True:
+                item = tokens.get()
+                if item is _END: break
+                if isinstance(item, Exception): self._sse("error", {"error": "Erreur interne"})
+                else: self._sse("token", {"text": item})
+            self._sse("done", {"request_id": request_id, "conversation_id": conv.id})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            cancelled.set()  # Client parti : le worker arrête la génération
+            while tokens.get() is not _END: pass  # Attend la fin du worker (historique cohérent)
+            self.close_connection = True
+
+    def _sse(self, event, data):
+        payload = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(payload):X}\r\n".encode() + payload + b"\r\n")
+        self.wfile.flush()
+
+def make_server(host=API_HOST, port=API_PORT, workers=API_WORKERS, queue_size=API_QUEUE_SIZE):
+    handler = type("Handler", (APIHandler,), {"pool": AnswerPool(workers, queue_size),
+                                              "conversations": ConversationRegistry()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur HTTP de l'agent médical (sans interface)")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="Réponses calculées simultanément")
+    parser.add_argument("--queue-size", type=int, default=API_QUEUE_SIZE, help="Réponses en attente max (au-delà : 429)")
+    args = parser.parse_args(argv)
+    pp_agent.warm_up(background=False)  # Modèle, index et agents chargés une fois avant d'accepter des requêtes
+    server = make_server(args.host, args.port, args.workers, args.queue_size)
+    logger.info(f"API prête sur http://{args.host}:{server.server_address[1]} "
+                f"({args.workers} workers, file de {args.queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
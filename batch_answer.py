@@ -0,0 +1,214 @@
+# === batch_answer.py - RÉPONSES EN LOT (FAQ, ÉVALUATION D'UN MODÈLE) ===
+# Répond à une liste de questions JSONL avec pp_agent, plusieurs à la fois, dans un seul processus :
+# modèle d'embeddings, index FAISS, agents et caches chargés une fois et partagés.
+# - chaque question a son propre historique (le chat_history global n'est pas touché)
+# - résultat écrit dès qu'une question est terminée : réponse, durée, durées par étape (spans)
+# - reprise : les identifiants déjà réussis dans le fichier de sortie sont sautés
+#   (les échecs sont retentés, la dernière ligne d'un identifiant fait foi)
+#
+# Usage : python batch_answer.py questions.jsonl reponses.jsonl [--concurrency 4] [--mode sync|async]
+#         [--field question] [--id-field id] [--model mistral-medium-2508] [--no-semantic-cache]
+#         [--retry-failed/--skip-failed] [--limit 0]
+
+# === Importations ===
+import os, sys, json, time, asyncio, logging, argparse, threading  # Config, chrono, async, logs, CLI
+from datetime import datetime                                      # Horodatage des résultats
+from concurrent.futures import ThreadPoolExecutor, as_completed    # Questions simultanées (mode sync)
+
+logger = logging.getLogger(__name__)
+
+# === Entrée / sortie ===
+def load_items(path, fields=("question",), id_field="id"):
+    """[(identifiant, question)] ; question = champs joints ; identifiant absent : numéro de ligne"""
+    items, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip(): continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ligne {n} ignorée (JSON invalide)")
+                continue
+            question = "\n\n".join(str(item[k]) for k in fields if item.get(k)).strip()
+            if not question:
+                logger.warning(f"Ligne {n} ignorée (champ {'/'.join(fields)} absent)")
+                continue
+            item_id = str(item.get(id_field) or f"line-{n}")
+            if item_id in seen:
+                logger.warning(f"Ligne {n} ignorée (identifiant {item_id} en double)")
+                continue
+            seen.add(item_id)
+            items.append((item_id, question))
+    return items
+
+def completed_ids(path, retry_failed=True):
+    """Identifiants déjà traités dans un fichier de sortie existant (dernière ligne de chaque id)"""
+    status = {}
+    if not os.path.exists(path): return set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                status[result["id"]] = result.get("ok", False)
+            except (ValueError, KeyError, TypeError):
+                continue  # Ligne tronquée par un arrêt brutal
+    return {i for i, ok in status.items() if ok or not retry_failed}
+
+class ResultWriter:
+    """Ajout ligne par ligne, vidé à chaque résultat (rien de perdu si le processus s'arrête)"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        truncated = False
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                truncated = f.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if truncated: self._file.write("\n")  # Dernière ligne tronquée : repartir sur une ligne neuve
+        self.written = 0
+
+    def write(self, result):
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.written += 1
+
+    def close(self):
+        self._file.close()
+
+# === Traitement ===
+def _result(item_id, question, answer, error, started, stages, request_id, model):
+    ok = error is None and bool(answer) and not answer.startswith("❌")
+    result = {"id": item_id, "question": question, "answer": answer, "ok": ok,
+              "duration_ms": round((time.perf_counter() - started) * 1000, 2), "stages_ms": stages,
+              "request_id": request_id, "model": model, "finished_at": datetime.now().isoformat(timespec="seconds")}
+    if error is not None: result["error"] = error
+    return result
+
+def answer_one(pp_agent, item_id, question):
+    """Résultat d'une question (mode sync) ; request_id relie la ligne aux spans du journal MCP"""
+    from tracing import request_trace, collect_spans
+    answer, error, started = None, None, time.perf_counter()
+    with collect_spans() as stages, request_trace("batch_answer") as rid:
+        try:
+            answer = pp_agent.answer_question(question, [])  # Historique propre à la question
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return _result(item_id, question, answer, error, started, stages, rid, pp_agent.llm_config["model"])
+
+async def answer_one_async(pp_agent, item_id, question):
+    from tracing import request_trace, collect_spans
+    answer, error, started = None, None, time.perf_counter()
+    with collect_spans() as stages, request_trace("batch_answer") as rid:
+        try:
+            answer = await pp_agent.answer_question_async(question, [])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return _result(item_id, question, answer, error, started, stages, rid, pp_agent.llm_config["model"])
+
+class Progress:
+    def __init__(self, total, every=10):
+        self.total, self.every = total, every
+        self.done = self.failed = 0
+        self.durations = []
+        self.start = time.perf_counter()
+
+    def add(self, result):
+        self.done += 1
+        self.failed += not result["ok"]
+        self.durations.append(result["duration_ms"])
+        if self.done % self.every == 0 or self.done == self.total:
+            rate = self.done / max(time.perf_counter() - self.start, 1e-9)
+            logger.info(f"{self.done}/{self.total} questions ({self.failed} échecs, {rate:.2f} q/s)")
+
+    def summary(self):
+        durations = sorted(self.durations)
+        pct = lambda p: durations[min(len(durations) - 1, int(p / 100 * len(durations)))] if durations else None
+        wall = time.perf_counter() - self.start
+        return {"answered": self.done, "failed": self.failed, "wall_s": round(wall, 2),
+                "throughput_qps": round(self.done / wall, 3) if wall else None,
+                "p50_ms": pct(50), "p95_ms": pct(95), "max_ms": durations[-1] if durations else None}
+
+def run_sync(pp_agent, items, writer, progress, concurrency):
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    futures = [executor.submit(answer_one, pp_agent, item_id, question) for item_id, question in items]
+    written = set()
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            writer.write(result)
+            progress.add(result)
+            written.add(future)
+    except KeyboardInterrupt:
+        logger.warning("Interruption : fin des questions en cours, les autres seront traitées à la reprise")
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures:  # Questions terminées pendant l'arrêt : écrites quand même
+            if future not in written and future.done() and not future.cancelled() and future.exception() is None:
+                writer.write(future.result())
+                progress.add(future.result())
+        raise
+    executor.shutdown()
+
+async def run_async(pp_agent, items, writer, progress, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(item_id, question):
+        async with sem:
+            result = await answer_one_async(pp_agent, item_id, question)
+        writer.write(result)
+        progress.add(result)
+
+    await asyncio.gather(*(one(item_id, question) for item_id, question in items))
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Réponses en lot : questions JSONL -> réponses JSONL (reprise possible)")
+    parser.add_argument("input", help="Questions JSONL (une question par ligne)")
+    parser.add_argument("output", help="Résultats JSONL (complété, jamais écrasé)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions traitées simultanément")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync",
+                        help="answer_question dans un pool de threads, ou answer_question_async")
+    parser.add_argument("--field", action="append", help="Champ(s) formant la question (défaut : question ; "
+                                                           "répété : champs joints, ex. --field title --field body)")
+    parser.add_argument("--id-field", default="id", help="Champ identifiant (défaut : numéro de ligne si absent)")
+    parser.add_argument("--model", help="Modèle LLM à utiliser (évaluation d'un autre modèle ; "
+                                        "désactive le cache sémantique)")
+    parser.add_argument("--no-semantic-cache", action="store_true",
+                        help="Désactive le cache sémantique (réponses réellement régénérées)")
+    parser.add_argument("--skip-failed", dest="retry_failed", action="store_false",
+                        help="À la reprise, ne retente pas les questions en échec")
+    parser.add_argument("--limit", type=int, default=0, help="Nombre max de questions à traiter (0 = toutes)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    items = load_items(args.input, args.field or ["question"], args.id_field)
+    done = completed_ids(args.output, args.retry_failed)
+    todo = [(i, q) for i, q in items if i not in done]
+    skipped = len(items) - len(todo)
+    if args.limit: todo = todo[:args.limit]
+    logger.info(f"{len(items)} questions, {skipped} déjà traitées, {len(todo)} à traiter")
+    if not todo: return 0
+
+    if args.no_semantic_cache or args.model:  # Évaluation d'un modèle : réponses réellement générées par lui
+        os.environ["SEMANTIC_CACHE"] = "0"    # Lu à l'import de pp_agent
+    import pp_agent
+    if args.model: pp_agent.llm_config["model"] = args.model     # Avant la création des clients
+    pp_agent.warm_up(background=False)                           # Modèle, index et client LLM chargés une fois
+
+    writer, progress = ResultWriter(args.output), Progress(len(todo))
+    try:
+        if args.mode == "async": asyncio.run(run_async(pp_agent, todo, writer, progress, args.concurrency))
+        else: run_sync(pp_agent, todo, writer, progress, args.concurrency)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        writer.close()
+        from mcp_client import flush_mcp
+        flush_mcp()
+        print(json.dumps(progress.summary(), ensure_ascii=False))
+    return 1 if progress.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+# === bench/run_bench.py - BENCHMARK HORS LIGNE DU PIPELINE DE RÉPONSE ===
+# Rejoue des questions dans pp_agent (answer_question, answer_question_stream ou answer_question_async)
+# avec le LLM et Serper remplacés par les bouchons locaux de bench/stub_servers.py :
+# ni réseau ni clé API. Les caches et le journal MCP du run sont isolés dans un dossier temporaire.
+# Rapport : débit, latence par question, p50 / p95 / p99 par étape (spans de tracing.py),
+# pic mémoire (RSS), taux de succès des caches, part RAG / WEB.
+# Avec --baseline, le run échoue (code 1) s'il régresse au-delà de la tolérance (--tolerance, sinon celle
+# enregistrée dans la référence). La référence bench/baseline.json décrit la machine qui l'a produite.
+#
+# Usage : python bench/run_bench.py [--questions bench/questions.txt | mcp_logs.jsonl] [--mode sync|stream|async]
+#         [--concurrency 4] [--repeat 2] [--ttft-ms 300] [--token-ms 15] [--serper-ms 400]
+#         [--baseline bench/baseline.json] [--update-baseline] [--tolerance 0.2] [--output resultats.json]
+
+# === Importations ===
+import os, sys, json, time, asyncio, argparse, platform, resource, tempfile  # Config, chrono, async, CLI, machine, mémoire
+from concurrent.futures import ThreadPoolExecutor                   # Questions simultanées (sync / stream)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))  # Modules du projet (pp_agent, tracing...)
+from stub_servers import StubConfig, start_stubs, stop_stubs
+
+DEFAULT_QUESTIONS = os.path.join(BENCH_DIR, "questions.txt")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+PERCENTILES = (50, 95, 99)
+DEFAULT_TOLERANCE = 0.2  # Dégradation relative tolérée si ni --tolerance ni la référence n'en fixent une
+NOISE_FLOOR_MS = 5.0  # Écarts absolus sous ce seuil ignorés (bruit de mesure)
+
+# === Questions ===
+def load_questions(path):
+    """.txt : une question par ligne ; .jsonl : journal MCP (user_question) ou lignes {"question"} / {"title"}"""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            if not path.endswith(".jsonl"):
+                questions.append(line)
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if item.get("event_type") == "user_question": questions.append(item["payload"]["question"])
+            elif "event_type" not in item and (item.get("question") or item.get("title")):
+                questions.append(item.get("question") or item["title"])
+    return questions
+
+# === Statistiques ===
+def percentile(values, p):
+    """Percentile par interpolation linéaire (comme numpy.percentile)"""
+    if not values: return None
+    values = sorted(values)
+    pos = (len(values) - 1) * p / 100
+    lo, hi = int(pos), min(int(pos) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+def summarize(values):
+    return {"count": len(values), **{f"p{p}": round(percentile(values, p), 2) for p in PERCENTILES}} if values else {"count": 0}
+
+def read_mcp_events(path):
+    """Événements du journal MCP du run (spans, caches, contexte utilisé)"""
+    events = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try: events.append(json.loads(line))
+                except ValueError: continue
+    return events
+
+def collect_metrics(events):
+    stages, lookups, sources = {}, {}, {}
+    for e in events:
+        payload, kind = e.get("payload") or {}, e.get("event_type")
+        if kind == "span": stages.setdefault(payload["span"], []).append(payload["duration_ms"])
+        elif kind == "cache_lookup": lookups.setdefault(payload.get("cache"), []).append(bool(payload.get("hit")))
+        elif kind == "context_used": sources[payload.get("used")] = sources.get(payload.get("used"), 0) + 1
+    return ({name: summarize(v) for name, v in sorted(stages.items())},
+            {name: {"lookups": len(h), "hit_rate": round(sum(h) / len(h), 3)} for name, h in lookups.items()},
+            sources)
+
+def machine_info(pp_agent):
+    """Machine et composants du run : une référence n'a de sens que comparée sur une machine équivalente"""
+    return {"platform": platform.platform(), "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(), "python": platform.python_version(),
+            "embedding_backend": os.environ.get("EMBEDDING_BACKEND", "torch"),
+            "vector_db": pp_agent.get_vector_db() is not None,          # False : modèle ou index indisponible (RAG en erreur)
+            "semantic_cache": pp_agent.get_semantic_cache() is not None}
+
+# === Exécution ===
+def _configure_env(args, llm_url, serper_url, workdir):
+    """Variables lues par pp_agent / mcp_client / caches à l'import : à poser avant d'importer pp_agent"""
+    os.environ.update({
+        "USE_CLOUD": "1", "LLM_BASE_URL": llm_url, "MISTRAL_API_KEY": "bench",
+        "SERPER_URL": serper_url, "SERPER_API_KEY": "bench",
+        "MCP_LOG_FILE": os.path.join(workdir, "mcp_logs.jsonl"), "TRACE_MCP": "1",
+        "WEB_CACHE_DB": os.path.join(workdir, "web_cache.sqlite"),
+        "SEMANTIC_CACHE_DIR": os.path.join(workdir, "semantic_cache"),
+    })
+    if args.no_semantic_cache: os.environ["SEMANTIC_CACHE"] = "0"
+
+def run_questions(pp_agent, questions, mode, concurrency):
+    """Durées (ms) de bout en bout de chaque question + nombre d'échecs"""
+    def one(question):
+        start = time.perf_counter()
+        if mode == "stream": answer = "".join(pp_agent.answer_question_stream(question, []))
+        else: answer = pp_agent.answer_question(question, [])
+        return (time.perf_counter() - start) * 1000, answer.startswith("❌")
+
+    async def one_async(question, sem):
+        async with sem:
+            start = time.perf_counter()
+            answer = await pp_agent.answer_question_async(question, [])
+            return (time.perf_counter() - start) * 1000, answer.startswith("❌")
+
+    async def all_async():
+        sem = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(one_async(q, sem) for q in questions))
+
+    if mode == "async": results = asyncio.run(all_async())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool: results = list(pool.map(one, questions))
+    return [ms for ms, _ in results], sum(failed for _, failed in results)
+
+def run_benchmark(args):
+    config = StubConfig(args.ttft_ms, args.token_ms, args.tokens, args.serper_ms)
+    config, llm_url, serper_url, servers = start_stubs(config)
+    workdir = tempfile.mkdtemp(prefix="pp_bench_")
+    _configure_env(args, llm_url, serper_url, workdir)
+    try:
+        import pp_agent, tracing
+        from mcp_client import flush_mcp, MCP_LOG_FILE
+        start = time.perf_counter()
+        pp_agent.warm_up(background=False)
+        warmup_s = time.perf_counter() - start
+        questions = load_questions(args.questions) * args.repeat
+        if args.limit: questions = questions[:args.limit]
+        start = time.perf_counter()
+        latencies, failures = run_questions(pp_agent, questions, args.mode, args.concurrency)
+        wall = time.perf_counter() - start
+        flush_mcp()
+        stages, caches, sources = collect_metrics(read_mcp_events(MCP_LOG_FILE))
+        machine = machine_info(pp_agent)
+    finally:
+        stop_stubs(servers)
+    return {
+        "config": {"mode": args.mode, "concurrency": args.concurrency, "questions": len(questions),
+                   "ttft_ms": args.ttft_ms, "token_ms": args.token_ms, "tokens": args.tokens,
+                   "serper_ms": args.serper_ms, "semantic_cache": not args.no_semantic_cache},
+        "throughput_qps": round(len(questions) / wall, 3) if wall else None,
+        "wall_s": round(wall, 3),
+        "failures": failures,
+        "latency_ms": summarize(latencies),
+        "stages_ms": stages,
+        "cache_hit_rate": caches,
+        "context_sources": sources,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # ko sous Linux
+        "warmup_s": round(warmup_s, 3),
+        "startup_timings": dict(pp_agent.STARTUP_TIMINGS),
+        "stub_calls": {"llm": config.llm_calls, "serper": config.serper_calls},
+        "machine": machine,
+    }
+
+# === Comparaison à la référence ===
+def compare(result, baseline, tolerance):
+    """Liste des régressions (texte) ; vide si le run est dans la tolérance"""
+    regressions = []
+
+    def worse_if_higher(name, new, old, floor=NOISE_FLOOR_MS):
+        if new is None or old is None: return
+        if new > old * (1 + tolerance) and new - old > floor:
+            regressions.append(f"{name}: {old} -> {new} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+
+    if result["config"] != baseline.get("config"):
+        print("⚠️ Configuration différente de la référence : comparaison indicative")
+    if result.get("machine") != baseline.get("machine"):
+        print(f"⚠️ Machine différente de la référence ({baseline.get('machine')}) : comparaison indicative, "
+              "régénérer la référence avec --update-baseline sur la machine de mesure")
+    old_qps, new_qps = baseline.get("throughput_qps"), result["throughput_qps"]
+    if old_qps and new_qps is not None and new_qps < old_qps * (1 - tolerance):
+        regressions.append(f"throughput_qps: {old_qps} -> {new_qps} ({(new_qps / old_qps - 1) * 100:.0f}%)")
+    for p in PERCENTILES:
+        worse_if_higher(f"latency_ms.p{p}", result["latency_ms"].get(f"p{p}"), baseline.get("latency_ms", {}).get(f"p{p}"))
+    for stage, stats in result["stages_ms"].items():
+        worse_if_higher(f"stages_ms.{stage}.p95", stats.get("p95"), baseline.get("stages_ms", {}).get(stage, {}).get("p95"))
+    worse_if_higher("peak_rss_mb", result["peak_rss_mb"], baseline.get("peak_rss_mb"), floor=20)
+    for cache, stats in baseline.get("cache_hit_rate", {}).items():
+        new = result["cache_hit_rate"].get(cache, {}).get("hit_rate", 0)
+        if new < stats["hit_rate"] - tolerance:
+            regressions.append(f"cache_hit_rate.{cache}: {stats['hit_rate']} -> {new}")
+    if result["failures"] > baseline.get("failures", 0):
+        regressions.append(f"failures: {baseline.get('failures', 0)} -> {result['failures']}")
+    return regressions
+
+def print_result(result):
+    cfg = result["config"]
+    print(f"\n{cfg['questions']} questions, mode {cfg['mode']}, concurrence {cfg['concurrency']} : "
+          f"{result['throughput_qps']} q/s en {result['wall_s']} s ({result['failures']} échec(s))")
+    lat = result["latency_ms"]
+    print(f"Latence par question (ms) : " + "  ".join(f"p{p}={lat.get(f'p{p}')}" for p in PERCENTILES))
+    print(f"Pic mémoire : {result['peak_rss_mb']} Mo   Préchargement : {result['warmup_s']} s")
+    print("\nÉtapes (ms)" + " " * 14 + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES) + f"{'n':>7}")
+    for name, stats in result["stages_ms"].items():
+        print(f"  {name:<23}" + "".join(f"{stats.get(f'p{p}', 0):>10.1f}" for p in PERCENTILES) + f"{stats['count']:>7}")
+    for cache, stats in result["cache_hit_rate"].items():
+        print(f"Cache {cache} : {stats['hit_rate']:.0%} de succès sur {stats['lookups']} recherches")
+    print(f"Contexte utilisé : {result['context_sources']}")
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne de pp_agent (LLM et Serper bouchonnés)")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help=".txt (une par ligne) ou .jsonl (journal MCP...)")
+    parser.add_argument("--mode", choices=["sync", "stream", "async"], default="sync",
+                        help="answer_question, answer_question_stream ou answer_question_async")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions traitées simultanément")
+    parser.add_argument("--repeat", type=int, default=2, help="Passages sur le corpus (le 2e exerce les caches)")
+    parser.add_argument("--limit", type=int, default=0, help="Nombre max de questions (0 = toutes)")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="Bouchon LLM : délai avant le premier jeton")
+    parser.add_argument("--token-ms", type=float, default=15, help="Bouchon LLM : délai entre deux jetons")
+    parser.add_argument("--tokens", type=int, default=120, help="Bouchon LLM : longueur des réponses")
+    parser.add_argument("--serper-ms", type=float, default=400, help="Bouchon Serper : délai d'une recherche")
+    parser.add_argument("--no-semantic-cache", action="store_true", help="Désactive le cache sémantique")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Référence JSON à comparer")
+    parser.add_argument("--update-baseline", action="store_true", help="Enregistre ce run comme référence")
+    parser.add_argument("--tolerance", type=float, help="Dégradation relative tolérée (0.2 = 20%%) ; "
+                                                          "défaut : celle de la référence, sinon 0.2")
+    parser.add_argument("--output", help="Écrit le résultat JSON dans ce fichier")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args)
+    print_result(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        result["tolerance"] = args.tolerance if args.tolerance is not None else DEFAULT_TOLERANCE
+        with open(args.baseline, "w", encoding="utf-8") as f: json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nRéférence enregistrée : {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"\nPas de référence ({args.baseline}) : lancer avec --update-baseline pour en créer une")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+    tolerance = args.tolerance if args.tolerance is not None else baseline.get("tolerance", DEFAULT_TOLERANCE)
+    print(f"\nTolérance : {tolerance:.0%}")
+    regressions = compare(result, baseline, tolerance)
+    if regressions:
+        print("\n❌ Régressions par rapport à la référence :")
+        for r in regressions: print(f"  - {r}")
+        return 1
+    print("\n✓ Aucune régression par rapport à la référence")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# === bench/stub_servers.py - BOUCHONS LOCAUX DU LLM ET DE SERPER ===
+# Serveurs HTTP locaux (bibliothèque standard) remplaçant, pour les benchmarks :
+# - l'endpoint compatible OpenAI de Mistral / Ollama (POST /v1/chat/completions, avec ou sans stream)
+# - google.serper.dev (POST /search)
+# Les latences sont configurables : délai avant le premier jeton, délai par jeton, délai Serper.
+#
+# Usage autonome : python bench/stub_servers.py [--llm-port 8901] [--serper-port 8902]
+#                  [--ttft-ms 300] [--token-ms 15] [--tokens 120] [--serper-ms 400]
+
+# === Importations ===
+import json, time, uuid, argparse, threading                     # Réponses JSON, délais, ids, CLI, threads
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # Serveur HTTP multi-threads
+
+ANSWER_WORDS = ("Le syndrome de Gougerot-Sjögren est une maladie auto-immune qui touche les glandes "
+                "lacrymales et salivaires . Source : document interne .").split()
+CLOSING = "Souhaitez-vous des informations complémentaires sur ce sujet ?"
+
+class StubConfig:
+    """Latences des bouchons (ms), modifiables pendant l'exécution"""
+
+    def __init__(self, ttft_ms=300, token_ms=15, tokens=120, serper_ms=400, serper_empty=False):
+        self.ttft_ms = ttft_ms          # Délai avant le premier jeton (traitement du prompt)
+        self.token_ms = token_ms        # Délai entre deux jetons
+        self.tokens = tokens            # Longueur de la réponse (jetons)
+        self.serper_ms = serper_ms      # Délai d'une recherche web
+        self.serper_empty = serper_empty  # Aucun résultat web
+        self.llm_calls = 0
+        self.serper_calls = 0
+
+def _answer_tokens(n):
+    words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(max(n - len(CLOSING.split()), 1))]
+    return [w + " " for w in words] + [CLOSING]
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, comme les vrais endpoints
+    config = None                  # StubConfig partagée (affectée par make_server)
+
+    def log_message(self, *args):  # Pas de log par requête
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class LLMHandler(_Handler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "not found"}})
+        request = self._read_json()
+        cfg = self.config
+        cfg.llm_calls += 1
+        model = request.get("model", "stub")
+        cid, created = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time())
+        tokens = _answer_tokens(cfg.tokens)
+        time.sleep(cfg.ttft_ms / 1000)
+        if not request.get("stream"):
+            time.sleep(cfg.token_ms * (len(tokens) - 1) / 1000)
+            return self._send_json(200, {
+                "id": cid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}})
+        # Server-Sent Events, encodage chunked pour garder la connexion ouverte
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(data):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):X}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+
+        for i, tok in enumerate(tokens):
+            if i: time.sleep(cfg.token_ms / 1000)
+            event(json.dumps({"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                              "choices": [{"index": 0, "delta": {"content": tok}, "finish_reason": None}]},
+                             ensure_ascii=False))
+        event(json.dumps({"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                          "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+class SerperHandler(_Handler):
+    def do_POST(self):
+        query = self._read_json().get("q", "")
+        cfg = self.config
+        cfg.serper_calls += 1
+        time.sleep(cfg.serper_ms / 1000)
+        organic = [] if cfg.serper_empty else [{
+            "title": f"Résultat pour : {query}", "link": "https://example.org/sjogren",
+            "snippet": "Le syndrome de Sjögren est une maladie auto-immune systémique (page de test)."}]
+        self._send_json(200, {"searchParameters": {"q": query}, "organic": organic})
+
+def make_server(handler, config, port=0, host="127.0.0.1"):
+    """Serveur lancé dans un thread démon ; port=0 : port libre choisi par le système"""
+    cls = type(handler.__name__, (handler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), cls)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"stub-{handler.__name__}", daemon=True).start()
+    return server
+
+def start_stubs(config=None, llm_port=0, serper_port=0):
+    """(config, url de base LLM, url Serper, [serveurs]) ; arrêter avec stop_stubs(serveurs)"""
+    config = config or StubConfig()
+    llm = make_server(LLMHandler, config, llm_port)
+    serper = make_server(SerperHandler, config, serper_port)
+    return (config, f"http://127.0.0.1:{llm.server_address[1]}/v1",
+            f"http://127.0.0.1:{serper.server_address[1]}/search", [llm, serper])
+
+def stop_stubs(servers):
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bouchons locaux du LLM (API OpenAI) et de Serper")
+    parser.add_argument("--llm-port", type=int, default=8901)
+    parser.add_argument("--serper-port", type=int, default=8902)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="Délai avant le premier jeton")
+    parser.add_argument("--token-ms", type=float, default=15, help="Délai entre deux jetons")
+    parser.add_argument("--tokens", type=int, default=120, help="Longueur des réponses (jetons)")
+    parser.add_argument("--serper-ms", type=float, default=400, help="Délai d'une recherche web")
+    args = parser.parse_args(argv)
+    config = StubConfig(args.ttft_ms, args.token_ms, args.tokens, args.serper_ms)
+    _, llm_url, serper_url, servers = start_stubs(config, args.llm_port, args.serper_port)
+    print(f"LLM_BASE_URL={llm_url}\nSERPER_URL={serper_url}\n(Ctrl+C pour arrêter)")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_stubs(servers)
+
+if __name__ == "__main__":
+    main()
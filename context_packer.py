@@ -0,0 +1,61 @@
+# === context_packer.py - COMPACTAGE DU CONTEXTE SOUS BUDGET DE TOKENS ===
+# Réduit le contexte RAG passé au LLM avant construction du prompt :
+# - découpe les morceaux récupérés en phrases
+# - supprime les doublons (recouvrement entre morceaux voisins, mêmes passages dans plusieurs sources)
+# - garde en priorité les phrases contenant les termes de la question
+# - s'arrête au budget de tokens configuré pour le modèle
+# Les phrases retenues sont restituées dans leur ordre d'origine, groupées par source.
+
+# === Importations ===
+import os, re, math              # Configuration, découpage en phrases, arrondi
+from text_utils import fold, query_terms  # Normalisation des termes
+
+# === Configuration ===
+CHARS_PER_TOKEN = float(os.environ.get("CHARS_PER_TOKEN", "3.5"))  # Estimation (tokenizer Mistral, texte français)
+MODEL_CONTEXT_BUDGETS = {            # Budget de tokens du contexte récupéré, par modèle
+    "mistral-medium-2508": 1200,
+    "mistral": 800,                  # Ollama local : fenêtre et débit plus réduits
+}
+DEFAULT_CONTEXT_BUDGET = 1000
+_SENTENCE_END = re.compile(r"(?<=[.!?…;])\s+|\n+")
+
+def count_tokens(text):
+    """Estimation du nombre de tokens d'un texte"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def context_budget(model):
+    """Budget de tokens du contexte : CONTEXT_TOKEN_BUDGET sinon valeur du modèle"""
+    if os.environ.get("CONTEXT_TOKEN_BUDGET"): return int(os.environ["CONTEXT_TOKEN_BUDGET"])
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+def _key(sentence):
+    return " ".join(re.findall(r"\w+", fold(sentence)))
+
+def pack_documents(docs, query, budget):
+    """docs : [(source, texte)] par pertinence décroissante.
+    Retourne [(source, texte compacté)] tenant dans budget tokens (sources vides omises)."""
+    terms = set(query_terms(query))
+    sentences, kept_keys = [], []  # (rang doc, position, phrase, score)
+    for rank, (_, text) in enumerate(docs):
+        for pos, sentence in enumerate(split_sentences(text)):
+            key = _key(sentence)
+            if not key or any(key in k for k in kept_keys): continue  # Doublon ou fragment de recouvrement
+            kept_keys = [k for k in kept_keys if k not in key] + [key]  # Une phrase plus complète remplace son fragment
+            words = set(key.split())
+            sentences.append({"rank": rank, "pos": pos, "text": sentence, "key": key,
+                              "score": len(terms & words)})
+    sentences = [s for s in sentences if s["key"] in set(kept_keys)]
+    # Priorité : phrases pertinentes d'abord, puis ordre des documents
+    selected, used = [], 0
+    for s in sorted(sentences, key=lambda s: (-s["score"], s["rank"], s["pos"])):
+        cost = count_tokens(s["text"]) + 1
+        if used + cost > budget: continue
+        selected.append(s); used += cost
+    packed = []
+    for rank, (source, _) in enumerate(docs):
+        chosen = sorted((s for s in selected if s["rank"] == rank), key=lambda s: s["pos"])
+        if chosen: packed.append((source, " ".join(s["text"] for s in chosen)))
+    return packed
@@ -0,0 +1,171 @@
+# === conversation_memory.py - MÉMOIRE DE CONVERSATION (RÉSUMÉ GLISSANT) ===
+# Le prompt ne reprenait que les 2 derniers échanges, réponses coupées à 300 caractères :
+# tout ce qui précédait était perdu, le reste tronqué en milieu de phrase.
+# Ici, chaque conversation garde :
+# - un résumé des échanges anciens, mis à jour en arrière-plan après chaque tour
+#   (le LLM fusionne le résumé courant et les échanges sortis de la fenêtre récente)
+# - les derniers échanges tels quels
+# Le texte de mémoire injecté dans le prompt tient dans MEMORY_TOKEN_BUDGET tokens
+# (phrases entières), quelle que soit la longueur de la conversation.
+# L'état est conservé dans la base des conversations (conversation_store.py).
+
+# === Importations ===
+import os, time, logging, threading                   # Config, durée, logs, verrous
+from concurrent.futures import ThreadPoolExecutor     # Résumés calculés hors de la requête
+from context_packer import count_tokens, split_sentences, CHARS_PER_TOKEN  # Budget de tokens, coupe en fin de phrase
+from tracing import span                              # Durée des résumés (span memory_summarize)
+
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", "450"))      # Mémoire totale dans le prompt
+MEMORY_SUMMARY_TOKENS = int(os.environ.get("MEMORY_SUMMARY_TOKENS", "250"))  # Taille max du résumé
+MEMORY_RECENT_TURNS = int(os.environ.get("MEMORY_RECENT_TURNS", "2"))        # Échanges gardés tels quels
+MEMORY_MAX_PENDING = 20                     # Échanges non résumés conservés si le LLM reste indisponible
+MEMORY_CACHE_MAX = 1000                     # États gardés en mémoire du processus (relus en base au-delà)
+
+def truncate_sentences(text, budget):
+    """Début du texte en phrases entières tenant dans budget tokens (première phrase coupée si seule)"""
+    if count_tokens(text) <= budget: return text
+    kept, used = [], count_tokens(" […]")
+    for sentence in split_sentences(text):
+        cost = count_tokens(sentence) + 1
+        if used + cost > budget: break
+        kept.append(sentence); used += cost
+    if kept: return " ".join(kept) + " […]"
+    return text[:max(0, int((budget - 1) * CHARS_PER_TOKEN))] + "…"
+
+def format_memory(summary, turns, budget=MEMORY_TOKEN_BUDGET):
+    """Texte de mémoire du prompt : résumé puis échanges non encore résumés (les plus récents servis d'abord)"""
+    summary = truncate_sentences(summary, min(MEMORY_SUMMARY_TOKENS, budget)) if summary else ""
+    remaining = budget - count_tokens(f"Résumé de la conversation:\n{summary}\n\nHistorique récent:\n")
+    lines = []
+    for i, (q, r) in enumerate(reversed(turns)):
+        share = remaining // min(len(turns) - i, 2) - 5  # Le plus récent d'abord : au plus la moitié du reste (hors "- Q:/- R:")
+        if share < 10: break
+        q_text = truncate_sentences(q, share // 3)
+        r_text = truncate_sentences(r, share - count_tokens(q_text))
+        lines.insert(0, f"- Q: {q_text}\n- R: {r_text}")
+        remaining -= count_tokens(lines[0]) + 1
+    parts = []
+    if summary: parts.append(f"Résumé de la conversation:\n{summary}")
+    if lines: parts.append("Historique récent:\n" + "\n".join(lines))
+    return "\n\n".join(parts)
+
+def memory_from_history(history, budget=MEMORY_TOKEN_BUDGET):
+    """Mémoire sans résumé pour un historique [(question, réponse)] sans identifiant de conversation"""
+    return format_memory("", history[-MEMORY_RECENT_TURNS:], budget)
+
+class ConversationMemory:
+    """Résumé glissant par conversation.
+    summarize(résumé, [(question, réponse)], max_tokens) -> nouveau résumé (appel LLM, fourni par pp_agent).
+    store : ConversationStore (persistance) ou None (mémoire du processus uniquement)."""
+
+    def __init__(self, summarize, store=None, recent_turns=MEMORY_RECENT_TURNS, budget=MEMORY_TOKEN_BUDGET):
+        self.summarize = summarize
+        self.store = store
+        self.recent_turns = recent_turns
+        self.budget = budget
+        self._states = {}                  # id -> {"summary", "turns", "pending"}
+        self._running = set()              # Conversations dont le résumé est en cours
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+
+    def _state(self, conversation_id):
+        """État en cache, sinon relu en base (ou amorcé depuis les messages déjà enregistrés)"""
+        state = self._states.get(conversation_id)
+        if state is None:
+            summary, turns, pending = "", 0, []
+            if self.store is not None:
+                saved = self.store.get_memory(conversation_id)
+                if saved is not None:
+                    summary, turns, pending = saved
+                elif self.store.get(conversation_id) is not None:  # Conversation antérieure à la mémoire
+                    pending = self._pairs(self.store.load_messages(conversation_id, 2 * MEMORY_MAX_PENDING))
+            if self.store is not None and len(self._states) >= MEMORY_CACHE_MAX:  # Le plus ancien reste en base
+                oldest = next((cid for cid in self._states if cid not in self._running), None)
+                if oldest is not None: del self._states[oldest]
+            state = self._states[conversation_id] = {"summary": summary, "turns": turns,
+                                                     "pending": [tuple(t) for t in pending]}
+        return state
+
+    @staticmethod
+    def _pairs(messages):
+        """[(role, contenu)] -> [(question, réponse)] (question sans réponse ignorée)"""
+        pairs, question = [], None
+        for role, content in messages:
+            if role == "user": question = content
+            elif question is not None: pairs.append((question, content)); question = None
+        return pairs
+
+    def memory_text(self, conversation_id):
+        with self._lock:
+            state = self._state(conversation_id)
+            summary, pending = state["summary"], list(state["pending"])
+        return format_memory(summary, pending, self.budget)
+
+    def add_turn(self, conversation_id, question, answer):
+        """Enregistre un échange ; les échanges sortis de la fenêtre récente sont résumés en arrière-plan"""
+        with self._lock:
+            state = self._state(conversation_id)
+            pending = state["pending"] + [(question, answer)]
+            state["dropped"] = state.get("dropped", 0) + max(0, len(pending) - MEMORY_MAX_PENDING)  # Suivi pour _fold
+            state["pending"] = pending[-MEMORY_MAX_PENDING:]
+            self._save(conversation_id, state)
+            if len(state["pending"]) <= self.recent_turns or conversation_id in self._running: return
+            self._running.add(conversation_id)
+        self._executor.submit(self._fold, conversation_id)
+
+    def _fold(self, conversation_id):
+        """Intègre au résumé les échanges plus anciens que les recent_turns derniers"""
+        new_summary_ok = False  # En cas d'échec, nouvel essai seulement au tour suivant
+        try:
+            with self._lock:
+                state = self._state(conversation_id)
+                summary, older = state["summary"], state["pending"][:-self.recent_turns or None]
+                dropped = state.get("dropped", 0)
+            if not older: return
+            with span("memory_summarize", turns=len(older)):
+                new_summary = self.summarize(summary, older, MEMORY_SUMMARY_TOKENS)
+            if not new_summary or not new_summary.strip(): return
+            with self._lock:
+                state = self._states.get(conversation_id)
+                if state is None: return  # Conversation oubliée pendant le résumé
+                state["summary"] = truncate_sentences(new_summary.strip(), MEMORY_SUMMARY_TOKENS)
+                state["turns"] += len(older)
+                # Retirés par position (deux échanges identiques restent distincts) ; ceux déjà sortis
+                # par la limite MEMORY_MAX_PENDING pendant le résumé ne sont pas retirés deux fois
+                state["pending"] = state["pending"][max(0, len(older) - (state.get("dropped", 0) - dropped)):]
+                self._save(conversation_id, state)
+            new_summary_ok = True
+        except Exception as e:
+            logger.error(f"Erreur résumé de conversation: {e}")  # Échanges conservés, nouvel essai au tour suivant
+        finally:
+            with self._lock:
+                self._running.discard(conversation_id)
+                state = self._states.get(conversation_id)
+                again = state is not None and len(state["pending"]) > self.recent_turns and new_summary_ok
+                if again: self._running.add(conversation_id)
+            if again: self._executor.submit(self._fold, conversation_id)  # Échanges arrivés pendant le résumé
+
+    def _save(self, conversation_id, state):
+        if self.store is None: return
+        try:
+            self.store.set_memory(conversation_id, state["summary"], state["turns"], state["pending"])
+        except Exception as e:
+            logger.error(f"Erreur sauvegarde mémoire: {e}")
+
+    def forget(self, conversation_id):
+        """Conversation supprimée ou expirée"""
+        with self._lock:
+            self._states.pop(conversation_id, None)
+        if self.store is not None: self.store.delete_memory(conversation_id)
+
+    def wait(self, timeout=None):
+        """Attend la fin des résumés en cours (tests, arrêt propre)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._running: return True
+            if deadline is not None and time.monotonic() > deadline: return False
+            time.sleep(0.01)
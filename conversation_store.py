@@ -0,0 +1,193 @@
+# === conversation_store.py - CONVERSATIONS EN BASE SQLITE ===
+# Remplace les fichiers conversations/*.json (relus en entier à chaque rerun Streamlit,
+# réécrits en entier deux fois par question) par une base SQLite :
+# - messages ajoutés un par un (pas de réécriture de la conversation)
+# - liste titre / horodatage indexée et paginée, sans lire les messages
+# - messages chargés seulement à l'ouverture d'une conversation (éventuellement les N derniers)
+# - migration unique des anciens fichiers JSON au premier accès
+# - mémoire de conversation (résumé glissant, conversation_memory.py) conservée avec la conversation
+#
+# Usage : python conversation_store.py migrate [--dir conversations] | stats
+
+# === Importations ===
+import os, json, time, sqlite3, logging, argparse, threading  # Fichiers, JSON, horodatage, base SQLite, CLI
+from datetime import datetime                                  # Horodatage lisible des conversations
+from uuid import uuid4                                         # Identifiants de conversation
+
+logger = logging.getLogger(__name__)
+
+# === Configuration par défaut ===
+CONVERSATION_DB = os.environ.get("CONVERSATION_DB", "conversations.sqlite")  # Fichier SQLite
+CONV_DIR = "conversations"                                                   # Anciens fichiers JSON à migrer
+
+class ConversationStore:
+    """Conversations (titre, horodatage) et leurs messages, partagées entre processus"""
+
+    def __init__(self, path=CONVERSATION_DB):
+        self.path = path
+        self._local = threading.local()  # sqlite3 : une connexion par thread (Streamlit exécute un thread par session)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)  # autocommit
+            conn.execute("PRAGMA journal_mode=WAL")    # Lecteurs et écrivain concurrents (multi-processus)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id TEXT PRIMARY KEY, title TEXT NOT NULL, timestamp TEXT NOT NULL,
+                    updated_at REAL NOT NULL, message_count INTEGER NOT NULL DEFAULT 0);
+                CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at DESC);
+                CREATE TABLE IF NOT EXISTS messages (
+                    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+                    seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL,
+                    PRIMARY KEY (conversation_id, seq)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS memory (
+                    conversation_id TEXT PRIMARY KEY, summary TEXT NOT NULL, turns INTEGER NOT NULL,
+                    pending TEXT NOT NULL, updated_at REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);""")
+            self._local.conn = conn
+        return conn
+
+    # --- Liste (barre latérale) ---
+    def list_conversations(self, limit=50, offset=0):
+        """[{id, title, timestamp, messages}] des plus récemment actives aux plus anciennes"""
+        rows = self._conn().execute("""SELECT id, title, timestamp, message_count FROM conversations
+                                       ORDER BY updated_at DESC LIMIT ? OFFSET ?""", (limit, offset))
+        return [{"id": i, "title": t, "timestamp": ts, "messages": n} for i, t, ts, n in rows]
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def get(self, conversation_id):
+        """{id, title, timestamp, messages} ou None"""
+        row = self._conn().execute("SELECT id, title, timestamp, message_count FROM conversations WHERE id=?",
+                                   (conversation_id,)).fetchone()
+        return None if row is None else dict(zip(("id", "title", "timestamp", "messages"), row))
+
+    # --- Écriture ---
+    def create(self, title=None, conversation_id=None):
+        """Crée une conversation vide et renvoie son identifiant"""
+        now = datetime.now()
+        conversation_id = conversation_id or f"conv_{now.strftime('%Y%m%d_%H%M%S')}_{uuid4().hex[:6]}"
+        self._conn().execute("INSERT INTO conversations(id, title, timestamp, updated_at) VALUES (?,?,?,?)",
+                             (conversation_id, title or f"Discussion du {now.strftime('%Y-%m-%d')}",
+                              now.strftime("%Y%m%d_%H%M%S"), time.time()))
+        return conversation_id
+
+    def append_message(self, conversation_id, role, content):
+        """Ajoute un message en fin de conversation (role : user / assistant)"""
+        conn, now = self._conn(), time.time()
+        with conn:  # Numéro de message et compteur mis à jour atomiquement
+            conn.execute("BEGIN IMMEDIATE")
+            seq = conn.execute("UPDATE conversations SET message_count=message_count+1, updated_at=? "
+                               "WHERE id=? RETURNING message_count", (now, conversation_id)).fetchone()
+            if seq is None: raise KeyError(conversation_id)
+            conn.execute("INSERT INTO messages(conversation_id, seq, role, content, created_at) VALUES (?,?,?,?,?)",
+                         (conversation_id, seq[0], role, content, now))
+
+    def rename(self, conversation_id, title):
+        self._conn().execute("UPDATE conversations SET title=? WHERE id=?", (title, conversation_id))
+
+    def delete(self, conversation_id):
+        conn = self._conn()
+        conn.execute("DELETE FROM conversations WHERE id=?", (conversation_id,))  # Messages en cascade
+        conn.execute("DELETE FROM memory WHERE conversation_id=?", (conversation_id,))
+
+    # --- Lecture des messages ---
+    def load_messages(self, conversation_id, limit=None):
+        """[(role, contenu)] dans l'ordre ; avec limit, seulement les derniers messages"""
+        if limit is None:
+            rows = self._conn().execute("SELECT role, content FROM messages WHERE conversation_id=? ORDER BY seq",
+                                        (conversation_id,)).fetchall()
+        else:
+            rows = self._conn().execute("""SELECT role, content FROM messages WHERE conversation_id=?
+                                           ORDER BY seq DESC LIMIT ?""", (conversation_id, limit)).fetchall()[::-1]
+        return [(role, content) for role, content in rows]
+
+    # --- Mémoire de conversation ---
+    def get_memory(self, conversation_id):
+        """(résumé, nombre d'échanges résumés, [(question, réponse)] pas encore résumés) ou None"""
+        row = self._conn().execute("SELECT summary, turns, pending FROM memory WHERE conversation_id=?",
+                                   (conversation_id,)).fetchone()
+        return None if row is None else (row[0], row[1], [tuple(t) for t in json.loads(row[2])])
+
+    def set_memory(self, conversation_id, summary, turns, pending):
+        """Identifiant libre (conversations de l'interface ou du serveur API)"""
+        self._conn().execute("INSERT OR REPLACE INTO memory(conversation_id, summary, turns, pending, updated_at) "
+                             "VALUES (?,?,?,?,?)", (conversation_id, summary, turns,
+                                                    json.dumps(pending, ensure_ascii=False), time.time()))
+
+    def delete_memory(self, conversation_id):
+        self._conn().execute("DELETE FROM memory WHERE conversation_id=?", (conversation_id,))
+
+    # --- Migration des fichiers JSON ---
+    def migrate_json(self, conv_dir=CONV_DIR, force=False):
+        """Importe une seule fois les conversations/*.json (identifiant = nom de fichier sans .json).
+        Les fichiers sont laissés en place ; renvoie le nombre de conversations importées."""
+        conn = self._conn()
+        if not force and conn.execute("SELECT 1 FROM meta WHERE key='json_migrated'").fetchone(): return 0
+        if not os.path.isdir(conv_dir): files = []
+        else: files = sorted(f for f in os.listdir(conv_dir) if f.endswith(".json"))
+        imported = 0
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for f in files:
+                try:
+                    with open(os.path.join(conv_dir, f), "r", encoding="utf-8") as cf:
+                        data = json.load(cf)
+                    messages = data.get("messages", [])
+                    timestamp = data.get("timestamp") or datetime.now().strftime("%Y%m%d_%H%M%S")
+                    try: updated = datetime.strptime(timestamp, "%Y%m%d_%H%M%S").timestamp()
+                    except ValueError: updated = os.path.getmtime(os.path.join(conv_dir, f))
+                except (OSError, ValueError, AttributeError) as e:
+                    logger.warning(f"Conversation ignorée ({f}): {e}")
+                    continue
+                cur = conn.execute("""INSERT OR IGNORE INTO conversations(id, title, timestamp, updated_at, message_count)
+                                      VALUES (?,?,?,?,?)""",
+                                   (f[:-5], data.get("title", f), timestamp, updated, len(messages)))
+                if not cur.rowcount: continue  # Déjà importée
+                conn.executemany("INSERT INTO messages(conversation_id, seq, role, content, created_at) VALUES (?,?,?,?,?)",
+                                 [(f[:-5], seq, m.get("role", "assistant"), m.get("content", ""), updated)
+                                  for seq, m in enumerate(messages, 1)])
+                imported += 1
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('json_migrated', ?)", (str(time.time()),))
+        if imported: logger.info(f"{imported} conversations JSON importées dans {self.path}")
+        return imported
+
+# === Instance partagée ===
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Store partagé, anciens fichiers JSON migrés au premier appel"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = ConversationStore()
+                store.migrate_json()
+                _store = store
+    return _store
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Base SQLite des conversations")
+    parser.add_argument("--db", default=CONVERSATION_DB, help="Fichier SQLite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_migrate = sub.add_parser("migrate", help="Importe les conversations JSON")
+    p_migrate.add_argument("--dir", default=CONV_DIR, help="Répertoire des fichiers JSON")
+    p_migrate.add_argument("--force", action="store_true", help="Relance l'import même déjà effectué")
+    sub.add_parser("stats", help="Nombre de conversations et de messages")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    store = ConversationStore(args.db)
+    if args.command == "migrate":
+        print(f"{store.migrate_json(args.dir, force=args.force)} conversations importées")
+    else:
+        messages = store._conn().execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        print(f"{store.count()} conversations, {messages} messages")
+
+if __name__ == "__main__":
+    main()
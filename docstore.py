@@ -0,0 +1,136 @@
+# === docstore.py - STOCKAGE SQLITE DES MORCEAUX DE DOCUMENTS ===
+# Remplace le docstore LangChain picklé (vectorstore/index.pkl) :
+# - texte et métadonnées des morceaux rangés dans vectorstore/docstore.sqlite,
+#   indexés par l'identifiant FAISS (int64) du vecteur correspondant
+# - seuls les k résultats retournés par la recherche sont lus sur disque
+# - plus de désérialisation pickle au démarrage (ni de dépendance à la taille du corpus)
+# - index lexical inversé (SQLite FTS5, classement BM25) tenu à jour par triggers à l'ingestion
+
+# === Importations ===
+import os, json, sqlite3, threading                      # Fichiers, métadonnées, base SQLite, connexions par thread
+from pathlib import Path                                  # URI file:// du fichier SQLite (lecture seule)
+from collections.abc import Mapping                       # Table identifiant FAISS -> identifiant docstore
+from langchain_core.documents import Document             # Document renvoyé à retrieve_docs
+from langchain_community.docstore.base import Docstore    # Interface attendue par le vectorstore FAISS
+from text_utils import query_terms                        # Termes significatifs d'une requête
+
+DOCSTORE_FILE = "docstore.sqlite"  # Dans le dossier du vectorstore
+
+class SQLiteDocstore(Docstore):
+    """Docstore adossé à SQLite. En lecture seule (agent) chaque thread a sa connexion ;
+    en écriture (ingestion) les modifications sont validées par commit()."""
+
+    def __init__(self, path, readonly=True):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        if not readonly:
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")  # Lectures de l'agent pendant l'ingestion
+            conn.execute("""CREATE TABLE IF NOT EXISTS chunks (
+                                vector_id INTEGER PRIMARY KEY,   -- identifiant FAISS
+                                chunk_id TEXT NOT NULL UNIQUE,   -- '<fichier>#<n>'
+                                file TEXT NOT NULL,              -- fichier source (relatif à docs/)
+                                content TEXT NOT NULL,
+                                metadata TEXT NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file)")
+            self._create_lexical_index(conn)
+            conn.commit()
+
+    def _create_lexical_index(self, conn):
+        """Index FTS5 (contenu externe = table chunks), accents ignorés : 'xerostomie' trouve 'xérostomie'"""
+        conn.execute("PRAGMA recursive_triggers=ON")  # INSERT OR REPLACE déclenche aussi le trigger de suppression
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name='chunks_fts'").fetchone()
+        conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                            content, content='chunks', content_rowid='vector_id',
+                            tokenize='unicode61 remove_diacritics 2')""")
+        conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts(rowid, content) VALUES (new.vector_id, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.vector_id, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_au AFTER UPDATE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.vector_id, old.content);
+                INSERT INTO chunks_fts(rowid, content) VALUES (new.vector_id, new.content);
+            END;""")
+        if not exists:  # Docstore créé avant l'index lexical : on l'alimente une fois
+            conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(Path(self.path).absolute().as_uri() + "?mode=ro", uri=True,
+                                       check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    # --- Lecture ---
+    def search(self, search):
+        row = self._conn().execute("SELECT content, metadata FROM chunks WHERE vector_id=?",
+                                   (int(search),)).fetchone()
+        if row is None: return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def ids(self):
+        return [r[0] for r in self._conn().execute("SELECT vector_id FROM chunks ORDER BY vector_id")]
+
+    def max_id(self):
+        return self._conn().execute("SELECT COALESCE(MAX(vector_id), -1) FROM chunks").fetchone()[0]
+
+    def ids_for_files(self, files):
+        conn = self._conn()
+        return [r[0] for f in files for r in conn.execute("SELECT vector_id FROM chunks WHERE file=?", (f,))]
+
+    def search_lexical(self, query, k):
+        """Recherche BM25 : [(vector_id, score bm25)], le meilleur en premier ([] si index absent)"""
+        terms = query_terms(query)  # Accents retirés, comme dans l'index (remove_diacritics)
+        if not terms: return []
+        match = " OR ".join(f'"{t}"' for t in terms)
+        try:
+            rows = self._conn().execute("""SELECT rowid, bm25(chunks_fts) AS score FROM chunks_fts
+                                           WHERE chunks_fts MATCH ? ORDER BY score LIMIT ?""", (match, k)).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        return [(r[0], r[1]) for r in rows]
+
+    # --- Écriture (ingestion) ---
+    def add_chunks(self, vector_ids, chunk_ids, docs):
+        self._conn().executemany(
+            "INSERT OR REPLACE INTO chunks(vector_id, chunk_id, file, content, metadata) VALUES (?,?,?,?,?)",
+            [(int(vid), cid, cid.rsplit("#", 1)[0], doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+             for vid, cid, doc in zip(vector_ids, chunk_ids, docs)])
+
+    def delete(self, ids):
+        self._conn().executemany("DELETE FROM chunks WHERE vector_id=?", [(int(i),) for i in ids])
+
+    def clear(self):
+        self._conn().execute("DELETE FROM chunks")
+
+    def commit(self):
+        self._conn().commit()
+
+class IdentityMapping(Mapping):
+    """index_to_docstore_id du vectorstore LangChain : l'identifiant FAISS est la clé du docstore"""
+
+    def __init__(self, docstore):
+        self.docstore = docstore
+
+    def __getitem__(self, key):
+        return int(key)
+
+    def __iter__(self):
+        return iter(self.docstore.ids())
+
+    def __len__(self):
+        return self.docstore.count()
+
+def docstore_path(folder):
+    return os.path.join(folder, DOCSTORE_FILE)
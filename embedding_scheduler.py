@@ -0,0 +1,102 @@
+# === embedding_scheduler.py - MICRO-BATCHING DES EMBEDDINGS DE REQUÊTES ===
+# Sous charge, chaque question encode sa requête seule (lot de 1 passé au modèle).
+# BatchedEmbeddings regroupe les embed_query arrivant dans une courte fenêtre (quelques ms)
+# ou jusqu'à une taille de lot max, les encode en un seul passage du modèle
+# puis renvoie à chaque appelant son vecteur.
+# - sans autre requête en cours, le lot part immédiatement (pas d'attente ajoutée hors charge)
+# - métriques : distribution des tailles de lot, attente en file, durée d'encodage (stats())
+
+# === Importations ===
+import os, time, queue, logging, threading          # Config, délais, file, logs, thread du planificateur
+from concurrent.futures import Future               # Résultat rendu à chaque appelant
+from langchain_core.embeddings import Embeddings    # Interface LangChain des embeddings
+from tracing import Histogram, observe              # Histogrammes d'attente / d'encodage
+
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+EMBED_BATCH_WINDOW_MS = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5"))  # Attente max après la 1re requête (0 = désactivé)
+EMBED_MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", "32"))               # Taille max d'un lot
+
+class BatchedEmbeddings(Embeddings):
+    """Enveloppe un modèle d'embeddings : embed_query est regroupé entre threads,
+    embed_documents (ingestion, lots déjà constitués) est transmis tel quel."""
+
+    def __init__(self, base, window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_MAX_BATCH):
+        self.base = base
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._inflight = 0                       # Appels embed_query en cours (en file ou en encodage)
+        self.batch_sizes = {}                    # Taille de lot -> nombre de lots
+        self.queue_delay = Histogram()           # Attente en file (ms) par requête
+        self.encode_time = Histogram()           # Durée d'encodage (ms) par lot
+        self._thread = threading.Thread(target=self._run, name="embed-scheduler", daemon=True)
+        self._thread.start()
+
+    # --- Interface Embeddings ---
+    def embed_query(self, text):
+        future = Future()
+        with self._lock: self._inflight += 1
+        try:
+            self._queue.put((text, future, time.perf_counter()))
+            return future.result()
+        finally:
+            with self._lock: self._inflight -= 1
+
+    def embed_documents(self, texts):
+        return self.base.embed_documents(texts)
+
+    # --- Planificateur ---
+    def _collect(self):
+        """Premier texte en attente puis ceux qui arrivent dans la fenêtre (ou jusqu'à max_batch).
+        Si tous les appelants en cours sont déjà dans le lot, inutile d'attendre."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            with self._lock: waiting_elsewhere = self._inflight > len(batch)
+            remaining = deadline - time.monotonic()
+            if not waiting_elsewhere or remaining <= 0: break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            for _, _, queued_at in batch:
+                ms = (start - queued_at) * 1000
+                self.queue_delay.add(ms)
+                observe("embed_queue_delay", ms)
+            try:
+                vectors = self.base.embed_documents([text for text, _, _ in batch])  # Un seul passage du modèle
+            except Exception as e:
+                logger.error(f"Erreur encodage par lot: {e}")
+                for _, future, _ in batch: future.set_exception(e)
+                continue
+            ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self.encode_time.add(ms)
+            observe("embed_batch_encode", ms)
+            for (_, future, _), vec in zip(batch, vectors): future.set_result(vec)
+
+    # --- Métriques ---
+    def stats(self):
+        with self._lock:
+            batches = sum(self.batch_sizes.values())
+            items = sum(size * n for size, n in self.batch_sizes.items())
+            return {"batches": batches, "queries": items,
+                    "mean_batch_size": round(items / batches, 2) if batches else None,
+                    "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                    "queue_delay_ms": self.queue_delay.snapshot(), "encode_ms": self.encode_time.snapshot(),
+                    "window_ms": self.window * 1000, "max_batch": self.max_batch}
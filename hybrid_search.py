@@ -0,0 +1,62 @@
+# === hybrid_search.py - RECHERCHE HYBRIDE BM25 + VECTORIELLE ===
+# Combine deux classements pour retrieve_docs :
+# - vectoriel : index FAISS sur les embeddings MiniLM (sens général, mais modèle centré sur l'anglais)
+# - lexical   : BM25 sur l'index FTS5 du docstore (termes médicaux exacts, noms de médicaments)
+# Les deux recherches tournent en parallèle puis sont fusionnées par Reciprocal Rank Fusion (RRF) :
+#   score(d) = somme sur les classements de 1 / (RRF_K + rang(d))
+
+# === Importations ===
+import os, logging, contextvars                     # Configuration, logs, contexte de la requête
+from concurrent.futures import ThreadPoolExecutor   # Recherches vectorielle et lexicale en parallèle
+from tracing import span                            # Latence par étape
+
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+RRF_K = int(os.environ.get("RRF_K", "60"))                   # Constante de lissage RRF (valeur usuelle : 60)
+CANDIDATES_PER_K = int(os.environ.get("HYBRID_CANDIDATES", "5"))  # Candidats par classement = k * ce facteur
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-search")
+
+def vector_search(db, query, k):
+    """[(vector_id, distance L2)] les plus proches, sans lire le docstore"""
+    import numpy as np
+    with span("embed_query", use="rag"):
+        vec = np.asarray([db.embedding_function.embed_query(query)], dtype="float32")
+    with span("faiss_search", k=k):
+        distances, ids = db.index.search(vec, k)
+    return [(int(i), float(d)) for i, d in zip(ids[0], distances[0]) if i != -1]
+
+def lexical_search(db, query, k):
+    """[(vector_id, score bm25)] si le docstore dispose d'un index lexical, sinon []"""
+    search = getattr(db.docstore, "search_lexical", None)
+    if not search: return []
+    with span("bm25_search", k=k):
+        return search(query, k)
+
+def rrf_fuse(rankings, k, rrf_k=RRF_K):
+    """Fusionne des listes d'identifiants classés ; retourne les k meilleurs identifiants"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+def hybrid_search(db, query, k=3):
+    """[(Document, distance L2 ou None si trouvé uniquement par BM25)] dans l'ordre de la fusion RRF"""
+    n = max(k * CANDIDATES_PER_K, k)
+    # copy_context : les spans des threads du pool restent rattachés à la requête
+    vec_future = _pool.submit(contextvars.copy_context().run, vector_search, db, query, n)
+    lex_future = _pool.submit(contextvars.copy_context().run, lexical_search, db, query, n)
+    vector_hits = vec_future.result()
+    try:
+        lexical_hits = lex_future.result()
+    except Exception as e:
+        logger.error(f"Erreur recherche lexicale: {e}")
+        lexical_hits = []
+    distances = dict(vector_hits)
+    fused = rrf_fuse([[i for i, _ in vector_hits], [i for i, _ in lexical_hits]], k)
+    results = []
+    for doc_id in fused:  # Seuls les k documents retenus sont lus dans le docstore
+        doc = db.docstore.search(db.index_to_docstore_id[doc_id])
+        if not isinstance(doc, str): results.append((doc, distances.get(doc_id)))
+    return results
@@ -1,237 +1,269 @@
-# === pp_agent.py - VERSION DÉFINITIVE AVEC RAG FONCTIONNEL ===
-# Fichier principal de l'agent médical IA
-
-# --- Import des bibliothèques ---
-import os                   # Permet de gérer les chemins de fichiers et variables d'environnement
-import json                 # Pour lire/écrire des fichiers JSON (conversations, logs)
-import requests             # Pour effectuer des requêtes HTTP (ex: recherche web)
-import autogen               # Pour gérer les agents LLM (AssistantAgent et UserProxyAgent)
-from datetime import datetime  # Pour gérer les dates et horodatages
-from fpdf import FPDF       # Pour créer des fichiers PDF à partir de texte
-from langchain_community.vectorstores import FAISS  # Pour le stockage et la recherche vectorielle
-from langchain_huggingface import HuggingFaceEmbeddings  # Pour convertir texte en vecteurs (embeddings)
-import time                 # Pour mesurer le temps d'exécution (debug / performance)
-import logging              # Pour suivre l'exécution et afficher les erreurs ou informations
-
-# --- Configurer le logging ---
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')  # Format des messages de log
-logger = logging.getLogger(__name__)  # Crée un logger pour ce module
-
-# --- Configuration de l'environnement Ollama ---
-os.environ["OPENAI_API_BASE"] = "http://localhost:11434/v1"  # URL locale du serveur Ollama
-os.environ["OPENAI_API_KEY"] = "ollama"                       # Clé API fictive pour accès local
-
-# --- Configuration du modèle LLM ---
-config_list = [
-    {
-        "model": "mistral",                # Nom du modèle LLM local
-        "base_url": "http://localhost:11434/v1",  # URL du serveur Ollama
-        "api_key": "ollama",               # Clé API
-        "price": [0.0, 0.0],               # Prix fictif car local
-    }
-]
-
-# Paramètres globaux LLM
-llm_config = {
-    "config_list": config_list,          # Liste des configurations de modèles
-    "cache_seed": 42,                     # Pour rendre les réponses reproductibles
-    "functions": [                        # Fonctions exposées au modèle LLM
-        {
-            "name": "retrieve_docs",     # Nom de la fonction accessible par le LLM
-            "description": "Cherche des documents internes par similarité vectorielle",
-            "parameters": {              # Structure attendue des paramètres
-                "type": "object",
-                "properties": {
-                    "query": {"type": "string", "description": "La requête de recherche"}
-                },
-                "required": ["query"]   # Le champ "query" est obligatoire
-            }
-        },
-        {
-            "name": "search_web",        # Fonction de recherche web
-            "description": "Fait une recherche web avec Google via Serper.dev",
-            "parameters": {              # Paramètres attendus
-                "type": "object",
-                "properties": {
-                    "query": {"type": "string", "description": "La requête de recherche"}
-                },
-                "required": ["query"]
-            }
-        }
-    ]
-}
-
-# --- Mémoire conversationnelle globale ---
-chat_history = []  # Liste contenant les tuples (question utilisateur, réponse agent)
-
-# --- Variables globales pour le cache ---
-_cached_agents = None        # Pour stocker les instances d'agents Autogen
-_cached_memory_text = ""     # Historique court pour mémoire conversationnelle
-_vector_db = None            # Stockage FAISS chargé en mémoire pour accélérer les recherches
-
-# --- Fonction : Charger le vectorstore FAISS ---
-def get_vector_db():
-    """Charge le vectorstore en mémoire une seule fois pour toutes les sessions"""
-    global _vector_db  # Permet de modifier la variable globale
-    if _vector_db is None:  # Si le vectorstore n'a pas encore été chargé
-        logger.info("Chargement du vectorstore...")
-        start_time = time.time()  # Pour mesurer le temps de chargement
-        try:
-            _vector_db = FAISS.load_local(
-                "vectorstore",  # Chemin du vectorstore sur le disque
-                HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),  # Modèle d'embeddings
-                allow_dangerous_deserialization=True,  # Autorise la désérialisation même si non sécurisée
-            )
-            logger.info(f"Vectorstore chargé en {time.time() - start_time:.2f}s")  # Affiche le temps de chargement
-        except Exception as e:
-            logger.error(f"Impossible de charger le vectorstore: {e}")  # Erreur si échec
-            _vector_db = None
-    return _vector_db  # Retourne l'objet vectorstore (FAISS)
-
-# --- Cache pour recherches web et documents internes ---
-WEB_SEARCH_CACHE = {}  # Cache des résultats de recherche web pour éviter les appels répétitifs
-DOC_SEARCH_CACHE = {}  # Cache des résultats RAG pour les mêmes requêtes
-
-# --- Fonction : Recherche web via Serper.dev ---
-def search_web(query, max_results=1):
-    """
-    Requête Web avec Serper.dev
-    Retourne un dictionnaire {content: ...} compatible Autogen
-    """
-    url = "https://google.serper.dev/search"  # URL API Serper
-    headers = {"X-API-KEY": "API_KEY", "Content-Type": "application/json"}  # Clé API + type JSON
-    payload = {"q": query}  # Corps de la requête JSON
+# === index_documents.py - INGESTION INCRÉMENTALE DES DOCUMENTS ===
+# Construit / met à jour le vectorstore FAISS (vectorstore/) à partir du dossier docs/.
+# - Parcourt docs/ (txt, pdf, images jpg/png passées à l'OCR)
+# - Tient un manifeste des empreintes SHA-256 de chaque fichier
+# - Ne re-découpe et ne ré-encode que les fichiers ajoutés / modifiés / supprimés
+# - Met à jour l'index FAISS en place puis le sauvegarde
+#
+# Usage : python index_documents.py [--docs docs] [--out vectorstore] [--full]
+#         [--workers 32] [--batch-size 64] [--shard-size 512]
+#         [--index-type flat|ivf_flat|hnsw|ivf_pq] [--nlist N] [--nprobe N] [--ef-search N]
 
-    try:
-        start_time = time.time()
-        response = requests.post(url, headers=headers, json=payload)  # Envoi de la requête POST
-        response.raise_for_status()  # Lève une exception si code HTTP != 200
-        data = response.json()  # Convertit la réponse en dictionnaire Python
-        logger.info(f"Recherche web terminée en {time.time() - start_time:.2f}s")
-
-        if "organic" not in data or not data["organic"]:  # Pas de résultats
-            result = {"content": "Aucun résultat trouvé sur le web."}
-            WEB_SEARCH_CACHE[query] = result
-            return result
-
-        top = data["organic"][0]  # Premier résultat
-        result = {"content": f"Source: Recherche Web\nTitre: {top.get('title')}\nRésumé: {top.get('snippet')}\nLien: {top.get('link')}"}
-        WEB_SEARCH_CACHE[query] = result  # Mettre en cache
-        return result
+# === Importations ===
+import os, json, time, hashlib, logging, argparse  # Fichiers, manifeste, empreintes, logs, CLI
+from parallel_embeddings import (ParallelEmbeddings, DEFAULT_WORKERS,  # Encodage parallèle par lots
+                                 DEFAULT_BATCH_SIZE, DEFAULT_SHARD_SIZE)
+import vector_index                                # Types d'index FAISS (flat / IVF / HNSW / PQ)
+from docstore import SQLiteDocstore, docstore_path # Texte et métadonnées des morceaux (SQLite)
 
-    except Exception as e:
-        logger.error(f"Erreur recherche web: {e}")  # Log de l'erreur
-        result = {"content": f"Erreur lors de la recherche web: {str(e)}"}
-        WEB_SEARCH_CACHE[query] = result
-        return result
-
-# --- Fonction : Recherche RAG dans FAISS ---
-def retrieve_docs(query, k=3, max_distance=1.5):
-    """
-    Recherche des documents internes pertinents via FAISS
-    Retourne un dict {content: ...} compatible Autogen
-    """
-    if query in DOC_SEARCH_CACHE:  # Vérifie si le résultat est déjà en cache
-        logger.info(f"Utilisation du cache pour la recherche RAG: '{query}'")
-        return DOC_SEARCH_CACHE[query]
-
-    vector_db = get_vector_db()  # Charge ou récupère le vectorstore en mémoire
-    if vector_db is None:
-        return {"content": "Erreur: Base de documents non disponible."}
+# === Logging ===
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+DOCS_DIR = "docs"                 # Dossier source des documents
+VECTORSTORE_DIR = "vectorstore"   # Dossier de sortie (index.faiss + docstore.sqlite + index_config.json)
+MANIFEST_FILE = "manifest.json"   # Manifeste des fichiers déjà indexés (dans VECTORSTORE_DIR)
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # Même modèle que pp_agent.get_vector_db()
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "800"))       # Taille des morceaux (caractères)
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "100")) # Recouvrement entre morceaux
+TEXT_EXTENSIONS = {".txt", ".md"}
+PDF_EXTENSIONS = {".pdf"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS | PDF_EXTENSIONS | IMAGE_EXTENSIONS
+
+# === Empreintes et manifeste ===
+def file_hash(path):
+    """Empreinte SHA-256 du contenu d'un fichier (lecture par blocs)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def scan_docs(docs_dir=DOCS_DIR):
+    """Retourne {chemin relatif posix: sha256} pour tous les fichiers supportés de docs_dir"""
+    found = {}
+    for root, _, files in os.walk(docs_dir):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS: continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, docs_dir).replace(os.sep, "/")
+            found[rel] = file_hash(path)
+    return found
 
+def load_manifest(out_dir=VECTORSTORE_DIR):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path): return None
     try:
-        start_time = time.time()
-        results = vector_db.similarity_search_with_score(query, k=k)  # Recherche les k documents les plus similaires
-        logger.info(f"Recherche RAG terminée en {time.time() - start_time:.2f}s")
-        filtered = [doc for doc, score in results if score <= max_distance]  # Filtrer par score de similarité
-        if not filtered:  # Si aucun résultat ne passe le seuil
-            filtered = [doc for doc, score in results if score <= 2.0]  # Augmenter seuil
-            if not filtered:
-                return {"content": "Aucun document pertinent trouvé dans la base interne."}
-
-        doc = filtered[0]  # Prendre le premier document filtré
-        source = doc.metadata.get("source", "Document inconnu")
-        result = {"content": f"Source: Document Interne ({source})\n{doc.page_content}"}
-        DOC_SEARCH_CACHE[query] = result  # Mettre en cache
-        return result
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
     except Exception as e:
-        logger.exception("Erreur RAG")  # Trace complète de l'erreur
-        result = {"content": f"Erreur lors de la recherche dans la base: {str(e)}"}
-        DOC_SEARCH_CACHE[query] = result
-        return result
-
-# --- Fonction : Export PDF ---
-def export_to_pdf(history, dossier="mes_pdfs"):
-    """
-    Exporte la conversation en PDF
-    Nettoie les caractères Unicode problématiques
-    """
-    def clean_text(text):
-        replacements = {'œ': 'oe', 'Œ': 'Oe', '–': '-', '—': '-', '“': '"', '”': '"', '’': "'", '•': '-', '\u2026': '...', '€': 'EUR'}
-        for old, new in replacements.items():
-            text = text.replace(old, new)
-        return ''.join(c for c in text if ord(c) < 128)  # Supprime tous les caractères non ASCII
-
-    dossier_pdf = os.path.join("C:/Users/USER/Desktop/Agent IA", dossier)
-    os.makedirs(dossier_pdf, exist_ok=True)  # Crée le dossier s'il n'existe pas
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    pdf_path = os.path.join(dossier_pdf, f"session_{timestamp}.pdf")
-
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)  # Active les sauts de page automatique
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    for user_msg, agent_msg in history:  # Parcours de chaque échange
-        pdf.multi_cell(0, 10, f"Utilisateur : {clean_text(user_msg)}")
-        pdf.multi_cell(0, 10, f"Agent : {clean_text(agent_msg)}")
-        pdf.ln(5)  # Ligne vide entre échanges
-    pdf.output(pdf_path)  # Sauvegarde le PDF
-    return pdf_path
-
-# --- Fonction : Créer agents Autogen ---
-def create_agents():
-    """
-    Retourne user_proxy et assistant Autogen configurés pour RAG
-    """
-    assistant = autogen.AssistantAgent(
-        name="medical_agent",
-        system_message="""Tu es un assistant médical expert...
-        {memory}""",  # {memory} sera remplacé par l'historique récent
-        llm_config=llm_config,
-        max_consecutive_auto_reply=1,  # Ne fait qu'une réponse à la fois
-    )
-    user_proxy = autogen.UserProxyAgent(
-        name="user_proxy",
-        human_input_mode="NEVER",  # Pas d'entrée humaine directe
-        max_consecutive_auto_reply=0,
-        function_map={"retrieve_docs": retrieve_docs, "search_web": search_web},  # Fonctions exposées
-        code_execution_config=False,
-    )
-    return user_proxy, assistant
-
-# --- Fonction : Répondre à une question (Streamlit friendly) ---
-def answer_question(user_input, chat_history_local=None):
-    """
-    Retourne la réponse de l'agent en utilisant RAG et l'historique
-    """
-    global chat_history
-    local_history = chat_history_local if chat_history_local else chat_history  # Historique à utiliser
-    memory_text = ""
-    if local_history:
-        recent_history = local_history[-3:]  # Ne prendre que les 3 derniers échanges
-        memory_text = "\n".join([f"Q:{q}\nR:{r}" for q,r in recent_history])  # Formater mémoire pour le LLM
-
-    user_proxy, assistant = create_agents()  # Crée les agents
-    assistant.update_system_message(assistant.system_message.replace("{memory}", memory_text))  # Ajoute mémoire
+        logger.warning(f"Manifeste illisible ({e}), reconstruction complète.")
+        return None
 
+def save_manifest(manifest, out_dir=VECTORSTORE_DIR):
+    """Écriture atomique du manifeste (fichier temporaire puis remplacement)"""
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def diff_manifest(current, manifest):
+    """Compare l'état de docs/ au manifeste : (ajoutés, modifiés, supprimés)"""
+    previous = {rel: entry["sha256"] for rel, entry in (manifest or {}).get("files", {}).items()}
+    added = sorted(rel for rel in current if rel not in previous)
+    changed = sorted(rel for rel in current if rel in previous and previous[rel] != current[rel])
+    deleted = sorted(rel for rel in previous if rel not in current)
+    return added, changed, deleted
+
+# === Chargement et découpage des documents ===
+def _ocr_image(path):
+    """OCR d'une image (tableaux scannés) via pytesseract, si disponible"""
     try:
-        response = assistant.generate_reply([{"role": "user", "content": user_input}])  # Génère la réponse
-        content = response.get("content", str(response)) if isinstance(response, dict) else str(response)
-        if chat_history_local is None:  # Mettre à jour l'historique global seulement si pas local
-            chat_history.append((user_input, content))
-        return content
-    except Exception as e:
-        if chat_history_local is None:
-            chat_history.append((user_input, f"Erreur: {e}"))
-        return f"Désolé, une erreur est survenue: {str(e)}"
+        import pytesseract
+        from PIL import Image
+    except ImportError:
+        logger.warning(f"pytesseract non installé, image ignorée: {path}")
+        return ""
+    with Image.open(path) as img:
+        return pytesseract.image_to_string(img, lang=os.environ.get("OCR_LANG", "fra"))
+
+def load_file(path, source):
+    """Charge un fichier en liste de Documents LangChain (une entrée par page pour les PDF)"""
+    from langchain_core.documents import Document
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TEXT_EXTENSIONS:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return [Document(page_content=f.read(), metadata={"source": source})]
+    if ext in PDF_EXTENSIONS:
+        from langchain_community.document_loaders import PyPDFLoader
+        pages = PyPDFLoader(path).load()
+        for page in pages: page.metadata["source"] = source
+        return pages
+    if ext in IMAGE_EXTENSIONS:
+        text = _ocr_image(path)
+        return [Document(page_content=text, metadata={"source": source})] if text.strip() else []
+    return []
+
+def split_documents(docs, rel):
+    """Découpe en morceaux et attribue des identifiants stables '<fichier>#<n>'"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = [c for c in splitter.split_documents(docs) if c.page_content.strip()]
+    ids = [f"{rel}#{i}" for i in range(len(chunks))]
+    return chunks, ids
+
+# === Accès au vectorstore ===
+def _open_store(out_dir, rebuild):
+    """(index FAISS existant ou None si reconstruction, docstore SQLite en écriture)"""
+    import faiss
+    store = SQLiteDocstore(docstore_path(out_dir), readonly=False)
+    if rebuild:
+        store.clear()
+        return None, store
+    return faiss.read_index(os.path.join(out_dir, "index.faiss")), store
+
+def _save_index(index, out_dir):
+    """Écriture atomique de index.faiss ; supprime l'ancien docstore picklé s'il existe"""
+    import faiss
+    path = os.path.join(out_dir, "index.faiss")
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    legacy = os.path.join(out_dir, "index.pkl")
+    if os.path.exists(legacy): os.remove(legacy)
+
+def _remove_files(builder, store, rels):
+    """Supprime de l'index tous les morceaux des fichiers donnés
+    (y compris les restes d'une exécution interrompue absents du manifeste)"""
+    stale = store.ids_for_files(rels)
+    if not stale: return 0
+    builder.remove(stale)
+    store.delete(stale)
+    return len(stale)
+
+def _add_chunks(builder, store, chunks, ids, vector_ids, vectors):
+    """Ajoute un shard de morceaux déjà encodés (identifiants FAISS int64 = vector_ids)"""
+    builder.add(vector_ids, vectors)
+    store.add_chunks(vector_ids, ids, chunks)
+
+def _iter_chunks(docs_dir, rels, current, files):
+    """Produit ((morceau, id), texte) fichier par fichier et met à jour l'entrée du manifeste"""
+    for rel in rels:
+        source = f"{os.path.basename(os.path.normpath(docs_dir))}/{rel}"
+        try:
+            chunks, ids = split_documents(load_file(os.path.join(docs_dir, rel), source), rel)
+        except Exception as e:
+            logger.error(f"Erreur lecture {rel}: {e}")
+            files.pop(rel, None)
+            continue
+        files[rel] = {"sha256": current[rel], "chunk_ids": ids}
+        logger.info(f"Découpé: {rel} ({len(chunks)} morceaux)")
+        for chunk, cid in zip(chunks, ids):
+            yield (chunk, cid), chunk.page_content
+
+def _index_params(out_dir, overrides):
+    """Paramètres d'index : configuration existante + options explicites.
+    Retourne (params, reconstruction nécessaire ?)"""
+    exists = os.path.exists(os.path.join(out_dir, vector_index.INDEX_CONFIG_FILE))
+    stored = vector_index.load_config(out_dir)
+    params = vector_index.default_params(**{**stored, **overrides})
+    changed = [k for k in vector_index.BUILD_KEYS if k in overrides and overrides[k] != stored[k]]
+    if changed: logger.info(f"Paramètres de construction modifiés ({', '.join(changed)}), reconstruction complète.")
+    return params, (not exists) or bool(changed)
+
+# === Ingestion ===
+def update_index(docs_dir=DOCS_DIR, out_dir=VECTORSTORE_DIR, full=False,
+                 workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, shard_size=DEFAULT_SHARD_SIZE,
+                 index_params=None):
+    """Met à jour vectorstore/ pour refléter docs/ ; retourne un résumé des changements.
+    index_params : options de vector_index (type, nlist, nprobe, hnsw_m, ef_search, pq_m...)"""
+    start = time.time()
+    os.makedirs(out_dir, exist_ok=True)
+    params, params_changed = _index_params(out_dir, {k: v for k, v in (index_params or {}).items() if v is not None})
+    manifest = None if full or params_changed else load_manifest(out_dir)
+    if manifest and manifest.get("embedding_model") != EMBEDDING_MODEL:
+        logger.info("Modèle d'embeddings différent du manifeste, reconstruction complète.")
+        manifest = None
+    rebuild = manifest is None or not all(os.path.exists(p) for p in
+                                          (os.path.join(out_dir, "index.faiss"), docstore_path(out_dir)))
+    if rebuild: manifest = None
+
+    current = scan_docs(docs_dir)
+    added, changed, deleted = diff_manifest(current, manifest)
+    summary = {"added": added, "changed": changed, "deleted": deleted}
+    if not (added or changed or deleted) and not rebuild:
+        vector_index.save_config(out_dir, params)  # Réglages de requête (nprobe / efSearch) éventuels
+        logger.info("✓ Vectorstore à jour, aucun fichier modifié.")
+        return summary
+
+    files = dict((manifest or {}).get("files", {}))
+    index, store = _open_store(out_dir, rebuild)
+    if index is not None and vector_index.index_kind(index) != params["type"]:
+        logger.info("Index existant d'un autre type, reconstruction complète.")
+        store.clear()
+        index, files = None, {}
+        added, changed, deleted = sorted(current), [], []
+        summary = {"added": added, "changed": changed, "deleted": deleted}
+    next_id = max((manifest or {}).get("next_id", 0), store.max_id() + 1)  # Prochain identifiant FAISS libre
+    builder = vector_index.IndexBuilder(params, index)
+
+    # Suppression des morceaux des fichiers modifiés ou supprimés
+    removed = _remove_files(builder, store, added + changed + deleted)
+    for rel in deleted: files.pop(rel, None)
+
+    # Découpage + encodage (en flux, shard par shard) des seuls fichiers ajoutés ou modifiés
+    added_chunks = 0
+    with ParallelEmbeddings(EMBEDDING_MODEL, workers=workers, batch_size=batch_size,
+                            shard_size=shard_size) as engine:
+        for payloads, vectors in engine.stream(_iter_chunks(docs_dir, added + changed, current, files)):
+            chunks, ids = zip(*payloads)
+            vector_ids = list(range(next_id, next_id + len(ids)))
+            next_id += len(ids)
+            _add_chunks(builder, store, list(chunks), list(ids), vector_ids, vectors)
+            added_chunks += len(ids)
+            logger.info(f"Encodé: {added_chunks} morceaux")
+    index = builder.finish()
+
+    if index is None:
+        logger.warning("Aucun document indexable trouvé, vectorstore non écrit.")
+        return summary
+    store.commit()  # Docstore d'abord : une relance après interruption repart du manifeste précédent
+    _save_index(index, out_dir)
+    vector_index.save_config(out_dir, builder.params)
+    save_manifest({"embedding_model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE,
+                   "chunk_overlap": CHUNK_OVERLAP, "next_id": next_id, "files": files}, out_dir)
+    logger.info(f"✓ Vectorstore ({params['type']}) mis à jour en {time.time()-start:.2f}s "
+                f"(+{len(added)} ~{len(changed)} -{len(deleted)} fichiers, "
+                f"+{added_chunks} / -{removed} morceaux)")
+    return summary
+
+# === Point d'entrée ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestion incrémentale de docs/ vers le vectorstore FAISS")
+    parser.add_argument("--docs", default=DOCS_DIR, help="Dossier des documents sources")
+    parser.add_argument("--out", default=VECTORSTORE_DIR, help="Dossier du vectorstore")
+    parser.add_argument("--full", action="store_true", help="Ignore le manifeste et reconstruit tout")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Nombre de processus d'encodage (1 = processus courant)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Taille des lots d'encodage")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help="Nombre de morceaux envoyés à un worker à la fois")
+    parser.add_argument("--index-type", choices=vector_index.INDEX_TYPES,
+                        help="Type d'index FAISS (défaut: configuration existante, sinon flat)")
+    parser.add_argument("--nlist", type=int, help="IVF : nombre de listes inversées")
+    parser.add_argument("--nprobe", type=int, help="IVF : listes visitées par requête")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW : voisins par nœud")
+    parser.add_argument("--ef-search", type=int, help="HNSW : candidats explorés par requête")
+    parser.add_argument("--pq-m", type=int, help="PQ : nombre de sous-vecteurs")
+    parser.add_argument("--pq-nbits", type=int, help="PQ : bits par sous-vecteur")
+    args = parser.parse_args(argv)
+    update_index(args.docs, args.out, full=args.full, workers=args.workers,
+                 batch_size=args.batch_size, shard_size=args.shard_size,
+                 index_params={"type": args.index_type, "nlist": args.nlist, "nprobe": args.nprobe,
+                               "hnsw_m": args.hnsw_m, "ef_search": args.ef_search,
+                               "pq_m": args.pq_m, "pq_nbits": args.pq_nbits})
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,19 @@
 # Interface web pour un agent médical IA avec Streamlit.
 # Fonctionnalités :
 # - Historique de conversation
-# - Streaming de réponses (simulation)
+# - Streaming de réponses (jeton par jeton)
 # - Export PDF
 # - Sidebar pour gérer les conversations
 
 # === IMPORTS ===
 import streamlit as st        # Framework web interactif
 import os                     # Gestion fichiers/dossiers
-import json                   # Lecture/écriture JSON
 from datetime import datetime # Pour horodatage
-from pp_agent import answer_question, export_to_pdf  # Backend du chatbot
+from pp_agent import answer_question_stream, warm_up, get_memory  # Backend du chatbot
+from pdf_export import submit_export, get_job  # Export PDF en arrière-plan (tâche interrogée par l'interface)
+from conversation_store import get_store  # Conversations en base SQLite (liste paginée, messages ajoutés un par un)
+from tracing import span, record         # Temps de rendu de l'interface
+import time                               # Chronométrage du rendu en streaming
 import base64                 # Encodage image pour affichage logo
 
 # === LOGO ET CONFIGURATION DE LA PAGE ===
@@ -25,48 +28,69 @@ st.set_page_config(
     initial_sidebar_state="collapsed" # Sidebar repliée par défaut
 )
 
-# === RÉPERTOIRE POUR LES CONVERSATIONS ===
-CONV_DIR = "conversations"
-os.makedirs(CONV_DIR, exist_ok=True)  # Crée le dossier si inexistant
+# === RESSOURCES PARTAGÉES (UNE FOIS PAR PROCESSUS, PAS À CHAQUE RERUN) ===
+@st.cache_resource(show_spinner=False)
+def load_backend():
+    """Préchargement du modèle, de l'index et des agents en arrière-plan + base des conversations
+    (anciens fichiers conversations/*.json migrés au premier lancement)"""
+    warm_up()
+    return get_store()
+
+@st.cache_data(show_spinner=False)
+def load_logo(path):
+    """Logo encodé en base64 (lu une seule fois) ou None"""
+    if not os.path.exists(path): return None
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+store = load_backend()
+
+# === CONVERSATIONS ===
+CONV_PAGE_SIZE = 50           # Conversations listées par page dans la barre latérale
+MSG_WINDOW = 20               # Messages affichés (et chargés) par tranche
 
 # === FONCTIONS UTILITAIRES ===
-def load_conversations():
-    """Charge les fichiers JSON existants dans le répertoire conversations"""
-    convs = []
-    for f in sorted(os.listdir(CONV_DIR), reverse=True):
-        if f.endswith(".json"):
-            try:
-                with open(os.path.join(CONV_DIR, f), "r", encoding="utf-8") as cf:
-                    data = json.load(cf)
-                    convs.append({
-                        "file": f,
-                        "title": data.get("title", f),
-                        "timestamp": data.get("timestamp")
-                    })
-            except:
-                continue
-    return convs
-
-def save_chat(filename, messages, title=None):
-    """Sauvegarde l'historique de conversation dans un JSON"""
-    formatted = [{"role": "user" if r=="user" else "assistant", "content": c} for r,c in messages]
-    data = {
-        "title": title or f"Discussion du {datetime.now().strftime('%Y-%m-%d')}",
-        "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
-        "messages": formatted
-    }
-    with open(os.path.join(CONV_DIR, filename), "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def load_chat(filename):
-    """Charge une conversation depuis un fichier JSON"""
-    try:
-        with open(os.path.join(CONV_DIR, filename), "r", encoding="utf-8") as f:
-            data = json.load(f)
-            messages = [(m["role"] if m["role"]=="user" else "agent", m["content"]) for m in data["messages"]]
-            return messages, data.get("title", filename)
-    except:
-        return [], filename
+def load_conversations(limit=CONV_PAGE_SIZE):
+    """Titres et horodatages des conversations récentes (sans lire les messages)"""
+    return store.list_conversations(limit=limit)
+
+def save_message(conv_id, role, content):
+    """Ajoute un message à la conversation (sans réécrire les précédents)"""
+    store.append_message(conv_id, "user" if role == "user" else "assistant", content)
+
+def load_chat(conv_id, limit=None):
+    """Charge les messages d'une conversation (les `limit` derniers si précisé).
+    Renvoie (messages, titre, nombre de messages plus anciens non chargés)"""
+    conv = store.get(conv_id)
+    if conv is None: return [], conv_id, 0
+    messages = [(role if role == "user" else "agent", content) for role, content in store.load_messages(conv_id, limit)]
+    return messages, conv["title"], conv["messages"] - len(messages)
+
+def open_chat(conv_id, title="Nouvelle conversation"):
+    """Conversation active : seuls les MSG_WINDOW derniers messages sont chargés"""
+    msgs, title, hidden = load_chat(conv_id, MSG_WINDOW) if conv_id else ([], title, 0)
+    st.session_state.messages = msgs
+    st.session_state.msg_hidden = hidden          # Messages plus anciens restés en base
+    st.session_state.render_limit = MSG_WINDOW    # Messages affichés
+    st.session_state.active_conv = conv_id
+    st.session_state.conv_title = title
+    st.session_state.pdf_job = None               # Export PDF de la conversation précédente
+
+def user_bubble(text):
+    """Bulle HTML d'une question de l'utilisateur"""
+    return f"""
+        <div style="display:flex;justify-content:flex-end;margin:6px 0;">
+            <div style="background:#0d6efd;color:white;padding:10px 14px;border-radius:12px;max-width:70%">{text}</div>
+        </div>
+    """
+
+def agent_bubble(text):
+    """Bulle HTML d'une réponse de l'agent"""
+    return f"""
+        <div style="display:flex;justify-content:flex-start;margin:6px 0;">
+            <div style="background:#e9f7ef;color:#0f5132;padding:10px 14px;border-radius:12px;max-width:70%;">{text}</div>
+        </div>
+    """
 
 # === INITIALISATION DE LA SESSION STREAMLIT ===
 # On initialise les variables de session si elles n'existent pas encore
@@ -74,6 +98,10 @@ if "messages" not in st.session_state: st.session_state.messages = []
 if "active_conv" not in st.session_state: st.session_state.active_conv = None
 if "conv_title" not in st.session_state: st.session_state.conv_title = "Nouvelle conversation"
 if "waiting" not in st.session_state: st.session_state.waiting = False
+if "conv_limit" not in st.session_state: st.session_state.conv_limit = CONV_PAGE_SIZE
+if "msg_hidden" not in st.session_state: st.session_state.msg_hidden = 0
+if "render_limit" not in st.session_state: st.session_state.render_limit = MSG_WINDOW
+if "pdf_job" not in st.session_state: st.session_state.pdf_job = None
 
 # === SIDEBAR ===
 with st.sidebar:
@@ -81,26 +109,27 @@ with st.sidebar:
 
     # Bouton pour créer une nouvelle conversation
     if st.button("➕ Nouvelle conversation"):
-        st.session_state.messages = []
-        st.session_state.active_conv = None
-        st.session_state.conv_title = "Nouvelle conversation"
+        open_chat(None)
         st.rerun()
 
     # Liste des conversations existantes
-    convs = load_conversations()
+    convs = load_conversations(st.session_state.conv_limit)
     for conv in convs:
         col1, col2 = st.columns([4,1])  # 2 colonnes : titre / bouton supprimer
         with col1:
-            if st.button(conv["title"], key=f"open_{conv['file']}"):
-                msgs, title = load_chat(conv["file"])
-                st.session_state.messages = msgs
-                st.session_state.active_conv = conv["file"]
-                st.session_state.conv_title = title
+            if st.button(conv["title"], key=f"open_{conv['id']}"):
+                open_chat(conv["id"])
                 st.rerun()
         with col2:
-            if st.button("🗑️", key=f"del_{conv['file']}"):
-                os.remove(os.path.join(CONV_DIR, conv["file"]))
+            if st.button("🗑️", key=f"del_{conv['id']}"):
+                store.delete(conv["id"])
+                get_memory().forget(conv["id"])  # Résumé gardé en mémoire du processus oublié aussi
                 st.rerun()
+    # Pagination : conversations plus anciennes chargées à la demande
+    if len(convs) == st.session_state.conv_limit and store.count() > len(convs):
+        if st.button("⬇️ Conversations plus anciennes"):
+            st.session_state.conv_limit += CONV_PAGE_SIZE
+            st.rerun()
 
     st.markdown("---")
     # Renommer la conversation active
@@ -108,15 +137,13 @@ with st.sidebar:
         new_title = st.text_input("✏️ Renommer", st.session_state.conv_title)
         if new_title != st.session_state.conv_title:
             st.session_state.conv_title = new_title
-            save_chat(st.session_state.active_conv, st.session_state.messages, title=new_title)
+            store.rename(st.session_state.active_conv, new_title)
 
     st.markdown("<br><center>⚕️ Medical Agent v1.0</center>", unsafe_allow_html=True)
 
 # === HEADER AVEC LOGO ===
-if os.path.exists(logo_path):
-    with open(logo_path, "rb") as f:
-        data = f.read()
-    encoded = base64.b64encode(data).decode()
+encoded = load_logo(logo_path)
+if encoded:
     st.markdown(
         f"""
         <h1 style='text-align:center; margin-top:10px;'>
@@ -145,53 +172,82 @@ with st.form("chat_form", clear_on_submit=True):
 if submitted and user_input.strip():
     st.session_state.messages.append(("user", user_input))
     if not st.session_state.active_conv:
-        filename = f"conv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        st.session_state.active_conv = filename
-    save_chat(st.session_state.active_conv, st.session_state.messages, st.session_state.conv_title)
+        st.session_state.active_conv = store.create(st.session_state.conv_title)
+    save_message(st.session_state.active_conv, "user", user_input)
+    st.session_state.pdf_job = None  # Conversation modifiée : PDF à régénérer
 
 # === AFFICHAGE DES MESSAGES ===
-for role, content in st.session_state.messages:
-    if role == "user":
-        chat_box.markdown(f"""
-        <div style="display:flex;justify-content:flex-end;margin:6px 0;">
-            <div style="background:#0d6efd;color:white;padding:10px 14px;border-radius:12px;max-width:70%">{content}</div>
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        chat_box.markdown(f"""
-        <div style="display:flex;justify-content:flex-start;margin:6px 0;">
-            <div style="background:#e9f7ef;color:#0f5132;padding:10px 14px;border-radius:12px;max-width:70%">{content}</div>
-        </div>
-        """, unsafe_allow_html=True)
+# Seuls les render_limit derniers messages sont affichés, en un seul bloc HTML ;
+# les plus anciens sont chargés à la demande.
+visible = st.session_state.messages[-st.session_state.render_limit:]
+older = len(st.session_state.messages) - len(visible) + st.session_state.msg_hidden
+if older and chat_box.button(f"⬆️ Afficher les messages précédents ({older})"):
+    st.session_state.render_limit += MSG_WINDOW
+    if st.session_state.msg_hidden and st.session_state.render_limit > len(st.session_state.messages):
+        st.session_state.messages, _, st.session_state.msg_hidden = load_chat(
+            st.session_state.active_conv, st.session_state.render_limit)
+    st.rerun()
+if visible:
+    with span("ui_render_history", messages=len(visible)):
+        chat_box.markdown("".join(user_bubble(content) if role == "user" else agent_bubble(content)
+                                  for role, content in visible), unsafe_allow_html=True)
 
-# === STREAMING DE LA RÉPONSE (simulé ici) ===
+# === STREAMING DE LA RÉPONSE ===
 if submitted and user_input.strip():
     response_placeholder = chat_box.empty()  # Placeholder pour la réponse
     response_text = ""
     response_placeholder.markdown("<i>Agent est en train d'écrire...</i>", unsafe_allow_html=True)
 
-    # On récupère la réponse complète depuis le backend
-    response_text = answer_question(user_input)
-
-    # Affichage de la réponse
-    response_placeholder.markdown(f"""
-        <div style="display:flex;justify-content:flex-start;margin:6px 0;">
-            <div style="background:#e9f7ef;color:#0f5132;padding:10px 14px;border-radius:12px;max-width:70%;">{response_text}</div>
-        </div>
-    """, unsafe_allow_html=True)
+    # Affichage incrémental des jetons reçus du backend
+    render_time = 0.0  # Temps passé dans le rendu Streamlit (hors attente du LLM)
+    for token in answer_question_stream(user_input, conversation_id=st.session_state.active_conv):  # Mémoire de la conversation
+        response_text += token
+        start = time.perf_counter()
+        response_placeholder.markdown(agent_bubble(response_text + "▌"), unsafe_allow_html=True)
+        render_time += time.perf_counter() - start
+    response_placeholder.markdown(agent_bubble(response_text), unsafe_allow_html=True)
+    record("ui_render_stream", render_time, chars=len(response_text))
 
     st.session_state.messages.append(("agent", response_text))
-    save_chat(st.session_state.active_conv, st.session_state.messages, st.session_state.conv_title)
+    save_message(st.session_state.active_conv, "agent", response_text)
     st.stop()  # Stoppe Streamlit pour éviter réexécution
 
 # === EXPORT PDF ===
+# Le PDF est généré par un worker en arrière-plan ; la page interroge la tâche sans se figer.
+@st.fragment(run_every=1)
+def pdf_job_progress():
+    """Rafraîchi chaque seconde pendant la génération, puis relance la page pour le téléchargement"""
+    job = get_job(st.session_state.pdf_job)
+    if job is None or job.done: st.rerun()
+    st.caption("⏳ Génération du PDF en cours...")
+
+def export_messages():
+    """Conversation complète, y compris les messages non chargés"""
+    if st.session_state.msg_hidden: return load_chat(st.session_state.active_conv)[0]
+    return st.session_state.messages
+
 if st.session_state.messages:
     if st.button("📄 Exporter en PDF"):
-        pdf_path = export_to_pdf([(u, a) for u, a in st.session_state.messages])
-        with open(pdf_path, "rb") as f:
+        st.session_state.pdf_job = submit_export(export_messages())
+    job = get_job(st.session_state.pdf_job) if st.session_state.pdf_job else None
+    if job is not None and job.status == "done" and not os.path.exists(job.path):
+        # PDF supprimé depuis (éviction PDF_CACHE_MAX, nettoyage de mes_pdfs/) : export relancé
+        st.session_state.pdf_job = submit_export(export_messages())
+        job = get_job(st.session_state.pdf_job)
+    if job is not None and not job.done:
+        pdf_job_progress()
+    elif job is not None and job.status == "error":
+        st.error(f"Échec de l'export PDF : {job.error}")
+    elif job is not None:
+        try:
+            with open(job.path, "rb") as f:
+                pdf_bytes = f.read()
+        except FileNotFoundError:  # Supprimé entre la vérification et la lecture : nouvel essai au prochain rerun
+            pdf_bytes = None
+        if pdf_bytes is not None:
             st.download_button(
                 label="⬇️ Télécharger le PDF",
-                data=f,
+                data=pdf_bytes,
                 file_name=f"conversation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
                 mime="application/pdf"
             )
@@ -0,0 +1,236 @@
+# === mcp_analytics.py - COMPACTAGE PARQUET ET ANALYSE DES LOGS MCP ===
+# Deux commandes :
+# - compact : convertit les segments MCP archivés (mcp_logs.<horodatage>.jsonl[.gz|.zst])
+#             en Parquet partitionné par jour (mcp_parquet/event_date=AAAA-MM-JJ/<segment>.parquet)
+# - report  : nombre d'événements par type, part RAG / WEB, latence question -> réponse
+#             (p50 / p90 / p95 / p99) et taux de succès des caches (sémantique, web)
+# Les colonnes utiles aux rapports sont extraites du payload à la compaction : le rapport ne lit
+# que ces colonnes (format colonnaire) et que les partitions de la période demandée.
+#
+# Usage : python mcp_analytics.py compact [--logs-dir .] [--out mcp_parquet] [--delete]
+#         python mcp_analytics.py report [--parquet mcp_parquet] [--since AAAA-MM-JJ] [--until AAAA-MM-JJ]
+#                                        [--no-live] [--json]
+
+# === Importations ===
+import os, re, gzip, json, logging, argparse        # Fichiers, segments gzip, JSON, logs, CLI
+from datetime import datetime                       # Horodatages des événements
+from mcp_client import MCP_LOG_FILE, MCP_PARQUET_DIR, MCP_COMPACTED_FILE  # Fichier courant, dataset lu par la rotation
+
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+PARQUET_DIR = MCP_PARQUET_DIR           # Dossier du dataset Parquet (MCP_PARQUET_DIR)
+COMPACTED_FILE = MCP_COMPACTED_FILE     # Segments déjà convertis (dans PARQUET_DIR) : la rotation de mcp_client
+                                        # ne supprime que ceux-là, compacter avec --out PARQUET_DIR par défaut
+PERCENTILES = (50, 90, 95, 99)
+# Colonnes extraites du payload : nom -> (clé du payload, type)
+PAYLOAD_COLUMNS = {
+    "request_id": ("request_id", "string"),        # Présent si le traçage des requêtes l'ajoute
+    "used": ("used", "string"),                    # context_used : RAG / WEB
+    "cache": ("cache", "string"),                  # cache_lookup : semantic / web
+    "hit": ("hit", "bool_"),
+    "prompt_tokens": ("prompt_tokens", "int64"),   # prompt_stats
+    "context_tokens": ("context_tokens", "int64"),
+    "span": ("span", "string"),                    # span : étape du pipeline (tracing.py)
+    "duration_ms": ("duration_ms", "float64"),
+}
+
+def _loads():
+    try:
+        import orjson  # Nettement plus rapide sur de gros segments
+        return orjson.loads
+    except ImportError:
+        return json.loads
+
+# === Lecture des segments JSONL ===
+def segment_files(logs_dir):
+    """Segments archivés par la rotation de mcp_client, du plus ancien au plus récent"""
+    base = os.path.splitext(os.path.basename(MCP_LOG_FILE))[0]
+    pattern = re.compile(re.escape(base) + r"\.\d{8}T\d+\.jsonl(\.gz|\.zst)?$")
+    return sorted(os.path.join(logs_dir, f) for f in os.listdir(logs_dir) if pattern.match(f))
+
+def _open_segment(path):
+    if path.endswith(".gz"): return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        import io, zstandard  # Segments compressés en zstd par mcp_client
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+# Valeurs acceptées par type de colonne (les autres deviennent null au lieu de faire échouer le segment)
+_PYTHON_TYPES = {"string": str, "bool_": bool, "int64": int, "float64": (int, float)}
+
+def _coerce(value, kind):
+    if value is None or (isinstance(value, bool) and kind != "bool_"): return None
+    return value if isinstance(value, _PYTHON_TYPES[kind]) else None
+
+def read_events(path, bad=None):
+    """Table Arrow (timestamp, event_date, event_type, colonnes extraites, payload JSON) d'un fichier JSONL.
+    Lignes illisibles ou sans horodatage valide ignorées et comptées dans bad (dict) ;
+    valeurs extraites du mauvais type mises à null."""
+    import pyarrow as pa
+    loads = _loads()
+    skipped = {"json": 0, "timestamp": 0}
+    cols = {"timestamp": [], "event_date": [], "event_type": [], "payload": []}
+    cols.update({name: [] for name in PAYLOAD_COLUMNS})
+    with _open_segment(path) as f:
+        for line in f:
+            try:
+                event = loads(line)
+            except ValueError:
+                skipped["json"] += 1  # Ligne tronquée (arrêt brutal pendant une écriture)
+                continue
+            try:
+                ts = datetime.fromisoformat(event.get("timestamp"))
+            except (TypeError, ValueError, AttributeError):
+                skipped["timestamp"] += 1  # Sans date, l'événement n'a pas de partition
+                continue
+            payload = event.get("payload") or {}
+            cols["timestamp"].append(ts.replace(tzinfo=None))
+            cols["event_date"].append(ts.strftime("%Y-%m-%d"))
+            cols["event_type"].append(_coerce(event.get("event_type"), "string"))
+            cols["payload"].append(json.dumps(payload, ensure_ascii=False))
+            for name, (key, kind) in PAYLOAD_COLUMNS.items():
+                cols[name].append(_coerce(payload.get(key), kind) if isinstance(payload, dict) else None)
+    if bad is not None: bad.update(skipped)
+    schema = pa.schema([("timestamp", pa.timestamp("us")), ("event_date", pa.string()), ("event_type", pa.string()),
+                        ("payload", pa.string())] +
+                       [(name, getattr(pa, t)()) for name, (_, t) in PAYLOAD_COLUMNS.items()])
+    return pa.Table.from_pydict(cols, schema=schema)
+
+# === Compaction ===
+def compact(logs_dir=".", out_dir=PARQUET_DIR, delete=False):
+    """Convertit les segments archivés non encore traités ; retourne le nombre de segments convertis"""
+    import pyarrow.parquet as pq
+    os.makedirs(out_dir, exist_ok=True)
+    done_path = os.path.join(out_dir, COMPACTED_FILE)
+    done = set(json.load(open(done_path, encoding="utf-8"))) if os.path.exists(done_path) else set()
+    converted = 0
+    for path in segment_files(logs_dir):
+        name = os.path.basename(path)
+        if name in done: continue
+        bad = {}
+        table = read_events(path, bad)
+        if table.num_rows:
+            # Un fichier par segment et par jour : relancer la compaction réécrit les mêmes fichiers
+            pq.write_to_dataset(table, out_dir, partition_cols=["event_date"], compression="zstd",
+                                basename_template=name.split(".jsonl")[0] + "-{i}.parquet",
+                                existing_data_behavior="overwrite_or_ignore")
+        done.add(name)
+        with open(done_path + ".tmp", "w", encoding="utf-8") as f: json.dump(sorted(done), f)
+        os.replace(done_path + ".tmp", done_path)
+        if delete: os.remove(path)
+        converted += 1
+        logger.info(f"{name} : {table.num_rows} événements compactés")
+        if any(bad.values()):
+            logger.warning(f"{name} : lignes ignorées (JSON invalide: {bad['json']}, horodatage invalide: {bad['timestamp']})")
+    return converted
+
+# === Chargement pour l'analyse ===
+REPORT_COLUMNS = ["timestamp", "event_type", "request_id", "used", "cache", "hit", "span", "duration_ms"]
+
+def load_events(parquet_dir=PARQUET_DIR, since=None, until=None, live=True):
+    """DataFrame des colonnes utiles au rapport : partitions de la période + fichier courant (live)"""
+    import pandas as pd
+    import pyarrow.dataset as ds
+    frames = []
+    if os.path.isdir(parquet_dir) and any(d.startswith("event_date=") for d in os.listdir(parquet_dir)):
+        dataset = ds.dataset(parquet_dir, format="parquet", partitioning="hive",
+                             exclude_invalid_files=True)
+        flt = None
+        if since: flt = ds.field("event_date") >= since
+        if until: flt = (ds.field("event_date") <= until) if flt is None else flt & (ds.field("event_date") <= until)
+        frames.append(dataset.to_table(columns=REPORT_COLUMNS, filter=flt).to_pandas())  # Élagage des partitions
+    if live and os.path.exists(MCP_LOG_FILE):
+        table = read_events(MCP_LOG_FILE).select(REPORT_COLUMNS + ["event_date"])
+        df = table.to_pandas()
+        if since: df = df[df["event_date"] >= since]
+        if until: df = df[df["event_date"] <= until]
+        frames.append(df.drop(columns="event_date"))
+    if not frames: return pd.DataFrame(columns=REPORT_COLUMNS)
+    return pd.concat(frames, ignore_index=True).sort_values("timestamp", kind="stable", ignore_index=True)
+
+# === Indicateurs ===
+def question_latencies(df):
+    """Durées (s) user_question -> agent_response.
+    Avec request_id : appariement exact ; sinon une réponse est associée à la question qui la précède
+    immédiatement (les questions sans réponse ou interrompues sont ignorées)."""
+    import pandas as pd
+    qr = df[df["event_type"].isin(["user_question", "agent_response"])]
+    with_id = qr[qr["request_id"].notna()]
+    latencies = []
+    if len(with_id):
+        firsts = with_id.groupby(["request_id", "event_type"])["timestamp"].min().unstack()
+        if {"user_question", "agent_response"} <= set(firsts.columns):
+            d = (firsts["agent_response"] - firsts["user_question"]).dropna()
+            latencies.append(d.dt.total_seconds())
+    seq = qr[qr["request_id"].isna()]
+    prev_type, prev_ts = seq["event_type"].shift(), seq["timestamp"].shift()
+    paired = (seq["event_type"] == "agent_response") & (prev_type == "user_question")
+    latencies.append((seq["timestamp"][paired] - prev_ts[paired]).dt.total_seconds())
+    out = pd.concat(latencies, ignore_index=True)
+    return out[out >= 0]
+
+def build_report(df):
+    import numpy as np
+    report = {"events": int(len(df)),
+              "period": [str(df["timestamp"].min()), str(df["timestamp"].max())] if len(df) else None,
+              "event_counts": {k: int(v) for k, v in df["event_type"].value_counts().items()}}
+    used = df.loc[df["event_type"] == "context_used", "used"].value_counts()
+    total = int(used.sum())
+    report["context_sources"] = {k: {"count": int(v), "ratio": round(v / total, 3)} for k, v in used.items()}
+    lat = question_latencies(df)
+    report["latency_s"] = {"count": int(len(lat))}
+    if len(lat):
+        report["latency_s"].update({f"p{p}": round(float(np.percentile(lat, p)), 3) for p in PERCENTILES})
+        report["latency_s"]["mean"] = round(float(lat.mean()), 3)
+    lookups = df[df["event_type"] == "cache_lookup"]
+    report["cache_hit_rate"] = {cache: {"lookups": int(len(g)), "hit_rate": round(float(g["hit"].fillna(False).mean()), 3)}
+                                for cache, g in lookups.groupby("cache")}
+    spans = df[df["event_type"] == "span"].dropna(subset=["span", "duration_ms"])
+    report["spans_ms"] = {name: {"count": int(len(g)), **{f"p{p}": round(float(np.percentile(g["duration_ms"], p)), 1)
+                                                          for p in PERCENTILES}}
+                          for name, g in spans.groupby("span")}
+    return report
+
+def print_report(report):
+    print(f"Événements : {report['events']}" + (f"  ({report['period'][0]} -> {report['period'][1]})" if report["period"] else ""))
+    print("\nPar type :")
+    for k, v in report["event_counts"].items(): print(f"  {k:<20} {v:>10}")
+    print("\nContexte utilisé :")
+    for k, v in report["context_sources"].items(): print(f"  {k:<20} {v['count']:>10}  {v['ratio']:.1%}")
+    lat = report["latency_s"]
+    print(f"\nLatence question -> réponse ({lat['count']} paires) :")
+    for k, v in lat.items():
+        if k != "count": print(f"  {k:<20} {v:>10.3f} s")
+    print("\nCaches :")
+    for k, v in report["cache_hit_rate"].items(): print(f"  {k:<20} {v['lookups']:>10}  succès {v['hit_rate']:.1%}")
+    if report["spans_ms"]:
+        print("\nÉtapes (ms) :" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES))
+        for k, v in report["spans_ms"].items():
+            print(f"  {k:<20}" + "".join(f"{v['p' + str(p)]:>10.1f}" for p in PERCENTILES) + f"  ({v['count']})")
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compaction Parquet et analyse des logs MCP")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_compact = sub.add_parser("compact", help="Convertit les segments archivés en Parquet")
+    p_compact.add_argument("--logs-dir", default=os.path.dirname(MCP_LOG_FILE), help="Dossier des segments mcp_logs.*")
+    p_compact.add_argument("--out", default=PARQUET_DIR, help="Dossier du dataset Parquet")
+    p_compact.add_argument("--delete", action="store_true", help="Supprime les segments une fois convertis")
+    p_report = sub.add_parser("report", help="Compteurs, part RAG/WEB, latences et caches")
+    p_report.add_argument("--parquet", default=PARQUET_DIR, help="Dossier du dataset Parquet")
+    p_report.add_argument("--since", help="Premier jour inclus (AAAA-MM-JJ)")
+    p_report.add_argument("--until", help="Dernier jour inclus (AAAA-MM-JJ)")
+    p_report.add_argument("--no-live", action="store_true", help="Ignore le fichier mcp_logs.jsonl courant")
+    p_report.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command == "compact":
+        logger.info(f"{compact(args.logs_dir, args.out, args.delete)} segment(s) converti(s)")
+    else:
+        report = build_report(load_events(args.parquet, args.since, args.until, live=not args.no_live))
+        if args.json: print(json.dumps(report, ensure_ascii=False, indent=2))
+        else: print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,216 @@
 # === mcp_client.py ===
 # Module pour enregistrer les événements du Medical Agent IA dans un fichier JSONL (MCP logs)
 # Chaque événement est horodaté et contient le type d'événement + données associées
+# L'écriture se fait dans un thread dédié :
+# - send_to_mcp dépose l'événement dans une file bornée et rend la main immédiatement
+# - le thread écrit les événements par lots (taille max ou délai max) avec un seul open/flush
+# - le fichier tourne au-delà d'une taille max ; les anciens segments sont compressés (zstd ou gzip)
+# - seuls les segments déjà convertis en Parquet (mcp_analytics.py compact) sont supprimés par la rotation
+# - file pleine : l'événement est abandonné (ou le plus ancien, ou attente bornée) et compté
 
 import os           # Pour gérer les chemins de fichiers
 import json         # Pour encoder les données en JSON
 import datetime     # Pour horodatage UTC
+import gzip, shutil # Compression des segments archivés
+import queue, threading, atexit, time  # File bornée, thread d'écriture, vidage à la sortie
+from tracing import current_request_id  # Identifiant de la requête en cours (spans, corrélation)
 
 # === CONFIGURATION DU FICHIER DE LOG ===
 # On crée un chemin absolu vers le fichier mcp_logs.jsonl dans le même dossier que ce script
-MCP_LOG_FILE = os.path.join(os.path.dirname(__file__), "mcp_logs.jsonl")
+MCP_LOG_FILE = os.environ.get("MCP_LOG_FILE", os.path.join(os.path.dirname(__file__), "mcp_logs.jsonl"))
+
+# === CONFIGURATION DE L'ÉCRITURE EN ARRIÈRE-PLAN ===
+MCP_QUEUE_SIZE = int(os.environ.get("MCP_QUEUE_SIZE", "10000"))          # Événements en attente max
+MCP_BATCH_SIZE = int(os.environ.get("MCP_BATCH_SIZE", "200"))            # Écriture dès N événements...
+MCP_FLUSH_INTERVAL = float(os.environ.get("MCP_FLUSH_INTERVAL", "1.0"))  # ...ou au plus tard après N secondes
+MCP_DROP_POLICY = os.environ.get("MCP_DROP_POLICY", "drop_new")          # drop_new | drop_old | block
+MCP_BLOCK_TIMEOUT = float(os.environ.get("MCP_BLOCK_TIMEOUT", "0.05"))   # Attente max (s) en mode block
+MCP_MAX_BYTES = int(os.environ.get("MCP_MAX_BYTES", str(50 * 1024**2)))  # Rotation au-delà de cette taille
+MCP_BACKUP_COUNT = int(os.environ.get("MCP_BACKUP_COUNT", "10"))         # Segments compactés conservés
+MCP_BACKUP_MAX = int(os.environ.get("MCP_BACKUP_MAX", "100"))            # Limite dure, compactés ou non (0 = aucune)
+# Dataset Parquet de mcp_analytics.py : la rotation y lit la liste des segments déjà compactés
+MCP_PARQUET_DIR = os.environ.get("MCP_PARQUET_DIR", "mcp_parquet")
+MCP_COMPACTED_FILE = "_compacted.json"
+MCP_COMPRESSION = os.environ.get("MCP_COMPRESSION", "zstd")              # zstd (si installé) | gzip | none
+MCP_MAX_FIELD_CHARS = int(os.environ.get("MCP_MAX_FIELD_CHARS", "2000")) # Textes longs tronqués (ex : contexte)
+
+def _truncate(payload):
+    """Tronque les chaînes trop longues du payload (le contexte RAG complet n'a pas sa place dans les logs)"""
+    if MCP_MAX_FIELD_CHARS <= 0 or not isinstance(payload, dict): return payload
+    return {k: (v[:MCP_MAX_FIELD_CHARS] + f"… [{len(v)} car.]" if isinstance(v, str) and len(v) > MCP_MAX_FIELD_CHARS else v)
+            for k, v in payload.items()}
+
+class MCPWriter:
+    """Thread d'écriture des événements MCP par lots, avec rotation et compression du fichier"""
+
+    def __init__(self, path=MCP_LOG_FILE, queue_size=MCP_QUEUE_SIZE, batch_size=MCP_BATCH_SIZE,
+                 flush_interval=MCP_FLUSH_INTERVAL, drop_policy=MCP_DROP_POLICY, max_bytes=MCP_MAX_BYTES,
+                 backup_count=MCP_BACKUP_COUNT, compression=MCP_COMPRESSION, backup_max=MCP_BACKUP_MAX,
+                 parquet_dir=MCP_PARQUET_DIR):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.backup_max = backup_max
+        self.parquet_dir = parquet_dir
+        self.compression = compression
+        self.dropped = 0                       # Événements abandonnés (file pleine)
+        self.written = 0                       # Événements écrits
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    # --- Côté agent : ne bloque jamais sur le disque ---
+    def submit(self, line):
+        self._ensure_started()
+        try:
+            if self.drop_policy == "block":
+                self._queue.put(line, timeout=MCP_BLOCK_TIMEOUT)
+            else:
+                self._queue.put_nowait(line)
+        except queue.Full:
+            if self.drop_policy == "drop_old":  # Garde les événements les plus récents
+                try:
+                    self._queue.get_nowait()
+                    self._queue.put_nowait(line)
+                except (queue.Empty, queue.Full):
+                    pass
+            with self._lock: self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Attend que les événements en file soient écrits (sortie du programme, scripts, tests)"""
+        if self._thread is None: return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid(): return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid(): return
+            self._pid = os.getpid()  # Après un fork, le thread du parent n'existe plus
+            self._thread = threading.Thread(target=self._run, name="mcp-writer", daemon=True)
+            self._thread.start()
+
+    # --- Thread d'écriture ---
+    def _run(self):
+        while True:
+            batch, waiters = [], []
+            item = self._queue.get()  # Attente du premier événement
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break  # Vidage demandé : on écrit tout de suite
+                batch.append(item)
+                if len(batch) >= self.batch_size: break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch: self._write(batch)
+            for w in waiters: w.set()
+
+    def _write(self, lines):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+                size = f.tell()
+            self.written += len(lines)
+            if self.max_bytes > 0 and size >= self.max_bytes: self._rotate()
+        except Exception as e:
+            print(f"[MCP ERROR] {e}")
+
+    def _rotate(self):
+        """mcp_logs.jsonl -> mcp_logs.<horodatage>.jsonl(.zst|.gz).
+        Au-delà des backup_count derniers, seuls les segments déjà compactés en Parquet sont supprimés ;
+        les autres attendent la compaction, dans la limite de backup_max segments au total."""
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        base, ext = os.path.splitext(self.path)
+        segment = f"{base}.{stamp}{ext}"
+        os.replace(self.path, segment)
+        self._compress(segment)
+        folder, prefix = os.path.dirname(self.path) or ".", os.path.basename(base) + "."
+        old = sorted(f for f in os.listdir(folder) if f.startswith(prefix) and f != os.path.basename(self.path))
+        compacted = self._compacted()
+        expired = [name for name in old[:max(0, len(old) - self.backup_count)] if name in compacted]
+        kept = [name for name in old if name not in expired]
+        if self.backup_max > 0 and len(kept) > self.backup_max:  # Compaction jamais lancée : disque borné quand même
+            forced = kept[:len(kept) - self.backup_max]
+            print(f"[MCP WARNING] {len(forced)} segment(s) non compacté(s) supprimé(s) (MCP_BACKUP_MAX={self.backup_max})")
+            expired += forced
+        for name in expired:
+            os.remove(os.path.join(folder, name))
+
+    def _compacted(self):
+        """Noms des segments déjà convertis par mcp_analytics.py compact"""
+        try:
+            with open(os.path.join(self.parquet_dir, MCP_COMPACTED_FILE), encoding="utf-8") as f:
+                return set(json.load(f))
+        except (OSError, ValueError):
+            return set()
+
+    def _compress(self, segment):
+        if self.compression == "none": return
+        if self.compression == "zstd":
+            try:
+                import zstandard  # Optionnel : meilleur ratio et plus rapide que gzip
+                with open(segment, "rb") as src, open(segment + ".zst", "wb") as dst:
+                    zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+                os.remove(segment)
+                return
+            except ImportError:
+                pass  # zstandard absent : repli sur gzip
+        with open(segment, "rb") as src, gzip.open(segment + ".gz", "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(segment)
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+_writer = MCPWriter()
+atexit.register(_writer.flush)  # Derniers événements écrits à l'arrêt
 
 # === FONCTION PRINCIPALE : ENVOI VERS MCP ===
 def send_to_mcp(event_type: str, payload: dict):
     """
-    Enregistre un événement dans le fichier MCP logs.
-    
+    Enregistre un événement dans le fichier MCP logs (écriture différée, non bloquante).
+
     Arguments:
         event_type (str): Type de l'événement (ex : 'user_question', 'agent_response')
         payload (dict): Données associées à l'événement
     """
+    # Rattache l'événement à la requête en cours (question -> contexte -> réponse)
+    request_id = current_request_id()
+    if request_id is not None and isinstance(payload, dict) and "request_id" not in payload:
+        payload = {**payload, "request_id": request_id}
+
     # Construire l'entrée de log sous forme de dictionnaire
     log_entry = {
         "timestamp": datetime.datetime.utcnow().isoformat(),  # UTC ISO timestamp
         "event_type": event_type,                              # Type d'événement
-        "payload": payload                                     # Données associées
+        "payload": _truncate(payload)                          # Données associées
     }
 
-    # Écriture sécurisée dans le fichier JSONL (append)
+    # Sérialisation ici (données figées au moment de l'appel), écriture dans le thread dédié
     try:
-        with open(MCP_LOG_FILE, "a", encoding="utf-8") as f:
-            # Chaque ligne du fichier contient un JSON complet
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        _writer.submit(json.dumps(log_entry, ensure_ascii=False) + "\n")
     except Exception as e:
         # En cas d'erreur, afficher un message et le traceback complet
         print(f"[MCP ERROR] {e}")
         import traceback
         traceback.print_exc()
+
+def flush_mcp(timeout=5.0):
+    """Force l'écriture des événements en attente"""
+    _writer.flush(timeout)
+
+def mcp_stats():
+    """Compteurs du writer : en file, écrits, abandonnés"""
+    return _writer.stats()
@@ -0,0 +1,218 @@
+# === onnx_encoder.py - ENCODEUR DE REQUÊTES ONNX RUNTIME (CPU) ===
+# Alternative à PyTorch / sentence-transformers pour encoder les questions avec all-MiniLM-L6-v2 :
+# - modèle exporté en ONNX, quantifié int8 (quantification dynamique) en option
+# - tokenizer "tokenizers" (Rust) : ni torch ni transformers à l'exécution
+# - même pipeline que sentence-transformers : moyenne des jetons (masque d'attention) puis normalisation L2
+# Le choix du moteur se fait par EMBEDDING_BACKEND (torch | onnx | onnx-int8), voir create_embeddings().
+#
+# Usage : python onnx_encoder.py export [--out onnx_model] [--no-quantize]   (nécessite torch + transformers)
+#         python onnx_encoder.py parity [--backend onnx-int8] [--k 5]        (comparaison aux vecteurs PyTorch)
+#         python onnx_encoder.py bench [--queries 200]                       (latence, import, mémoire)
+
+# === Importations ===
+import os, sys, json, time, logging, argparse, subprocess  # Config, chrono, logs, CLI, benchmark isolé
+
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")   # torch | onnx | onnx-int8
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "onnx_model")    # Modèles exportés + tokenizer
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))            # 0 = choix d'ONNX Runtime
+MAX_SEQ_LENGTH = 256                                                 # Comme sentence-transformers pour MiniLM
+FP32_FILE, INT8_FILE, TOKENIZER_FILE = "model.onnx", "model_int8.onnx", "tokenizer.json"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+PARITY_MIN_COSINE = {"onnx": 0.999, "onnx-int8": 0.97}              # Cosinus min vecteur ONNX / PyTorch
+PARITY_MIN_OVERLAP = 0.8                                             # Recouvrement top-k moyen minimal
+
+def _base_class():
+    """Interface LangChain si disponible (le moteur ONNX ne doit pas dépendre de langchain)"""
+    try:
+        from langchain_core.embeddings import Embeddings
+        return Embeddings
+    except ImportError:
+        return object
+
+class OnnxEmbeddings(_base_class()):
+    """Embeddings all-MiniLM-L6-v2 calculés par ONNX Runtime (float32 ou int8)"""
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=True, threads=ONNX_THREADS, batch_size=32):
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} absent : lancer python onnx_encoder.py export")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads: opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+        self.batch_size = batch_size
+        self._np = np
+
+    def _encode(self, texts):
+        np = self._np
+        encodings = self.tokenizer.encode_batch(list(texts))
+        mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]                   # (lot, jetons, 384)
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)  # Moyenne des jetons
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)  # Normalisation L2
+
+    def embed_documents(self, texts):
+        out = []
+        for i in range(0, len(texts), self.batch_size):
+            out.extend(self._encode(texts[i:i + self.batch_size]).tolist())
+        return out
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+def create_embeddings(backend=None, model_name=EMBEDDING_MODEL):
+    """Moteur d'embeddings des requêtes : torch (sentence-transformers) ou ONNX (float32 / int8)"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in BACKENDS: raise ValueError(f"EMBEDDING_BACKEND inconnu: {backend} ({', '.join(BACKENDS)})")
+    if backend == "torch":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+    return OnnxEmbeddings(quantized=backend == "onnx-int8")
+
+# === Export (nécessite torch + transformers, une seule fois) ===
+def export_model(out_dir=ONNX_MODEL_DIR, model_name=EMBEDDING_MODEL, quantize=True):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, TOKENIZER_FILE))  # tokenizer.json (Rust)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["exemple de requête"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    axes = {n: {0: "batch", 1: "tokens"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "tokens"}
+    fp32 = os.path.join(out_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[n] for n in names), fp32, input_names=names,
+                          output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=17, dynamo=False)
+    logger.info(f"Modèle float32 exporté : {fp32} ({os.path.getsize(fp32) / 1e6:.1f} Mo)")
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8 = os.path.join(out_dir, INT8_FILE)
+        quantize_dynamic(fp32, int8, weight_type=QuantType.QInt8)  # Poids int8, activations quantifiées à la volée
+        logger.info(f"Modèle int8 : {int8} ({os.path.getsize(int8) / 1e6:.1f} Mo)")
+    with open(os.path.join(out_dir, "export.json"), "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "max_seq_length": MAX_SEQ_LENGTH, "pooling": "mean", "normalize": True}, f)
+
+# === Vérification de parité ===
+def fixture_texts():
+    """(questions, passages) : bench/questions.txt et paragraphes des documents texte de docs/"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, "bench", "questions.txt"), encoding="utf-8") as f:
+        questions = [l.strip() for l in f if l.strip()]
+    passages = []
+    docs = os.path.join(here, "docs")
+    for name in sorted(os.listdir(docs)):
+        if name.endswith((".txt", ".md")):
+            with open(os.path.join(docs, name), encoding="utf-8", errors="ignore") as f:
+                passages += [p.strip() for p in f.read().split("\n\n") if len(p.strip()) > 40]
+    return questions, passages
+
+def parity(backend="onnx-int8", k=5):
+    """Cosinus ONNX / PyTorch par texte et recouvrement des top-k questions -> passages"""
+    import numpy as np
+    questions, passages = fixture_texts()
+    k = min(k, len(passages))
+    ref, onnx = create_embeddings("torch"), create_embeddings(backend)
+    rq, rp = np.asarray(ref.embed_documents(questions)), np.asarray(ref.embed_documents(passages))
+    oq, op = np.asarray(onnx.embed_documents(questions)), np.asarray(onnx.embed_documents(passages))
+    norm = lambda m: m / np.linalg.norm(m, axis=1, keepdims=True)
+    cos = np.sum(norm(np.vstack([rq, rp])) * norm(np.vstack([oq, op])), axis=1)
+    top = lambda q, p: np.argsort(-(q @ p.T), axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(top(rq, rp), top(oq, op))]
+    report = {"backend": backend, "texts": int(len(cos)), "cosine_mean": round(float(cos.mean()), 5),
+              "cosine_min": round(float(cos.min()), 5), "topk": k, "topk_overlap_mean": round(float(np.mean(overlap)), 3),
+              "topk_overlap_min": round(float(np.min(overlap)), 3)}
+    report["ok"] = report["cosine_min"] >= PARITY_MIN_COSINE[backend] and report["topk_overlap_mean"] >= PARITY_MIN_OVERLAP
+    return report
+
+# === Benchmark (un sous-processus par moteur : import et mémoire mesurés à froid) ===
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"): return int(line.split()[1]) / 1024  # Pic RSS (Linux)
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _bench_worker(backend, n):
+    start = time.perf_counter()
+    emb = create_embeddings(backend)
+    load_s = time.perf_counter() - start
+    questions, _ = fixture_texts()
+    queries = [questions[i % len(questions)] for i in range(n)]
+    emb.embed_query(queries[0])  # Premier appel (allocations, optimisation du graphe)
+    lat = []
+    for q in queries:
+        t = time.perf_counter()
+        emb.embed_query(q)
+        lat.append((time.perf_counter() - t) * 1000)
+    lat.sort()
+    t = time.perf_counter()
+    emb.embed_documents(queries)
+    batch_qps = n / (time.perf_counter() - t)
+    print(json.dumps({"backend": backend, "load_s": round(load_s, 3), "p50_ms": round(lat[len(lat) // 2], 2),
+                      "p95_ms": round(lat[int(len(lat) * 0.95) - 1], 2), "batch_qps": round(batch_qps, 1),
+                      "peak_rss_mb": round(_rss_mb(), 1)}))
+
+def bench(backends=BACKENDS, n=200):
+    results = []
+    for backend in backends:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "_bench-worker", backend, str(n)],
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            logger.error(f"{backend} : échec du benchmark\n{out.stderr[-2000:]}")
+            continue
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encodeur de requêtes ONNX Runtime (export, parité, benchmark)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export", help="Exporte all-MiniLM-L6-v2 en ONNX (+ int8)")
+    p_export.add_argument("--out", default=ONNX_MODEL_DIR)
+    p_export.add_argument("--no-quantize", action="store_true", help="Pas de modèle int8")
+    p_parity = sub.add_parser("parity", help="Compare les vecteurs ONNX aux vecteurs PyTorch")
+    p_parity.add_argument("--backend", choices=["onnx", "onnx-int8"], default="onnx-int8")
+    p_parity.add_argument("--k", type=int, default=5, help="Taille du top-k comparé")
+    p_bench = sub.add_parser("bench", help="Latence, temps de chargement et pic mémoire par moteur")
+    p_bench.add_argument("--queries", type=int, default=200)
+    p_bench.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    p_worker = sub.add_parser("_bench-worker")  # Interne : un moteur mesuré dans un processus neuf
+    p_worker.add_argument("backend", choices=BACKENDS)
+    p_worker.add_argument("n", type=int)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "export":
+        export_model(args.out, quantize=not args.no_quantize)
+    elif args.command == "parity":
+        report = parity(args.backend, args.k)
+        print(json.dumps(report, indent=2))
+        return 0 if report["ok"] else 1
+    elif args.command == "bench":
+        print(f"{'moteur':<10}{'chargement':>12}{'p50 ms':>9}{'p95 ms':>9}{'lot q/s':>10}{'pic RSS':>10}")
+        for r in bench(args.backends, args.queries):
+            print(f"{r['backend']:<10}{r['load_s']:>11.2f}s{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+                  f"{r['batch_qps']:>10.1f}{r['peak_rss_mb']:>8.0f}Mo")
+    else:
+        _bench_worker(args.backend, args.n)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# === parallel_embeddings.py - MOTEUR D'EMBEDDINGS PARALLÈLE (INGESTION) ===
+# Répartit les morceaux de texte sur un pool de processus CPU :
+# - chaque worker charge le modèle sentence-transformers une seule fois
+# - l'encodage se fait par lots (batch_size réglable)
+# - les vecteurs sont renvoyés au fil de l'eau (par shard) vers le constructeur FAISS,
+#   sans jamais matérialiser l'ensemble des vecteurs en mémoire
+
+# === Importations ===
+import os, logging, itertools                                 # Variables d'env, logs, flux de shards
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing as mp                                  # Contexte "spawn" (compatible torch)
+from langchain_core.embeddings import Embeddings              # Interface LangChain des embeddings
+
+logger = logging.getLogger(__name__)
+
+# === Configuration par défaut ===
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_AUTO_WORKERS = 8  # Chaque worker charge son modèle (~300 Mo avec torch) : plafond du réglage automatique
+# 1 = encodage dans le processus courant ; par défaut un worker par cœur, au plus MAX_AUTO_WORKERS
+DEFAULT_WORKERS = int(os.environ.get("EMBED_WORKERS", str(min(os.cpu_count() or 1, MAX_AUTO_WORKERS))))
+DEFAULT_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64")) # Taille des lots passés au modèle
+DEFAULT_SHARD_SIZE = int(os.environ.get("EMBED_SHARD_SIZE", "512"))# Nombre de textes envoyés à un worker
+
+# === Côté worker ===
+_worker_model = None  # Modèle chargé une fois par processus
+
+def _init_worker(model_name, threads):
+    """Initialisation d'un worker : limite les threads torch puis charge le modèle"""
+    global _worker_model
+    import torch
+    torch.set_num_threads(max(1, threads))  # Évite la sur-souscription des cœurs entre workers
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+def _encode_shard(texts, batch_size):
+    """Encode un shard de textes en float32 (numpy)"""
+    vectors = _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    return vectors.astype("float32", copy=False)
+
+# === Moteur ===
+class ParallelEmbeddings(Embeddings):
+    """Embeddings LangChain encodés par un pool de processus, avec un flux (payload, vecteurs)"""
+
+    def __init__(self, model_name=DEFAULT_MODEL, workers=DEFAULT_WORKERS,
+                 batch_size=DEFAULT_BATCH_SIZE, shard_size=DEFAULT_SHARD_SIZE, max_in_flight=None):
+        self.model_name = model_name
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.shard_size = max(1, int(shard_size))
+        self.max_in_flight = max_in_flight or self.workers * 2  # Shards en cours (borne mémoire)
+        self._pool = None
+        self._local_ready = False
+
+    # --- Gestion du pool ---
+    def _get_pool(self):
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            logger.info(f"Démarrage du pool d'embeddings: {self.workers} workers x {threads} thread(s)")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"),
+                                             initializer=_init_worker, initargs=(self.model_name, threads))
+        return self._pool
+
+    def _encode_local(self, texts):
+        if not self._local_ready:
+            _init_worker(self.model_name, os.cpu_count() or 1)
+            self._local_ready = True
+        return _encode_shard(texts, self.batch_size)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    # --- Flux principal ---
+    def _shards(self, items):
+        payloads, texts = [], []
+        for payload, text in items:
+            payloads.append(payload); texts.append(text)
+            if len(texts) >= self.shard_size:
+                yield payloads, texts
+                payloads, texts = [], []
+        if texts: yield payloads, texts
+
+    def stream(self, items):
+        """items: itérable de (payload, texte). Produit (payloads, vecteurs) shard par shard,
+        dans l'ordre d'achèvement ; au plus max_in_flight shards sont en mémoire à la fois.
+        Un seul shard (petite mise à jour incrémentale) : encodé sur place, sans démarrer le pool."""
+        shards = self._shards(items)
+        first = next(shards, None)
+        if first is None: return
+        if self.workers == 1 or (len(first[1]) < self.shard_size and self._pool is None):
+            yield first[0], self._encode_local(first[1])
+            for payloads, texts in shards:
+                yield payloads, self._encode_local(texts)
+            return
+        pool, pending = self._get_pool(), {}
+        for payloads, texts in itertools.chain([first], shards):
+            pending[pool.submit(_encode_shard, texts, self.batch_size)] = payloads
+            if len(pending) >= self.max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done: yield pending.pop(fut), fut.result()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done: yield pending.pop(fut), fut.result()
+
+    # --- Interface LangChain ---
+    def embed_documents(self, texts):
+        ordered = [None] * len(texts)
+        for positions, vectors in self.stream(enumerate(texts)):
+            for pos, vec in zip(positions, vectors): ordered[pos] = vec.tolist()
+        return ordered
+
+    def embed_query(self, text):
+        return self._encode_local([text])[0].tolist()
@@ -0,0 +1,168 @@
+# === pdf_export.py - EXPORT PDF DES CONVERSATIONS EN ARRIÈRE-PLAN ===
+# L'export construisait le PDF dans la requête Streamlit (page figée sur les longues conversations),
+# remplaçait les caractères non-ASCII par "?" et cherchait DejaVuSansCondensed.ttf à chaque appel.
+# - génération dans un pool de threads dédié : l'interface reçoit un identifiant de tâche à interroger
+# - PDF mis en cache sur disque, clé = hash de la conversation (réexport identique immédiat)
+# - police Unicode fournie (fonts/DejaVuSans.ttf, surchargeable par PDF_FONT), résolue et analysée
+#   une seule fois par processus : chaque PDF part d'une copie d'un document modèle où elle est déjà chargée
+#
+# Usage : job_id = submit_export(messages) ; get_job(job_id).status -> pending / running / done / error
+
+# === Importations ===
+import os, copy, json, time, glob, hashlib, logging, threading  # Fichiers, modèle copié, hash, logs, verrous
+from concurrent.futures import ThreadPoolExecutor          # Workers de génération
+from tracing import traced                                 # Durée de génération (span pdf_export)
+
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+PDF_DIR = os.environ.get("PDF_DIR", "mes_pdfs")                 # PDF générés (et cache)
+PDF_FONT = os.environ.get("PDF_FONT")                           # Police TTF Unicode (sinon recherche)
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "1"))           # Générations simultanées
+PDF_CACHE_MAX = int(os.environ.get("PDF_CACHE_MAX", "200"))     # PDF conservés dans PDF_DIR
+PDF_JOB_TTL = 3600                                              # Tâches terminées oubliées après (s)
+PDF_LAYOUT_VERSION = "1"                                        # À changer si la mise en page change (invalide le cache)
+
+BUNDLED_FONT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSans.ttf")  # Fournie avec le projet
+FONT_CANDIDATES = [
+    BUNDLED_FONT, "DejaVuSansCondensed.ttf", "DejaVuSans.ttf", os.path.join("fonts", "DejaVuSans.ttf"),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf", "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/Supplemental/Arial Unicode.ttf", r"C:\Windows\Fonts\arial.ttf",
+]
+
+# === Police ===
+_font_path = None
+_font_resolved = False
+
+def font_path():
+    """Chemin de la police Unicode (cherchée une seule fois) ou None (police intégrée Latin-1)"""
+    global _font_path, _font_resolved
+    if not _font_resolved:
+        candidates = [PDF_FONT] if PDF_FONT else []
+        candidates += FONT_CANDIDATES
+        try:  # DejaVuSans fourni avec matplotlib s'il est installé
+            import importlib.util
+            spec = importlib.util.find_spec("matplotlib")
+            if spec and spec.origin:
+                candidates.append(os.path.join(os.path.dirname(spec.origin), "mpl-data", "fonts", "ttf", "DejaVuSans.ttf"))
+        except (ImportError, ValueError):
+            pass
+        _font_path = next((p for p in candidates if p and os.path.isfile(p)), None)
+        if _font_path is None:  # fonts/DejaVuSans.ttf retiré du déploiement
+            logger.error(f"Police Unicode introuvable ({BUNDLED_FONT}, PDF_FONT) : caractères hors Latin-1 remplacés")
+        _font_resolved = True
+    return _font_path
+
+_template = None
+_template_lock = threading.Lock()
+
+def _new_pdf():
+    """FPDF vierge, police Unicode déjà chargée : copie d'un modèle (add_font analyse le fichier TTF, ~30 ms)"""
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                from fpdf import FPDF  # Génération PDF
+                template = FPDF()
+                template.set_auto_page_break(True, margin=15)
+                if font_path(): template.add_font("Unicode", "", font_path())
+                _template = template
+    return copy.deepcopy(_template)  # Le modèle n'est jamais modifié : copies indépendantes entre threads
+
+# === Génération ===
+def conversation_key(messages):
+    """Hash de la conversation (et de la mise en page) : clé du cache"""
+    payload = json.dumps([PDF_LAYOUT_VERSION, font_path(), [list(m) for m in messages]], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+@traced("pdf_export")
+def render_pdf(messages, path):
+    """Écrit le PDF de messages [(role, contenu)] (role "user" = utilisateur, sinon agent)"""
+    pdf = _new_pdf()
+    pdf.add_page()
+    if font_path():
+        pdf.set_font("Unicode", size=11)
+        clean = str
+    else:
+        pdf.set_font("Helvetica", size=11)
+        clean = lambda text: text.encode("latin-1", "replace").decode("latin-1")  # Accents français conservés
+    for role, content in messages:
+        label = "Utilisateur" if role == "user" else "Agent"
+        pdf.multi_cell(0, 6, clean(f"{label} : {content}"), new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(4)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pdf.output(tmp)
+    os.replace(tmp, path)  # Jamais de PDF partiel visible dans le cache
+    logger.info(f"PDF généré: {path}")
+    return path
+
+def _evict(dossier):
+    """Supprime les PDF les plus anciens au-delà de PDF_CACHE_MAX"""
+    files = sorted(glob.glob(os.path.join(dossier, "conversation_*.pdf")), key=os.path.getmtime)
+    for old in files[:max(0, len(files) - PDF_CACHE_MAX)]:
+        try: os.remove(old)
+        except OSError: pass
+
+def export_pdf(messages, dossier=PDF_DIR):
+    """Chemin du PDF de la conversation (depuis le cache ou généré maintenant)"""
+    os.makedirs(dossier, exist_ok=True)
+    path = os.path.join(dossier, f"conversation_{conversation_key(messages)}.pdf")
+    if os.path.exists(path):
+        os.utime(path)  # Récemment utilisé : conservé par l'éviction
+        return path
+    render_pdf(messages, path)
+    _evict(dossier)
+    return path
+
+# === Tâches en arrière-plan ===
+class ExportJob:
+    """Export en cours ou terminé : status pending / running / done / error"""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = "pending"
+        self.path = None
+        self.error = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "error")
+
+_executor = None
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def _run(job, messages, dossier):
+    job.status = "running"
+    try:
+        job.path = export_pdf(messages, dossier)
+        job.status = "done"
+    except Exception as e:
+        logger.error(f"Erreur export PDF: {e}")
+        job.error, job.status = str(e), "error"
+    job.finished_at = time.time()
+
+def submit_export(messages, dossier=PDF_DIR):
+    """Lance l'export et renvoie l'identifiant de tâche (même conversation = même tâche)"""
+    global _executor
+    messages = [tuple(m) for m in messages]
+    job_id = conversation_key(messages)
+    with _jobs_lock:
+        now = time.time()
+        for old in [j for j in _jobs.values() if j.finished_at and now - j.finished_at > PDF_JOB_TTL]:
+            del _jobs[old.id]
+        job = _jobs.get(job_id)
+        if job is not None and job.status != "error" and (not job.done or os.path.exists(job.path)):
+            return job_id  # Export identique déjà lancé ou terminé
+        job = _jobs[job_id] = ExportJob(job_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="pdf-export")
+    _executor.submit(_run, job, messages, dossier)
+    return job_id
+
+def get_job(job_id):
+    """ExportJob ou None (identifiant inconnu ou expiré)"""
+    with _jobs_lock:
+        return _jobs.get(job_id)
@@ -1,11 +1,14 @@
 # === Importations ===
-import os, time, json, logging, requests  # Gestion fichiers, temps, JSON, logging, requêtes HTTP
-from datetime import datetime              # Pour les dates (PDF et logs)
-from fpdf import FPDF                      # Génération PDF
-import autogen                             # Création des agents AI (Assistant / UserProxy)
-from langchain_community.vectorstores import FAISS            # Vectorstore local pour RAG
-from langchain_community.embeddings import HuggingFaceEmbeddings  # Embeddings pour transformer texte en vecteurs
+# Les bibliothèques lourdes (autogen, langchain, sentence-transformers, fpdf, requests) sont importées
+# à la première utilisation : l'import du module reste rapide, warm_up() les charge en arrière-plan.
+import time; _IMPORT_START = time.perf_counter()  # Chronométrage de l'import du module
+import os, json, logging, threading, asyncio, weakref  # Fichiers, JSON, logging, verrous, async, clients par boucle
 from mcp_client import send_to_mcp         # Envoi événements au MCP (monitoring)
+from web_cache import WebSearchCache       # Cache persistant (SQLite) des recherches web
+from context_packer import pack_documents, count_tokens, context_budget  # Contexte borné en tokens
+from tracing import span, record, request_trace, bind_request, current_request_id, new_request_id  # Spans + histogrammes
+from pdf_export import export_pdf, PDF_DIR  # Export PDF (cache par hash, police Unicode)
+from conversation_memory import ConversationMemory, memory_from_history, truncate_sentences  # Résumé glissant
 
 # === Logging ===
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")  # Format des logs
@@ -17,111 +20,264 @@ llm_config = {"model": "mistral-medium-2508", "temperature": 0.7}  # Modèle LLM
 
 if USE_CLOUD:  # Si on utilise Mistral Cloud
     llm_config.update({
-        "base_url": "https://api.mistral.ai/v1",                 # URL API Mistral
+        "base_url": os.environ.get("LLM_BASE_URL", "https://api.mistral.ai/v1"),  # URL API Mistral
         "api_key": os.environ.get("MISTRAL_API_KEY", "")         # Récupération clé API depuis l'env
     })
     if not llm_config["api_key"]:
         logger.warning("❌ MISTRAL_API_KEY non défini. LLM ne fonctionnera pas.")  # Warning si clé absente
 else:  # Si on utilise Ollama local
     llm_config.update({
-        "base_url": "http://localhost:11434/v1",  # URL locale Ollama
+        "base_url": os.environ.get("LLM_BASE_URL", "http://localhost:11434/v1"),  # URL locale Ollama
         "api_key": "ollama"                        # Clé par défaut pour Ollama
     })
 
+# === Pool de connexions vers le backend LLM ===
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "20"))  # Connexions simultanées max
+LLM_KEEPALIVE = int(os.environ.get("LLM_KEEPALIVE", "10"))               # Connexions gardées ouvertes (keep-alive)
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))                 # Timeout des appels LLM (s)
+
+# === Recherche (RAG / Web) ===
+RAG_MAX_DISTANCE = float(os.environ.get("RAG_MAX_DISTANCE", "1.2"))  # Distance L2 max d'un document jugé pertinent
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "1") == "1"           # BM25 + vecteurs fusionnés (RRF)
+RETRIEVAL_SOCKET = os.environ.get("RETRIEVAL_SOCKET")                 # Service de recherche partagé (retrieval_daemon.py)
+SERPER_URL = os.environ.get("SERPER_URL", "https://google.serper.dev/search")  # Endpoint Serper.dev (ou bouchon local)
+SERPER_TIMEOUT = float(os.environ.get("SERPER_TIMEOUT", "10"))        # Timeout lecture recherche web (s)
+SERPER_CONNECT_TIMEOUT = float(os.environ.get("SERPER_CONNECT_TIMEOUT", "3"))  # Timeout connexion (s)
+SERPER_RETRIES = int(os.environ.get("SERPER_RETRIES", "2"))           # Nouvelles tentatives (erreurs réseau / 429 / 5xx)
+
+# === Embeddings et cache sémantique ===
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"           # Modèle partagé RAG / cache
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE", "1") == "1"  # Active le cache sémantique des réponses
+
 # === Mémoire globale et cache ===
 chat_history = []      # Historique global de la session (questions/réponses)
 _vector_db = None      # Objet FAISS (chargé à la demande)
-WEB_SEARCH_CACHE = {}  # Cache résultats recherche web
+_llm_client = None     # Client OpenAI partagé (pool HTTP keep-alive)
+_agents = None         # Agents Autogen partagés (user_proxy, assistant)
+_embeddings = None     # Modèle d'embeddings partagé (RAG + cache sémantique)
+_semantic_cache = None # Cache sémantique des réponses
+_memory = None         # Mémoire des conversations (résumé glissant)
+# Un verrou par objet partagé : le chargement de l'index ne bloque pas la création du client LLM ou de la mémoire.
+# Verrous imbriqués sans cycle : vector_db / semantic_cache -> embeddings -> retrieval_client.
+_retrieval_client_lock = threading.Lock()
+_embeddings_lock = threading.Lock()
+_vector_db_lock = threading.Lock()
+_warmup_lock = threading.Lock()
+_llm_client_lock = threading.Lock()
+_http_session_lock = threading.Lock()
+_async_http_lock = threading.Lock()
+_agents_lock = threading.Lock()
+_semantic_cache_lock = threading.Lock()
+_memory_lock = threading.Lock()
+_http_session = None   # Session HTTP partagée (recherche web)
+_async_http_clients = weakref.WeakKeyDictionary()  # Client httpx asynchrone par boucle asyncio (recherche web)
+_retrieval_client = None  # Client du service de recherche partagé (si RETRIEVAL_SOCKET)
+WEB_SEARCH_CACHE = WebSearchCache()  # Cache résultats recherche web (SQLite, TTL, borné)
+STARTUP_TIMINGS = {}   # Durée (s) de chaque phase de démarrage (import, modèle, index, agents...)
+_warmup_thread = None  # Thread de préchargement (warm_up)
 
 # === Chargement Vectorstore FAISS ===
+def get_retrieval_client():
+    global _retrieval_client
+    if _retrieval_client is None:
+        with _retrieval_client_lock:
+            if _retrieval_client is None:
+                from retrieval_daemon import RetrievalClient
+                _retrieval_client = RetrievalClient(RETRIEVAL_SOCKET)
+    return _retrieval_client
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                if RETRIEVAL_SOCKET:  # Modèle détenu par le service partagé : pas de copie locale
+                    from retrieval_daemon import RemoteEmbeddings
+                    _embeddings = RemoteEmbeddings(get_retrieval_client())
+                else:
+                    from onnx_encoder import create_embeddings  # Texte -> vecteurs (EMBEDDING_BACKEND : torch / onnx / onnx-int8)
+                    _embeddings = create_embeddings(model_name=EMBEDDING_MODEL)
+                    from embedding_scheduler import BatchedEmbeddings, EMBED_BATCH_WINDOW_MS
+                    if EMBED_BATCH_WINDOW_MS > 0:  # Requêtes simultanées encodées en un seul lot
+                        _embeddings = BatchedEmbeddings(_embeddings)
+    return _embeddings
+
+def embedding_scheduler_stats():
+    """Métriques du micro-batching des embeddings (None si inactif dans ce processus)"""
+    return _embeddings.stats() if hasattr(_embeddings, "stats") else None
+
 def get_vector_db():
     global _vector_db
     if _vector_db is None:  # Charger FAISS uniquement si pas déjà chargé
-        try:
-            logger.info("Chargement du vectorstore FAISS...")
-            start = time.time()
-            _vector_db = FAISS.load_local(
-                "vectorstore",  # Dossier contenant le vectorstore FAISS
-                HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),  # Embeddings
-                allow_dangerous_deserialization=True  # Permet chargement potentiellement non sécurisé
-            )
-            logger.info(f"✓ Vectorstore chargé en {time.time()-start:.2f}s")  # Temps de chargement
-        except Exception as e:
-            logger.error(f"Erreur vectorstore: {e}")  # Log erreur si échec
-            _vector_db = None
+        with _vector_db_lock:  # Une question arrivant pendant warm_up() attend le chargement en cours
+            if _vector_db is None:
+                try:
+                    embeddings = get_embeddings()
+                    logger.info("Chargement du vectorstore FAISS...")
+                    start = time.time()
+                    from vector_index import load_vectorstore
+                    _vector_db = load_vectorstore("vectorstore", embeddings)  # Index FAISS + docstore SQLite
+                    logger.info(f"✓ Vectorstore chargé en {time.time()-start:.2f}s")  # Temps de chargement
+                except Exception as e:
+                    logger.error(f"Erreur vectorstore: {e}")  # Log erreur si échec
+                    _vector_db = None
     return _vector_db  # Retourne le vectorstore
 
+# === Préchargement (warm-up) ===
+def _timed_phase(name, fn):
+    start = time.perf_counter()
+    try:
+        return fn()
+    except Exception as e:
+        logger.error(f"Démarrage - {name} en échec: {e}")
+    finally:
+        STARTUP_TIMINGS[name] = round(time.perf_counter() - start, 3)
+        logger.info(f"Démarrage - {name}: {STARTUP_TIMINGS[name]:.2f}s")
+
+def _warm_up():
+    _timed_phase("embeddings", get_embeddings)      # Modèle sentence-transformers (torch)
+    if RETRIEVAL_SOCKET: _timed_phase("retrieval_service", lambda: get_retrieval_client().call("ping"))
+    else: _timed_phase("vector_db", get_vector_db)  # Index FAISS + docstore
+    _timed_phase("llm_client", get_llm_client)      # Client OpenAI (pool HTTP)
+    _timed_phase("semantic_cache", get_semantic_cache)
+    send_to_mcp("startup_timings", dict(STARTUP_TIMINGS))
+
+def warm_up(background=True):
+    """Charge le modèle d'embeddings, l'index et les agents (une seule fois par processus).
+    background=True : dans un thread, pour que l'interface s'affiche pendant le chargement."""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_warm_up, name="pp_agent-warmup", daemon=True)
+            _warmup_thread.start()
+    if not background: _warmup_thread.join()
+    return _warmup_thread
+
 # === RAG : recherche dans les documents internes ===
-def retrieve_docs(query, k=3):
+def _search_docs(db, query, k):
+    """[(Document, distance L2 ou None)] : hybride BM25 + vecteurs si activé, sinon vectoriel seul"""
+    if HYBRID_SEARCH:
+        from hybrid_search import hybrid_search
+        return hybrid_search(db, query, k)  # Classement RRF conservé
+    with span("vector_search", k=k):  # Embedding de la question + recherche FAISS
+        return sorted(db.similarity_search_with_score(query, k=k), key=lambda t:t[1])
+
+def _rag_lookup(query, k=3):
+    """Recherche interne : (contexte formaté, meilleure distance L2 ou None).
+    None : rien de trouvé, ou seulement des documents trouvés par BM25 (sans distance vectorielle) ;
+    ces documents restent dans le contexte mais ne suffisent pas à écarter la recherche web."""
+    if RETRIEVAL_SOCKET:  # Recherche déléguée au service partagé
+        from retrieval_daemon import RetrievalError
+        try:
+            return get_retrieval_client().retrieve(query, k)
+        except RetrievalError as e:
+            logger.error(f"Erreur retrieve_docs: {e}")
+            return "Erreur: Base de documents indisponible.", None
     db = get_vector_db()  # Récupération vectorstore
-    if db is None: return "Erreur: Base de documents indisponible."
+    if db is None: return "Erreur: Base de documents indisponible.", None
     try:
-        results = db.similarity_search_with_score(query, k=k)  # Recherche des k documents les plus proches
-        if not results: return "Aucun document pertinent trouvé."
-        # Formate les résultats avec source et contenu
-        parts = [f"- Source: {doc.metadata.get('source','Inconnu')}\n{doc.page_content}" for doc, score in sorted(results, key=lambda t:t[1])]
-        return "Source: Document interne\n" + "\n\n".join(parts)
+        results = _search_docs(db, query, k)  # Recherche des k documents les plus proches
+        if not results: return "Aucun document pertinent trouvé.", None
+        # Phrases dédoublonnées et les plus proches de la question, dans le budget du modèle
+        with span("context_pack"):
+            packed = pack_documents([(doc.metadata.get('source','Inconnu'), doc.page_content) for doc, _ in results],
+                                    query, context_budget(llm_config["model"]))
+        parts = [f"- Source: {source}\n{text}" for source, text in packed]
+        best = min((float(score) for _, score in results if score is not None), default=None)
+        return "Source: Document interne\n" + "\n\n".join(parts), best
     except Exception as e:
         logger.error(f"Erreur retrieve_docs: {e}")
-        return f"Erreur recherche interne: {e}"
+        return f"Erreur recherche interne: {e}", None
+
+def retrieve_docs(query, k=3):
+    return _rag_lookup(query, k)[0]
+
+# === Choix du contexte : documents internes ou web (mêmes règles en sync et en async) ===
+def _rag_is_relevant(best):
+    """Document interne assez proche (distance L2 vectorielle) pour se passer de la recherche web"""
+    return best is not None and best <= RAG_MAX_DISTANCE
+
+def _choose_context(rag_context, web_context):
+    """(contexte, "RAG" | "WEB") quand le RAG n'est pas pertinent : le web, sauf si la recherche web
+    échoue alors que des documents internes (éloignés ou trouvés par BM25 seul) sont disponibles"""
+    rag_found = rag_context.startswith("Source: Document interne")
+    web_failed = web_context.startswith("Erreur") or web_context.startswith("Aucun résultat")
+    if rag_found and web_failed: return rag_context, "RAG"
+    return web_context, "WEB"
 
 # === Recherche web ===
+def _serper_headers():
+    return {"X-API-KEY": os.environ.get("SERPER_API_KEY",""), "Content-Type":"application/json"}
+
+def _format_serper(data):
+    if "organic" not in data or not data["organic"]: return None
+    top = data["organic"][0]  # Premier résultat
+    return f"Source: Recherche Web\nTitre: {top.get('title')}\nRésumé: {top.get('snippet')}\nLien: {top.get('link')}"
+
+def _web_cache_get(query):
+    cached = WEB_SEARCH_CACHE.get(query)
+    send_to_mcp("cache_lookup", {"cache": "web", "hit": cached is not None})
+    return cached
+
 def search_web(query):
-    if query in WEB_SEARCH_CACHE: return WEB_SEARCH_CACHE[query]  # Retour cache si déjà recherché
-    url = "https://google.serper.dev/search"
-    headers = {"X-API-KEY": os.environ.get("SERPER_API_KEY",""), "Content-Type":"application/json"}
-    payload = {"q": query}
+    with span("web_search") as sp:
+        cached = _web_cache_get(query)
+        sp["cached"] = cached is not None
+        if cached is not None: return cached  # Retour cache si déjà recherché
+        return _serper_search(query)
+
+def _serper_search(query):
     try:
-        resp = requests.post(url, headers=headers, json=payload)  # Requête HTTP
+        resp = get_http_session().post(SERPER_URL, headers=_serper_headers(), json={"q": query},
+                                       timeout=(SERPER_CONNECT_TIMEOUT, SERPER_TIMEOUT))  # Requête HTTP
         resp.raise_for_status()  # Vérifie succès HTTP
-        data = resp.json()
-        if "organic" not in data or not data["organic"]: return "Aucun résultat trouvé sur le web."
-        top = data["organic"][0]  # Premier résultat
-        result = f"Source: Recherche Web\nTitre: {top.get('title')}\nRésumé: {top.get('snippet')}\nLien: {top.get('link')}"
-        WEB_SEARCH_CACHE[query] = result  # Ajoute au cache
+        result = _format_serper(resp.json())
+        if result is None: return "Aucun résultat trouvé sur le web."
+        WEB_SEARCH_CACHE.set(query, result)  # Ajoute au cache
         return result
     except Exception as e:
         logger.error(f"Erreur search_web: {e}")
         return f"Erreur recherche web: {e}"
 
-# === Export PDF de l'historique ===
-def export_to_pdf(history, dossier="mes_pdfs"):
-    os.makedirs(dossier, exist_ok=True)  # Crée dossier si inexistant
-    filename = f"session_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.pdf"
-    path = os.path.join(dossier, filename)
-
-    def clean(text):
-        # Nettoie les caractères non-ASCII (pour PDF)
-        return ''.join(c if ord(c)<128 or c in "àâäéèêëîïôöùûüçÀÂÄÉÈÊËÎÏÔÖÙÛÜÇ" else "?" for c in text)
-
-    pdf = FPDF()
-    pdf.set_auto_page_break(True, margin=15)
-    pdf.add_page()
+async def search_web_async(query):
+    """Version asynchrone (annulable) de search_web, partageant le même cache"""
+    with span("web_search", mode="async") as sp:
+        cached = await asyncio.to_thread(_web_cache_get, query)
+        sp["cached"] = cached is not None
+        if cached is not None: return cached
+        return await _serper_search_async(query)
+
+async def _serper_search_async(query):
     try:
-        pdf.add_font("DejaVu","", "DejaVuSansCondensed.ttf", uni=True)  # Police Unicode si dispo
-        pdf.set_font("DejaVu", size=12)
-    except:
-        pdf.set_font("Arial", size=12)  # Police fallback
-    for q,r in history:  # Parcours de l’historique
-        pdf.multi_cell(0,10,f"Utilisateur: {clean(q)}")
-        pdf.multi_cell(0,10,f"Agent: {clean(r)}")
-        pdf.ln(5)
-    pdf.output(path)
-    logger.info(f"PDF généré: {path}")
-    return path
+        resp = await get_async_http_client().post(SERPER_URL, headers=_serper_headers(), json={"q": query})
+        resp.raise_for_status()
+        result = _format_serper(resp.json())
+        if result is None: return "Aucun résultat trouvé sur le web."
+        await asyncio.to_thread(WEB_SEARCH_CACHE.set, query, result)
+        return result
+    except Exception as e:
+        logger.error(f"Erreur search_web: {e}")
+        return f"Erreur recherche web: {e}"
+
+# === Export PDF de l'historique ===
+def export_to_pdf(history, dossier=PDF_DIR):
+    """PDF de l'historique [(question, réponse)] (synchrone ; l'interface passe par pdf_export.submit_export)"""
+    return export_pdf([m for q, r in history for m in (("user", q), ("assistant", r))], dossier)
 
 # === Création agents Autogen ===
-def create_agents():
-    assistant = autogen.AssistantAgent(
-        name="medical_agent",
-        system_message="""Tu es un assistant médical.
+SYSTEM_MESSAGE = """Tu es un assistant médical.
         Règles:
         - Utilise d'abord retrieve_docs.
         - Si aucun document interne, utilise search_web.
         - Ne jamais inventer d'informations.
         - Réponds clairement en citant la source.
-        - Termine toujours par: "Souhaitez-vous des informations complémentaires sur ce sujet ?"
-        {memory}""",
+        - Termine toujours par: "Souhaitez-vous des informations complémentaires sur ce sujet ?\""""
+
+def create_agents():
+    import autogen  # Création des agents AI (Assistant / UserProxy)
+    assistant = autogen.AssistantAgent(
+        name="medical_agent",
+        system_message=SYSTEM_MESSAGE,
         llm_config=llm_config,
         max_consecutive_auto_reply=1  # Limite réponses automatiques consécutives
     )
@@ -133,32 +289,291 @@ def create_agents():
     )
     return user_proxy, assistant
 
-# === Répondre à une question ===
-def answer_question(user_input, chat_history_local=None):
-    global chat_history
-    local_history = chat_history_local if chat_history_local else chat_history  # Historique local si fourni
-    send_to_mcp("user_question", {"question": user_input})  # Envoi événement MCP
-    memory_lines = [f"- Q: {q}\n- R: {r[:300]}" for q,r in local_history[-2:]]  # Historique récent (2 derniers)
-    memory_text = "Historique récent:\n" + "\n".join(memory_lines) if memory_lines else ""
-    context = retrieve_docs(user_input)  # Recherche interne d’abord
-    used = "RAG"
-    if "Erreur" in context or "Aucun document" in context:  # Si RAG échoue
-        context = search_web(user_input)  # Recherche web
-        used = "WEB"
-    send_to_mcp("context_used", {"context": context, "used": used})  # MCP context
-    user_prompt = f"""{memory_text}
+# === Pool d'agents et de clients LLM (partagés entre questions et sessions Streamlit) ===
+def get_llm_client():
+    """Client OpenAI unique du processus : connexions TCP/TLS réutilisées (keep-alive).
+    Le client est thread-safe ; l'historique et le contexte sont passés à chaque appel."""
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                import httpx
+                from openai import OpenAI
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                        max_keepalive_connections=LLM_KEEPALIVE),
+                    timeout=LLM_TIMEOUT)
+                _llm_client = OpenAI(base_url=llm_config["base_url"], api_key=llm_config["api_key"],
+                                     http_client=http_client)
+    return _llm_client
+
+def get_http_session():
+    """Session requests partagée : connexions réutilisées et nouvelles tentatives avec backoff"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+                retry = Retry(total=SERPER_RETRIES, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=frozenset({"POST"}))
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_maxsize=LLM_MAX_CONNECTIONS, max_retries=retry))
+                session.mount("http://", HTTPAdapter(pool_maxsize=LLM_MAX_CONNECTIONS, max_retries=retry))
+                _http_session = session
+    return _http_session
+
+def get_async_http_client():
+    """Client httpx asynchrone partagé par les requêtes d'une même boucle asyncio (connexions réutilisées).
+    Une connexion httpx appartient à la boucle qui l'a ouverte : un client par boucle, oublié avec elle."""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        with _async_http_lock:
+            client = _async_http_clients.get(loop)
+            if client is None:
+                import httpx
+                client = _async_http_clients[loop] = httpx.AsyncClient(
+                    timeout=httpx.Timeout(SERPER_TIMEOUT, connect=SERPER_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_KEEPALIVE),
+                    transport=httpx.AsyncHTTPTransport(retries=SERPER_RETRIES))  # Nouvelles tentatives de connexion
+    return client
+
+def get_agents():
+    """Agents Autogen créés une seule fois puis réutilisés (et leur client OpenAI avec eux).
+    Non utilisés pour répondre : generate_reply tient des compteurs de réponses automatiques par
+    interlocuteur (max_consecutive_auto_reply), partagés entre requêtes et threads."""
+    global _agents
+    if _agents is None:
+        with _agents_lock:
+            if _agents is None:
+                _agents = create_agents()
+    return _agents
+
+# === Cache sémantique des réponses ===
+def get_semantic_cache():
+    """Cache sémantique partagé (None si désactivé ou indisponible)"""
+    global _semantic_cache
+    if SEMANTIC_CACHE_ENABLED and _semantic_cache is None:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                try:
+                    from semantic_cache import SemanticCache
+                    _semantic_cache = SemanticCache(get_embeddings())
+                except Exception as e:
+                    logger.error(f"Cache sémantique indisponible: {e}")
+                    return None
+    return _semantic_cache
+
+def _cache_lookup(user_input, context, memory_text=""):
+    """(réponse en cache ou None, clé à passer à _cache_store).
+    La clé couvre le contexte, la mémoire de la conversation et le modèle : une réponse
+    n'est réutilisée que si le LLM aurait reçu le même prompt (à la formulation près)."""
+    cache = get_semantic_cache()
+    if cache is None: return None, None
+    try:
+        from semantic_cache import context_hash
+        with span("embed_query", use="semantic_cache"):
+            key = (cache.embed(user_input), user_input, context_hash(context, memory_text, llm_config["model"]))
+        answer, similarity = cache.lookup(key[0], key[2])
+        send_to_mcp("cache_lookup", {"cache": "semantic", "hit": answer is not None, "similarity": similarity})
+        return answer, key
+    except Exception as e:
+        logger.error(f"Erreur cache sémantique: {e}")
+        return None, None
+
+def _cache_store(key, answer):
+    cache = get_semantic_cache()
+    if cache is None or key is None or answer.startswith("❌"): return
+    try:
+        cache.store(key[0], key[1], key[2], answer)
+    except Exception as e:
+        logger.error(f"Erreur écriture cache sémantique: {e}")
+
+# === Mémoire des conversations (résumé glissant) ===
+SUMMARY_MESSAGE = """Tu tiens à jour le résumé d'une conversation entre un utilisateur et un assistant médical.
+Intègre les nouveaux échanges au résumé actuel : symptômes, antécédents, traitements, questions posées
+et points clés des réponses. Réponds uniquement par le nouveau résumé, en français, en {max_words} mots au plus."""
+
+def _summarize_memory(summary, turns, max_tokens):
+    """Nouveau résumé = résumé actuel + échanges (appel LLM, thread de conversation_memory)"""
+    exchanges = "\n".join(f"- Q: {truncate_sentences(q, 200)}\n- R: {truncate_sentences(r, 500)}" for q, r in turns)
+    response = get_llm_client().chat.completions.create(
+        model=llm_config["model"], temperature=0.2, max_tokens=max_tokens * 2,
+        messages=[{"role": "system", "content": SUMMARY_MESSAGE.format(max_words=int(max_tokens * 0.6))},
+                  {"role": "user", "content": f"Résumé actuel:\n{summary or '(vide)'}\n\nNouveaux échanges:\n{exchanges}"}])
+    return response.choices[0].message.content
+
+def get_memory():
+    """Mémoire partagée, conservée dans la base des conversations (en mémoire seule si indisponible)"""
+    global _memory
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                try:
+                    from conversation_store import get_store
+                    store = get_store()
+                except Exception as e:
+                    logger.error(f"Base des conversations indisponible, mémoire non persistée: {e}")
+                    store = None
+                _memory = ConversationMemory(_summarize_memory, store)
+    return _memory
+
+def _remember(conversation_id, user_input, final):
+    """Échange ajouté à la mémoire de la conversation (résumé mis à jour en arrière-plan)"""
+    if conversation_id is None or not final or final.startswith("❌"): return
+    try:
+        get_memory().add_turn(conversation_id, user_input, final)
+    except Exception as e:
+        logger.error(f"Erreur mémoire de conversation: {e}")
+
+# === Préparation du prompt (mémoire + contexte RAG / Web) ===
+def _memory_text(local_history, conversation_id=None):
+    """Résumé + derniers échanges de la conversation, sinon derniers échanges de l'historique (budget de tokens)"""
+    if conversation_id is not None: return get_memory().memory_text(conversation_id)
+    return memory_from_history(local_history)
+
+def _format_prompt(memory_text, context, user_input):
+    return f"""{memory_text}
 
 Contexte:
 {context}
 
 Question: {user_input}"""
-    _, assistant = create_agents()  # Crée agents Autogen
+
+def _prompt_with_stats(local_history, context, user_input, conversation_id=None):
+    """(prompt final, texte de mémoire) + envoi au MCP de la taille estimée du prompt (tokens)"""
+    with span("prompt_build"):
+        memory_text = _memory_text(local_history, conversation_id)
+        prompt = _format_prompt(memory_text, context, user_input)
+    send_to_mcp("prompt_stats", {"prompt_tokens": count_tokens(prompt), "context_tokens": count_tokens(context),
+                          "memory_tokens": count_tokens(memory_text), "budget": context_budget(llm_config["model"]),
+                          "model": llm_config["model"]})
+    return prompt, memory_text
+
+def _build_prompt(user_input, local_history, conversation_id=None):
+    send_to_mcp("user_question", {"question": user_input})  # Envoi événement MCP
+    context, best = _rag_lookup(user_input)  # Recherche interne d’abord
+    used = "RAG"
+    if not _rag_is_relevant(best):  # Rien de proche : recherche web
+        context, used = _choose_context(context, search_web(user_input))
+    send_to_mcp("context_used", {"context": context, "used": used})  # MCP context
+    prompt, memory_text = _prompt_with_stats(local_history, context, user_input, conversation_id)
+    return prompt, memory_text, context
+
+def _generate(user_prompt):
+    """Réponse du LLM via le client OpenAI partagé (sans état : appelable depuis plusieurs threads)"""
     try:
-        reply = assistant.generate_reply(messages=[{"role":"user","content":user_prompt}])  # Génère réponse
-        final = reply.get("content", str(reply)) if isinstance(reply, dict) else str(reply)
+        with span("llm_call", model=llm_config["model"]):
+            response = get_llm_client().chat.completions.create(
+                model=llm_config["model"], temperature=llm_config["temperature"],
+                messages=[{"role":"system","content":SYSTEM_MESSAGE}, {"role":"user","content":user_prompt}])
+        reply = response.choices[0].message.content
+        if not reply: raise ValueError("réponse vide")
+        return reply
     except Exception as e:
         logger.error(f"Erreur génération réponse: {e}")
-        final = "❌ Impossible de générer une réponse pour le moment."
-    send_to_mcp("agent_response", {"response": final})  # MCP réponse
-    if chat_history_local is None: chat_history.append((user_input, final))  # Ajoute historique global
+        return "❌ Impossible de générer une réponse pour le moment."
+
+# === Répondre à une question ===
+def answer_question(user_input, chat_history_local=None, conversation_id=None):
+    """conversation_id : mémoire de la conversation (résumé glissant) au lieu de l'historique brut"""
+    global chat_history
+    local_history = chat_history_local if chat_history_local is not None else chat_history  # Historique local si fourni
+    with request_trace("answer"):  # Identifiant de requête + span total (et profil si lente)
+        user_prompt, memory_text, context = _build_prompt(user_input, local_history, conversation_id)
+        final, cache_key = _cache_lookup(user_input, context, memory_text)  # Question déjà traitée sous une autre forme ?
+        if final is None:
+            final = _generate(user_prompt)
+            _cache_store(cache_key, final)
+        send_to_mcp("agent_response", {"response": final})  # MCP réponse
+    _remember(conversation_id, user_input, final)
+    if chat_history_local is None and conversation_id is None: chat_history.append((user_input, final))  # Ajoute historique global
     return final
+
+# === Répondre en mode asynchrone (RAG et Web lancés en parallèle) ===
+async def answer_question_async(user_input, chat_history_local=None, conversation_id=None):
+    """Variante asyncio de answer_question : la recherche FAISS et la recherche Serper démarrent
+    en même temps ; l'appel web est annulé dès que le meilleur document interne passe sous
+    RAG_MAX_DISTANCE. send_to_mcp ne bloque pas (écriture dans le thread du writer MCP)."""
+    global chat_history
+    local_history = chat_history_local if chat_history_local is not None else chat_history
+    # Propagé aux tâches et threads (contextvars) ; profil échantillonné : le travail est fait dans des threads
+    with request_trace("answer_async", profile_mode="sampling"):
+        send_to_mcp("user_question", {"question": user_input})
+        rag_task = asyncio.create_task(asyncio.to_thread(_rag_lookup, user_input))
+        web_task = asyncio.create_task(search_web_async(user_input))  # Recherche web spéculative
+        context, best = await rag_task
+        used = "RAG"
+        if _rag_is_relevant(best):
+            web_task.cancel()  # Document interne pertinent : l'appel web est inutile
+        else:
+            context, used = _choose_context(context, await web_task)
+        send_to_mcp("context_used", {"context": context, "used": used})
+        user_prompt, memory_text = _prompt_with_stats(local_history, context, user_input, conversation_id)
+        final, cache_key = await asyncio.to_thread(_cache_lookup, user_input, context, memory_text)
+        if final is None:
+            final = await asyncio.to_thread(_generate, user_prompt)
+            await asyncio.to_thread(_cache_store, cache_key, final)
+        send_to_mcp("agent_response", {"response": final})
+    _remember(conversation_id, user_input, final)
+    if chat_history_local is None and conversation_id is None: chat_history.append((user_input, final))
+    return final
+
+# === Répondre en streaming (jeton par jeton) ===
+def answer_question_stream(user_input, chat_history_local=None, conversation_id=None):
+    """Variante de answer_question qui produit les morceaux de texte au fur et à mesure
+    de leur réception depuis l'endpoint compatible OpenAI (Mistral / Ollama).
+    La réponse complète est journalisée (MCP) et ajoutée à l'historique à la fin ; une réponse
+    interrompue (erreur en cours de flux, générateur fermé par un rerun ou une déconnexion) est
+    seulement journalisée (partial) : ni cache sémantique, ni mémoire, ni historique.
+    Identifiant de requête (celui de l'appelant s'il existe) capturé au démarrage et lié entre
+    deux yield seulement (bind_request) : le contexte de l'appelant n'est jamais modifié."""
+    global chat_history
+    local_history = chat_history_local if chat_history_local is not None else chat_history
+    rid, own = current_request_id(), current_request_id() is None
+    if own: rid = new_request_id()
+    start = time.perf_counter()
+    parts, completed, cached, llm_start = [], False, None, None  # completed : flux allé jusqu'au bout
+    try:
+        with bind_request(rid):
+            user_prompt, memory_text, context = _build_prompt(user_input, local_history, conversation_id)
+            cached, cache_key = _cache_lookup(user_input, context, memory_text)
+        if cached is not None:  # Réponse en cache : renvoyée d'un bloc
+            parts.append(cached)
+            yield cached
+            completed = True
+            return
+        with bind_request(rid):
+            llm_start = time.perf_counter()
+            stream = get_llm_client().chat.completions.create(
+                model=llm_config["model"], temperature=llm_config["temperature"], stream=True,
+                messages=[{"role":"system","content":SYSTEM_MESSAGE}, {"role":"user","content":user_prompt}])
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if not parts:  # Premier jeton reçu
+                    with bind_request(rid): record("llm_ttft", time.perf_counter() - llm_start)
+                parts.append(delta)
+                yield delta
+        completed = True
+    except Exception as e:
+        logger.error(f"Erreur génération réponse (stream): {e}")
+        if not parts:
+            parts.append("❌ Impossible de générer une réponse pour le moment.")
+            yield parts[0]
+    finally:
+        with bind_request(rid):
+            final = "".join(parts)
+            if llm_start is not None:
+                record("llm_call", time.perf_counter() - llm_start, model=llm_config["model"], stream=True,
+                       **({} if completed else {"error": "interrupted"}))
+            send_to_mcp("agent_response", {"response": final, "partial": not completed})  # MCP, même interrompue
+            if completed and final:
+                if cached is None: _cache_store(cache_key, final)
+                _remember(conversation_id, user_input, final)
+                if chat_history_local is None and conversation_id is None: chat_history.append((user_input, final))
+            if own: record("answer_stream", time.perf_counter() - start)  # Inclut la consommation des jetons (rendu UI)
+
+STARTUP_TIMINGS["import_pp_agent"] = round(time.perf_counter() - _IMPORT_START, 3)
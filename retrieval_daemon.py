@@ -0,0 +1,172 @@
+# === retrieval_daemon.py - SERVICE DE RECHERCHE PARTAGÉ (SOCKET UNIX) ===
+# Un seul processus détient le modèle d'embeddings MiniLM et l'index FAISS ; les workers
+# Streamlit / API (pp_agent avec RETRIEVAL_SOCKET défini) et retrieve_docs.py l'interrogent
+# au lieu de charger chacun leur copie en mémoire.
+# - protocole : une ligne JSON par requête et par réponse, connexions persistantes
+# - opérations : retrieve (contexte formaté comme retrieve_docs), search (documents + distances),
+#                embed (vecteurs, pour le cache sémantique), ping, stats
+# - les embeddings des requêtes simultanées sont regroupés en un seul passage du modèle (BatchedEmbeddings)
+#
+# Usage : python retrieval_daemon.py [--socket /tmp/pp_retrieval.sock] [--window-ms 5] [--max-batch 32]
+
+# === Importations ===
+import os, json, time, socket, logging, argparse, threading, socketserver  # Config, JSON, socket, CLI, threads
+
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+RETRIEVAL_SOCKET = os.environ.get("RETRIEVAL_SOCKET", "/tmp/pp_retrieval.sock")  # Chemin du socket Unix
+RETRIEVAL_TIMEOUT = float(os.environ.get("RETRIEVAL_TIMEOUT", "30"))              # Timeout client (s)
+
+class RetrievalError(Exception):
+    """Service injoignable ou réponse en erreur"""
+
+# === Client (workers Streamlit / API, retrieve_docs.py) ===
+class RetrievalClient:
+    """Client du service : une connexion persistante par thread, reconnexion automatique"""
+
+    def __init__(self, path=RETRIEVAL_SOCKET, timeout=RETRIEVAL_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+        return conn
+
+    def _close(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try: conn[0].close()
+            except OSError: pass
+
+    def call(self, op, **params):
+        from tracing import current_request_id  # Spans du service rattachés à la requête de l'appelant
+        request = (json.dumps({"op": op, "request_id": current_request_id(), **params}, ensure_ascii=False)
+                   + "\n").encode("utf-8")
+        for attempt in range(2):  # Connexion fermée par le service (redémarrage) : une nouvelle tentative
+            try:
+                sock, reader = self._connection()
+                sock.sendall(request)
+                line = reader.readline()
+                if not line: raise ConnectionError("connexion fermée par le service")
+                break
+            except OSError as e:
+                self._close()
+                if attempt: raise RetrievalError(f"Service de recherche injoignable ({self.path}): {e}") from e
+        response = json.loads(line)
+        if "error" in response: raise RetrievalError(response["error"])
+        return response
+
+    def retrieve(self, query, k=3):
+        """(contexte formaté, meilleure distance ou None) : même contrat que pp_agent._rag_lookup"""
+        r = self.call("retrieve", query=query, k=k)
+        return r["context"], r["best"]
+
+    def search(self, query, k=3):
+        """[(Document, distance ou None)]"""
+        from langchain_core.documents import Document
+        return [(Document(page_content=d["content"], metadata=d["metadata"]), d["score"])
+                for d in self.call("search", query=query, k=k)["results"]]
+
+    def embed(self, texts):
+        return self.call("embed", texts=texts)["vectors"]
+
+class RemoteEmbeddings:
+    """Embeddings calculés par le service (interface embed_query / embed_documents)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def embed_query(self, text):
+        return self.client.embed([text])[0]
+
+    def embed_documents(self, texts):
+        return self.client.embed(list(texts))
+
+# === Service ===
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:  # Connexion persistante : une requête par ligne
+            try:
+                request = json.loads(line)
+                response = self.server.dispatch(request)
+            except Exception as e:
+                logger.error(f"Erreur requête: {e}")
+                response = {"error": str(e)}
+            self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+
+class RetrievalServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, window_ms=None, max_batch=None):
+        import pp_agent                                   # Recherche RAG existante (hybride, compactage)
+        from embedding_scheduler import BatchedEmbeddings
+        pp_agent.RETRIEVAL_SOCKET = None                  # Le service cherche localement
+        db = pp_agent.get_vector_db()
+        if db is None: raise RuntimeError("Vectorstore indisponible (lancer index_documents.py)")
+        embeddings = pp_agent.get_embeddings()
+        if not isinstance(embeddings, BatchedEmbeddings):  # EMBED_BATCH_WINDOW_MS=0 : regroupement forcé ici
+            embeddings = BatchedEmbeddings(embeddings)
+        if window_ms is not None: embeddings.window = window_ms / 1000
+        if max_batch is not None: embeddings.max_batch = max_batch
+        self.embeddings = embeddings
+        db.embedding_function = embeddings                 # Requêtes simultanées encodées ensemble
+        self.pp_agent, self.db = pp_agent, db
+        self.started = time.time()
+        self.requests = 0
+        if os.path.exists(path): os.remove(path)         # Socket d'un service précédent
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o660)
+
+    def dispatch(self, request):
+        from tracing import request_trace
+        self.requests += 1
+        with request_trace(f"daemon_{request.get('op')}", request.get("request_id")):
+            return self._dispatch(request)
+
+    def _dispatch(self, request):
+        op, k = request.get("op"), int(request.get("k", 3))
+        if op == "retrieve":
+            context, best = self.pp_agent._rag_lookup(request["query"], k)
+            return {"context": context, "best": best}
+        if op == "search":
+            results = self.pp_agent._search_docs(self.db, request["query"], k)
+            return {"results": [{"content": d.page_content, "metadata": d.metadata,
+                                 "score": None if s is None else float(s)} for d, s in results]}
+        if op == "embed":
+            texts = request["texts"]
+            if len(texts) == 1: return {"vectors": [list(map(float, self.embeddings.embed_query(texts[0])))]}
+            return {"vectors": [list(map(float, v)) for v in self.embeddings.embed_documents(texts)]}
+        if op == "ping": return {"ok": True}
+        if op == "stats":
+            return {"uptime_s": round(time.time() - self.started, 1), "requests": self.requests,
+                    "documents": self.db.index.ntotal, "embedding_scheduler": self.embeddings.stats()}
+        return {"error": f"Opération inconnue: {op}"}
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service de recherche partagé (modèle + index FAISS uniques)")
+    parser.add_argument("--socket", default=RETRIEVAL_SOCKET, help="Chemin du socket Unix")
+    parser.add_argument("--window-ms", type=float, default=None, help="Fenêtre de regroupement des requêtes (ms)")
+    parser.add_argument("--max-batch", type=int, default=None, help="Taille max d'un lot d'embeddings")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    server = RetrievalServer(args.socket, args.window_ms, args.max_batch)
+    logger.info(f"Service de recherche prêt sur {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket): os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 # === Import des bibliothèques nécessaires ===
-from langchain_community.vectorstores import FAISS  
-# FAISS permet de créer et interroger une base de vecteurs (vectorstore) de documents
-# pour effectuer des recherches par similarité.
+from onnx_encoder import create_embeddings
+# create_embeddings transforme du texte en vecteurs numériques (embeddings)
+# afin de les comparer dans FAISS : PyTorch (sentence-transformers) ou ONNX Runtime selon EMBEDDING_BACKEND.
 
-from langchain_huggingface import HuggingFaceEmbeddings  
-# HuggingFaceEmbeddings transforme du texte en vecteurs numériques (embeddings)
-# afin de les comparer dans FAISS.
+from vector_index import load_vectorstore
+# load_vectorstore charge l'index FAISS et le docstore SQLite construits par index_documents.py.
+
+import os
+from retrieval_daemon import RetrievalClient, RetrievalError, RETRIEVAL_SOCKET
+# Si le service partagé (retrieval_daemon.py) tourne, on l'interroge :
+# pas de modèle ni d'index chargé dans ce processus.
+
+_db = None  # Vectorstore chargé une seule fois (si le service n'est pas disponible)
 
 # === Fonction pour récupérer les documents les plus pertinents ===
 def retrieve_docs(query, k=3):
@@ -20,16 +26,22 @@ def retrieve_docs(query, k=3):
         list: liste d'objets Document trouvés.
     """
     
-    # --- Charger le vectorstore FAISS ---
-    db = FAISS.load_local(
-        "vectorstore",  # Chemin local où se trouve le vectorstore sauvegardé
-        HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),  
-        # Modèle HuggingFace qui transforme le texte en vecteurs pour la comparaison
-        allow_dangerous_deserialization=True  
-        # Permet de charger des objets FAISS même si ce n'est pas totalement sécurisé
-    )
-    # Ici, le vectorstore est chargé à chaque appel.
-    # Pour un vrai projet, il serait plus efficace de le mettre en cache en mémoire.
+    # --- Service de recherche partagé, s'il est lancé ---
+    if os.path.exists(RETRIEVAL_SOCKET):
+        try:
+            return [doc for doc, score in RetrievalClient(RETRIEVAL_SOCKET).search(query, k=k)]
+        except RetrievalError:
+            pass  # Service arrêté : recherche locale
+
+    # --- Charger le vectorstore FAISS (au premier appel seulement) ---
+    global _db
+    if _db is None:
+        _db = load_vectorstore(
+            "vectorstore",  # Chemin local où se trouve le vectorstore sauvegardé
+            create_embeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),
+            # Modèle qui transforme le texte en vecteurs pour la comparaison
+        )
+    db = _db
 
     # --- Recherche des documents les plus similaires ---
     results = db.similarity_search(query, k=k)  
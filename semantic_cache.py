@@ -0,0 +1,204 @@
+# === semantic_cache.py - CACHE SÉMANTIQUE DES RÉPONSES ===
+# Réutilise la réponse d'une question déjà posée sous une autre formulation :
+# - la question est encodée avec le même modèle MiniLM que le RAG
+# - recherche du voisin le plus proche dans un petit index FAISS dédié (produit scalaire = cosinus)
+# - la réponse n'est servie que si la similarité dépasse le seuil ET si l'empreinte SHA-256 du contexte
+#   récupéré, de la mémoire de conversation et du modèle LLM est identique à celle de la réponse
+# - éviction LRU + TTL, compteurs de hits / misses
+# - persistance regroupée (au plus une écriture par SEMANTIC_CACHE_SAVE_INTERVAL), sous verrou de fichier,
+#   en fusionnant les entrées écrites entre-temps par d'autres processus
+
+# === Importations ===
+import os, json, time, atexit, hashlib, logging, threading  # Fichiers, persistance, TTL, empreintes, logs, verrou
+from contextlib import contextmanager                 # Verrou de fichier
+from collections import OrderedDict                   # Ordre LRU des entrées
+import numpy as np                                    # Vecteurs
+import faiss                                          # Index de similarité dédié au cache
+try:
+    import fcntl                                      # Verrou entre processus (POSIX)
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# === Configuration par défaut ===
+SEMANTIC_CACHE_DIR = os.environ.get("SEMANTIC_CACHE_DIR", "semantic_cache")           # Dossier de persistance
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # Similarité cosinus min
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))  # Durée de vie (s)
+SEMANTIC_CACHE_SAVE_INTERVAL = float(os.environ.get("SEMANTIC_CACHE_SAVE_INTERVAL", "5"))  # Délai max avant écriture (s)
+
+def context_hash(context, memory="", model=""):
+    """Empreinte de tout ce qui, en plus de la question, détermine la réponse :
+    contexte récupéré (RAG / Web), mémoire de la conversation, modèle LLM"""
+    return hashlib.sha256("\x1f".join((context, memory, model)).encode("utf-8")).hexdigest()
+
+@contextmanager
+def _file_lock(path):
+    """Verrou exclusif entre processus (sans effet si fcntl est indisponible)"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class SemanticCache:
+    """Cache question -> réponse par similarité sémantique, thread-safe"""
+
+    def __init__(self, embeddings, path=SEMANTIC_CACHE_DIR, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=SEMANTIC_CACHE_TTL):
+        self.embeddings = embeddings
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> {question, answer, context_hash, created_at}, du plus ancien au plus récent
+        self._index = None
+        self._next_id = 0
+        self._dirty = False            # Entrées ajoutées / supprimées depuis la dernière écriture
+        self._save_timer = None
+        self._load()
+        atexit.register(self.flush)    # Dernières entrées écrites à l'arrêt
+
+    # --- Encodage ---
+    def embed(self, question):
+        """Vecteur normalisé (float32) de la question"""
+        vec = np.asarray(self.embeddings.embed_query(question), dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _ensure_index(self, dim):
+        if self._index is None:
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    # --- Recherche / insertion ---
+    def lookup(self, vec, ctx_hash):
+        """(réponse, similarité) en cache pour une question encodée, ou (None, None)"""
+        with self._lock:
+            answer, similarity = None, None
+            if self._index is not None and self._index.ntotal:
+                scores, ids = self._index.search(vec, min(5, self._index.ntotal))
+                now = time.time()
+                for score, i in zip(scores[0], ids[0]):
+                    if i < 0 or score < self.threshold: break
+                    entry = self._entries.get(int(i))
+                    if entry is None or now - entry["created_at"] > self.ttl: continue
+                    if entry["context_hash"] != ctx_hash: continue  # Contexte modifié : réponse périmée
+                    self._entries.move_to_end(int(i))  # LRU
+                    answer, similarity = entry["answer"], float(score)
+                    break
+            if answer is None: self.misses += 1
+            else: self.hits += 1
+            return answer, similarity
+
+    def store(self, vec, question, ctx_hash, answer):
+        with self._lock:
+            self._ensure_index(vec.shape[1])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vec, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = {"question": question, "answer": answer,
+                                       "context_hash": ctx_hash, "created_at": time.time()}
+            self._evict()
+            self._schedule_save()
+
+    def _evict(self):
+        """Supprime les entrées expirées puis les moins récemment utilisées au-delà de max_entries"""
+        now = time.time()
+        expired = [i for i, e in self._entries.items() if now - e["created_at"] > self.ttl]
+        overflow = len(self._entries) - len(expired) - self.max_entries
+        if overflow > 0:
+            gone = set(expired)
+            expired += [i for i in self._entries if i not in gone][:overflow]
+        if not expired: return
+        for i in expired: self._entries.pop(i, None)
+        self._index.remove_ids(np.array(expired, dtype="int64"))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries),
+                "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+    # --- Persistance ---
+    def _schedule_save(self):
+        """Appelé sous self._lock : une seule écriture pour toutes les entrées des prochaines secondes"""
+        self._dirty = True
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(SEMANTIC_CACHE_SAVE_INTERVAL, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Écrit le cache sur disque s'il a changé (fusion avec les entrées des autres processus)"""
+        with self._lock:
+            self._save_timer = None
+            if not self._dirty or self._index is None: return
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                with _file_lock(os.path.join(self.path, ".lock")):
+                    self._merge_from_disk()
+                    self._save()
+                self._dirty = False
+            except Exception as e:
+                logger.error(f"Erreur écriture cache sémantique: {e}")
+
+    def _read_disk(self):
+        """(index FAISS, données JSON) sur disque, ou (None, None)"""
+        index_path = os.path.join(self.path, "index.faiss")
+        entries_path = os.path.join(self.path, "entries.json")
+        if not (os.path.exists(index_path) and os.path.exists(entries_path)): return None, None
+        index = faiss.read_index(index_path)
+        with open(entries_path, "r", encoding="utf-8") as f:
+            return index, json.load(f)
+
+    def _merge_from_disk(self):
+        """Ajoute les entrées écrites par d'autres processus depuis notre chargement (en tête de l'ordre LRU)"""
+        try:
+            index, data = self._read_disk()
+        except Exception as e:
+            logger.warning(f"Cache sémantique sur disque illisible, écrasé: {e}")
+            return
+        if index is None: return
+        known = {(e["question"], e["context_hash"], e["created_at"]) for e in self._entries.values()}
+        now, merged = time.time(), []
+        for i, e in data["entries"]:
+            if (e["question"], e["context_hash"], e["created_at"]) in known or now - e["created_at"] > self.ttl: continue
+            vec = index.reconstruct(int(i)).reshape(1, -1)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vec, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = e
+            merged.append(entry_id)
+        for entry_id in reversed(merged): self._entries.move_to_end(entry_id, last=False)  # Évincées en premier
+        if merged: self._evict()
+
+    def _save(self):
+        """Écriture atomique (fichiers temporaires propres au processus puis os.replace)"""
+        index_path = os.path.join(self.path, "index.faiss")
+        entries_path = os.path.join(self.path, "entries.json")
+        suffix = f".{os.getpid()}.tmp"
+        faiss.write_index(self._index, index_path + suffix)
+        with open(entries_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({"next_id": self._next_id, "entries": [[i, e] for i, e in self._entries.items()]},
+                      f, ensure_ascii=False)
+        os.replace(index_path + suffix, index_path)
+        os.replace(entries_path + suffix, entries_path)
+
+    def _load(self):
+        try:
+            index, data = self._read_disk()
+            if index is None: return
+            self._index = index
+            self._next_id = data["next_id"]
+            self._entries = OrderedDict((int(i), e) for i, e in data["entries"])
+            logger.info(f"Cache sémantique chargé: {len(self._entries)} entrées")
+        except Exception as e:
+            logger.warning(f"Cache sémantique illisible, réinitialisé: {e}")
+            self._index, self._entries, self._next_id = None, OrderedDict(), 0
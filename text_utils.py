@@ -0,0 +1,21 @@
+# === text_utils.py - OUTILS TEXTE PARTAGÉS (RECHERCHE LEXICALE, PACKING DU CONTEXTE) ===
+# Normalisation des termes d'une requête : minuscules, accents retirés, mots vides ignorés.
+
+# === Importations ===
+import re, unicodedata  # Tokenisation, suppression des accents
+
+# Mots vides (français) ignorés dans les requêtes lexicales
+STOPWORDS = set("""au aux avec ce ces c est dans de des du elle en et eux il ils je la le les leur lui ma mais me
+meme mes moi mon ne nos notre nous on ou par pas pour qu que qui quoi quel quelle quels quelles sa se ses son sur ta
+te tes toi ton tu un une vos votre vous comment pourquoi quand sont etre avoir fait faire peut peuvent tout tous
+tres plus moins cette cet entre sans sous chez""".split())
+
+def fold(text):
+    """Minuscules sans accents : 'Xérostomie' -> 'xerostomie'"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def query_terms(text):
+    """Termes significatifs (pliés, sans doublons, dans l'ordre) d'un texte"""
+    terms = [t for t in re.findall(r"\w+", fold(text)) if len(t) > 2 and t not in STOPWORDS]
+    return list(dict.fromkeys(terms))
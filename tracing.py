@@ -0,0 +1,236 @@
+# === tracing.py - SPANS DE LATENCE, HISTOGRAMMES ET PROFILAGE DES REQUÊTES ===
+# Mesure chaque étape du pipeline de réponse (embedding de la question, recherche FAISS / BM25,
+# recherche web, construction du prompt, appel LLM avec TTFT, export PDF, rendu UI) :
+# - request_trace() attribue un identifiant à la requête (contextvars : suit asyncio et to_thread)
+# - span() chronomètre une étape, l'ajoute à l'histogramme et l'émet au MCP (événement "span")
+#   pour une fraction TRACE_MCP des requêtes (désactivé par défaut : un événement par étape et par requête)
+# - histograms() : p50 / p95 / p99 estimés par étape depuis le démarrage du processus
+# - collect_spans() : durées par étape d'une seule requête (timings par question de batch_answer.py)
+# - PROFILE_SLOW_MS > 0 : profil (cProfile ou échantillonnage) sauvegardé pour les requêtes plus lentes
+
+# === Importations ===
+import os, sys, time, uuid, zlib, bisect, logging, threading, contextvars  # Config, chrono, ids, échantillonnage, seaux, logs, threads
+import functools                                                      # Décorateur traced
+from contextlib import contextmanager                                 # Spans sous forme de "with"
+from collections import Counter                                       # Piles échantillonnées
+
+logger = logging.getLogger(__name__)
+
+# === Configuration ===
+TRACE_MCP = float(os.environ.get("TRACE_MCP", "0"))                 # Part des requêtes dont les spans vont au MCP (0 à 1)
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0"))     # 0 = profilage désactivé
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "cprofile")           # cprofile | sampling
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))  # Période d'échantillonnage
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")             # Profils des requêtes lentes
+# Bornes des seaux d'histogramme (ms), progression 1-2-5
+BUCKETS_MS = [m * 10**e for e in range(0, 6) for m in (1, 2, 5)]
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_collected = contextvars.ContextVar("collected_spans", default=None)  # Durées par étape d'une requête (collect_spans)
+
+def current_request_id():
+    return _request_id.get()
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+def _sampled():
+    """Spans de la requête en cours émis au MCP ? Décidé par l'identifiant : même choix pour
+    tous les spans d'une requête, y compris dans le service de recherche (retrieval_daemon)"""
+    if TRACE_MCP >= 1: return True
+    rid = _request_id.get()
+    if TRACE_MCP <= 0 or rid is None: return False
+    return zlib.crc32(rid.encode("utf-8")) < TRACE_MCP * 2**32
+
+# === Histogrammes en mémoire ===
+class Histogram:
+    """Durées (ms) rangées dans des seaux fixes : mémoire constante, percentiles approchés"""
+
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Dernier seau : au-delà de la plus grande borne
+        self.count, self.total, self.max = 0, 0.0, 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        """Borne haute du seau contenant le p-ième percentile"""
+        if not self.count: return None
+        rank, seen = p / 100 * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c: return min(self.bounds[i], round(self.max, 2)) if i < len(self.bounds) else round(self.max, 2)
+        return self.max
+
+    def snapshot(self):
+        return {"count": self.count, "mean_ms": round(self.total / self.count, 2) if self.count else None,
+                "p50_ms": self.percentile(50), "p95_ms": self.percentile(95), "p99_ms": self.percentile(99),
+                "max_ms": round(self.max, 2)}
+
+_histograms = {}
+_hist_lock = threading.Lock()
+
+def observe(name, ms):
+    with _hist_lock:
+        hist = _histograms.get(name)
+        if hist is None: hist = _histograms[name] = Histogram()
+        hist.add(ms)
+
+def histograms():
+    """Résumé par étape : {nom: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}"""
+    with _hist_lock:
+        return {name: h.snapshot() for name, h in sorted(_histograms.items())}
+
+def reset_histograms():
+    with _hist_lock: _histograms.clear()
+
+# === Spans ===
+def record(name, seconds, **attrs):
+    """Enregistre une durée déjà mesurée (ex : TTFT) comme un span"""
+    ms = seconds * 1000
+    observe(name, ms)
+    collected = _collected.get()
+    if collected is not None:
+        with _hist_lock: collected[name] = round(collected.get(name, 0.0) + ms, 2)
+    if _sampled():
+        from mcp_client import send_to_mcp  # Import local : mcp_client importe ce module
+        send_to_mcp("span", {"span": name, "duration_ms": round(ms, 2), **attrs})  # request_id ajouté par send_to_mcp
+
+@contextmanager
+def span(name, **attrs):
+    """with span("faiss_search", k=3): ... ; les attributs ajoutés au dict retourné sont aussi émis"""
+    start = time.perf_counter()
+    extra = dict(attrs)
+    try:
+        yield extra
+    except BaseException as e:
+        extra["error"] = type(e).__name__
+        raise
+    finally:
+        record(name, time.perf_counter() - start, **extra)
+
+@contextmanager
+def collect_spans():
+    """with collect_spans() as stages: ... ; stages = {étape: ms cumulées} des spans de ce contexte
+    (y compris tâches asyncio, to_thread et threads lancés avec copy_context)"""
+    stages = {}
+    token = _collected.set(stages)
+    try:
+        yield stages
+    finally:
+        _collected.reset(token)
+
+def traced(name):
+    """Décorateur : la fonction entière est un span"""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name): return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+# === Profilage des requêtes lentes ===
+_profile_lock = threading.Lock()  # Un seul profil à la fois (cProfile ne supporte pas l'imbrication)
+
+class _SamplingProfiler:
+    """Échantillonne les piles de tous les threads (sys._current_frames) toutes les PROFILE_INTERVAL_MS"""
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-sampler", daemon=True)
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me: continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                if tid not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                self.stacks[";".join([names.get(tid, str(tid))] + stack[::-1])] += 1
+
+    def start(self): self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        """Format "piles repliées" (flamegraph.pl, speedscope)"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common(): f.write(f"{stack} {n}\n")
+
+def _start_profiler(mode=None):
+    if PROFILE_SLOW_MS <= 0 or not _profile_lock.acquire(blocking=False): return None
+    try:
+        if (mode or PROFILE_MODE) == "sampling":
+            prof = _SamplingProfiler()
+            prof.start()
+        else:
+            import cProfile
+            prof = cProfile.Profile()
+            prof.enable()
+        return prof
+    except Exception as e:  # Autre profileur déjà actif (débogueur, sys.monitoring)
+        logger.warning(f"Profilage indisponible: {e}")
+        _profile_lock.release()
+        return None
+
+def _stop_profiler(prof, request_id, elapsed_ms):
+    try:
+        if isinstance(prof, _SamplingProfiler): prof.stop()
+        else: prof.disable()
+        if elapsed_ms < PROFILE_SLOW_MS: return
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        ext = "folded" if isinstance(prof, _SamplingProfiler) else "prof"
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{request_id}.{ext}")
+        prof.dump(path) if isinstance(prof, _SamplingProfiler) else prof.dump_stats(path)
+        from mcp_client import send_to_mcp
+        send_to_mcp("slow_request_profile", {"duration_ms": round(elapsed_ms, 2), "path": path, "mode": ext})
+        logger.info(f"Requête lente ({elapsed_ms:.0f} ms) : profil écrit dans {path}")
+    except Exception as e:
+        logger.error(f"Erreur profilage: {e}")
+    finally:
+        _profile_lock.release()
+
+@contextmanager
+def request_trace(kind="answer", request_id=None, profile_mode=None):
+    """Contexte d'une requête : identifiant propagé aux spans et événements MCP, span total,
+    profil sauvegardé si la requête dépasse PROFILE_SLOW_MS.
+    cProfile ne voit que le thread appelant : le travail fait dans un pool (asyncio.to_thread,
+    recherche hybride, embeddings par lots) n'y figure pas ; profile_mode="sampling" échantillonne
+    tous les threads. À ne pas tenir entre deux yield d'un générateur (voir bind_request)."""
+    if _request_id.get() is not None:  # Requête déjà tracée (appel imbriqué)
+        yield _request_id.get()
+        return
+    rid = request_id or new_request_id()
+    token = _request_id.set(rid)
+    prof = _start_profiler(profile_mode)
+    start = time.perf_counter()
+    try:
+        with span(kind):
+            yield rid
+    finally:
+        if prof is not None: _stop_profiler(prof, rid, (time.perf_counter() - start) * 1000)
+        _request_id.reset(token)
+
+@contextmanager
+def bind_request(request_id):
+    """Rattache le bloc à la requête request_id (sans span ni profil). Pour les générateurs :
+    l'identifiant est capturé au démarrage puis lié autour de chaque portion de code entre deux yield,
+    le contexte de l'appelant n'étant pas le même d'une reprise à l'autre."""
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
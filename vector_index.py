@@ -0,0 +1,333 @@
+# === vector_index.py - TYPES D'INDEX FAISS (FLAT / IVF / HNSW / PQ) ===
+# Construction et réglage de l'index FAISS du vectorstore :
+# - flat     : recherche exacte (force brute), adaptée aux petits corpus
+# - ivf_flat : partitionnement en nlist listes inversées, nprobe listes visitées par requête
+# - hnsw     : graphe HNSW (M voisins), efSearch candidats explorés par requête
+# - ivf_pq   : IVF + quantification produit (m sous-vecteurs de nbits), mémoire réduite
+# Les index gardent des identifiants int64 stables (nativement pour IVF, via IndexIDMap2
+# pour flat / HNSW), ce qui permet les suppressions / ajouts incrémentaux de l'ingestion.
+#
+# Rapport rappel / latence : python vector_index.py [--vectorstore vectorstore] [--k 10]
+# Vérification suppression incrémentale : python vector_index.py --check
+
+# === Importations ===
+import os, sys, json, math, time, pickle, logging, argparse  # Config, code de sortie, calculs, chronométrage, ancien docstore, logs, CLI
+import numpy as np                               # Vecteurs
+import faiss                                     # Index de similarité
+
+logger = logging.getLogger(__name__)
+
+# === Configuration par défaut ===
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+INDEX_CONFIG_FILE = "index_config.json"  # Paramètres de l'index (dans le dossier du vectorstore)
+DEFAULT_PARAMS = {
+    "type": os.environ.get("FAISS_INDEX_TYPE", "flat"),
+    "nlist": 1024,          # IVF : nombre de listes inversées
+    "nprobe": 16,           # IVF : listes visitées par requête
+    "hnsw_m": 32,           # HNSW : voisins par nœud
+    "ef_construction": 200, # HNSW : largeur de recherche à la construction
+    "ef_search": 64,        # HNSW : largeur de recherche à la requête
+    "pq_m": 48,             # PQ : nombre de sous-vecteurs (doit diviser la dimension)
+    "pq_nbits": 8,          # PQ : bits par sous-vecteur
+}
+BUILD_KEYS = ("type", "nlist", "hnsw_m", "ef_construction", "pq_m", "pq_nbits")  # Changement => reconstruction
+TRAIN_POINTS_PER_LIST = 39  # Minimum conseillé par FAISS pour l'entraînement k-means
+
+def default_params(**overrides):
+    params = dict(DEFAULT_PARAMS)
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    if params["type"] not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu: {params['type']} (attendu: {', '.join(INDEX_TYPES)})")
+    return params
+
+# === Construction ===
+def create_index(dim, params):
+    """Index vide du type demandé, acceptant add_with_ids / remove_ids"""
+    kind = params["type"]
+    if kind == "ivf_flat":  # Les index IVF gèrent nativement des identifiants arbitraires
+        return faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, params["nlist"], faiss.METRIC_L2)
+    if kind == "ivf_pq":
+        return faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, params["nlist"], params["pq_m"], params["pq_nbits"])
+    if kind == "hnsw":
+        base = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        base.hnsw.efConstruction = params["ef_construction"]
+    else:  # flat
+        base = faiss.IndexFlatL2(dim)
+    return faiss.IndexIDMap2(base)
+
+def _base(index):
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else faiss.downcast_index(index)
+
+def index_kind(index):
+    """Type (au sens INDEX_TYPES) d'un index chargé, None si non géré (ex: index LangChain historique)"""
+    base = _base(index)
+    if isinstance(base, faiss.IndexIVFPQ): return "ivf_pq"
+    if isinstance(base, faiss.IndexIVFFlat): return "ivf_flat"
+    if not isinstance(index, faiss.IndexIDMap2): return None
+    if isinstance(base, faiss.IndexHNSWFlat): return "hnsw"
+    if isinstance(base, faiss.IndexFlatL2): return "flat"
+    return None
+
+def tune_index(index, nprobe=None, ef_search=None):
+    """Applique les paramètres de requête (nprobe pour IVF, efSearch pour HNSW)"""
+    base = _base(index)
+    if isinstance(base, faiss.IndexIVF) and nprobe:
+        base.nprobe = int(nprobe)
+    if isinstance(base, faiss.IndexHNSW) and ef_search:
+        base.hnsw.efSearch = int(ef_search)
+    return index
+
+def remove_ids(index, ids):
+    """Supprime des identifiants ; HNSW ne supportant pas la suppression, l'index est reconstruit"""
+    ids = np.asarray(ids, dtype="int64")
+    if not len(ids): return index
+    if index_kind(index) != "hnsw":
+        index.remove_ids(ids)
+        return index
+    all_ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(all_ids, ids)
+    vectors = index.index.reconstruct_n(0, index.ntotal)[keep]
+    base = _base(index)
+    hnsw = faiss.IndexHNSWFlat(index.d, base.hnsw.nb_neighbors(1))  # Réglé avant l'enveloppe IndexIDMap2,
+    hnsw.hnsw.efConstruction = base.hnsw.efConstruction                # dont .index n'expose pas .hnsw
+    hnsw.hnsw.efSearch = base.hnsw.efSearch
+    rebuilt = faiss.IndexIDMap2(hnsw)
+    if keep.any(): rebuilt.add_with_ids(vectors, all_ids[keep])
+    logger.info(f"Index HNSW reconstruit après suppression ({rebuilt.ntotal} vecteurs)")
+    return rebuilt
+
+class IndexBuilder:
+    """Ajoute des vecteurs en flux ; pour les index IVF non entraînés, les premiers vecteurs
+    sont mis de côté jusqu'à disposer d'assez de points pour l'entraînement."""
+
+    def __init__(self, params, index=None):
+        self.params = dict(params)
+        self.index = index
+        self._pending_ids, self._pending_vecs, self._pending_count = [], [], 0
+
+    def _train_size(self):
+        return self.params["nlist"] * TRAIN_POINTS_PER_LIST
+
+    def add(self, ids, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        ids = np.asarray(ids, dtype="int64")
+        if self.index is None: self.index = create_index(vectors.shape[1], self.params)
+        if self.index.is_trained:
+            self.index.add_with_ids(vectors, ids)
+            return
+        self._pending_ids.append(ids); self._pending_vecs.append(vectors)
+        self._pending_count += len(ids)
+        if self._pending_count >= self._train_size(): self._train_and_flush()
+
+    def remove(self, ids):
+        if self.index is not None: self.index = remove_ids(self.index, ids)
+
+    def _train_and_flush(self):
+        vectors, ids = np.vstack(self._pending_vecs), np.concatenate(self._pending_ids)
+        self._pending_ids, self._pending_vecs, self._pending_count = [], [], 0
+        if len(ids) < self._train_size():
+            # Corpus trop petit pour les paramètres demandés : on les adapte
+            self.params["nlist"] = max(1, min(self.params["nlist"], len(ids) // TRAIN_POINTS_PER_LIST))
+            if self.params["type"] == "ivf_pq":
+                self.params["pq_nbits"] = max(1, min(self.params["pq_nbits"], int(math.log2(max(len(ids), 2)))))
+            logger.warning(f"Peu de vecteurs pour l'entraînement ({len(ids)}), paramètres adaptés: "
+                           f"nlist={self.params['nlist']} pq_nbits={self.params['pq_nbits']}")
+            self.index = create_index(vectors.shape[1], self.params)
+        start = time.time()
+        self.index.train(vectors)
+        self.index.add_with_ids(vectors, ids)
+        logger.info(f"Index {self.params['type']} entraîné sur {len(ids)} vecteurs en {time.time()-start:.2f}s")
+
+    def finish(self):
+        """Entraîne l'index s'il attend encore des vecteurs ; retourne l'index prêt"""
+        if self._pending_count: self._train_and_flush()
+        return tune_index(self.index, self.params["nprobe"], self.params["ef_search"]) if self.index else None
+
+# === Configuration persistée ===
+def save_config(folder, params):
+    path = os.path.join(folder, INDEX_CONFIG_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def load_config(folder):
+    path = os.path.join(folder, INDEX_CONFIG_FILE)
+    if not os.path.exists(path): return default_params()
+    with open(path, "r", encoding="utf-8") as f:
+        return default_params(**json.load(f))
+
+def query_params(folder):
+    """(nprobe, efSearch) à appliquer au chargement, surchargeables par FAISS_NPROBE / FAISS_EF_SEARCH"""
+    params = load_config(folder)
+    return (int(os.environ.get("FAISS_NPROBE", params["nprobe"])),
+            int(os.environ.get("FAISS_EF_SEARCH", params["ef_search"])))
+
+# === Migration de l'ancien vectorstore (FAISS.save_local : index.faiss + index.pkl) ===
+def migrate_legacy(folder):
+    """Convertit une seule fois un vectorstore LangChain picklé au format actuel, sans recalculer
+    les embeddings : morceaux copiés dans docstore.sqlite (identifiant = position du vecteur),
+    index réécrit en flat à identifiants stables, index.pkl supprimé. Renvoie le nombre de morceaux.
+    Le pickle est celui écrit par l'ancien index_documents.py dans ce dossier (fichier de confiance)."""
+    from docstore import SQLiteDocstore, docstore_path
+    legacy = os.path.join(folder, "index.pkl")
+    path = os.path.join(folder, "index.faiss")
+    with open(legacy, "rb") as f:
+        old_docstore, index_to_id = pickle.load(f)  # (InMemoryDocstore, {position: identifiant})
+    old = faiss.read_index(path)
+    positions = sorted(index_to_id)
+    vector_ids, chunk_ids, docs, counts = [], [], [], {}
+    for pos in positions:
+        doc = old_docstore.search(index_to_id[pos])
+        if isinstance(doc, str): continue  # Identifiant absent de l'ancien docstore
+        source = str(doc.metadata.get("source", "inconnu")).replace("\\", "/")
+        doc.metadata["source"] = source
+        rel = source.split("/", 1)[1] if "/" in source else source  # Chemin relatif à docs/, comme l'ingestion
+        vector_ids.append(pos); chunk_ids.append(f"{rel}#{counts.get(rel, 0)}"); docs.append(doc)
+        counts[rel] = counts.get(rel, 0) + 1
+    index = create_index(old.d, default_params(type="flat"))
+    if positions: index.add_with_ids(old.reconstruct_n(0, old.ntotal)[positions], np.asarray(positions, dtype="int64"))
+    tmp = docstore_path(folder) + ".tmp"
+    if os.path.exists(tmp): os.remove(tmp)
+    store = SQLiteDocstore(tmp, readonly=False)
+    store.add_chunks(vector_ids, chunk_ids, docs)
+    store.commit()
+    store._conn().close()
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    save_config(folder, default_params(type="flat"))
+    os.replace(tmp, docstore_path(folder))  # Docstore en dernier : sa présence marque la migration terminée
+    os.remove(legacy)
+    logger.info(f"Ancien vectorstore migré vers {docstore_path(folder)}: {len(docs)} morceaux")
+    return len(docs)
+
+# === Chargement pour l'agent ===
+def load_vectorstore(folder, embeddings):
+    """Vectorstore LangChain FAISS adossé au docstore SQLite (aucun pickle chargé en régime normal ;
+    un ancien index.pkl est migré une fois, voir migrate_legacy).
+    FAISS_MMAP=1 : l'index est projeté en mémoire (mmap) au lieu d'être lu entièrement."""
+    from langchain_community.vectorstores import FAISS
+    from docstore import SQLiteDocstore, IdentityMapping, docstore_path
+    if not os.path.exists(docstore_path(folder)):
+        if not os.path.exists(os.path.join(folder, "index.pkl")):
+            raise FileNotFoundError(f"{docstore_path(folder)} absent : lancer python index_documents.py")
+        migrate_legacy(folder)
+    path = os.path.join(folder, "index.faiss")
+    index = None
+    if os.environ.get("FAISS_MMAP", "0") == "1":
+        try:
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except Exception as e:
+            logger.warning(f"mmap non supporté pour cet index ({e}), lecture complète.")
+    if index is None: index = faiss.read_index(path)
+    nprobe, ef_search = query_params(folder)
+    tune_index(index, nprobe=nprobe, ef_search=ef_search)  # Réglages IVF / HNSW
+    docstore = SQLiteDocstore(docstore_path(folder), readonly=True)
+    return FAISS(embedding_function=embeddings, index=index, docstore=docstore,
+                 index_to_docstore_id=IdentityMapping(docstore))
+
+# === Rapport rappel / latence ===
+def _all_vectors(index):
+    """Vecteurs stockés dans l'index (approchés pour PQ)"""
+    base = _base(index)
+    if not isinstance(base, faiss.IndexIVF):
+        return base.reconstruct_n(0, base.ntotal)
+    invlists = base.invlists
+    ids = np.concatenate([faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+                          for l in range(base.nlist) if invlists.list_size(l)] or [np.empty(0, "int64")])
+    base.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return base.reconstruct_batch(ids)
+
+def _measure(index, queries, k, truth):
+    latencies, hits = [], 0
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, found = index.search(queries[i:i+1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(found[0]) & set(truth[i]))
+    return hits / (len(queries) * k), float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95))
+
+def recall_latency_report(vectors, k=10, n_queries=200, nlist=None, pq_m=DEFAULT_PARAMS["pq_m"],
+                          nprobes=(1, 4, 16, 64), ef_searches=(16, 64, 256), seed=0):
+    """Compare les types d'index sur les mêmes vecteurs : rappel@k (vs recherche exacte),
+    latence p50 / p95 par requête, temps de construction et taille sérialisée."""
+    rng = np.random.default_rng(seed)
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    queries = vectors[rng.choice(n, size=min(n_queries, n), replace=False)]
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype("float32")  # Requêtes proches du corpus
+    k = min(k, n)
+    nlist = nlist or max(1, min(4096, int(4 * math.sqrt(n))))
+    ids = np.arange(n, dtype="int64")
+    truth = create_index(dim, default_params(type="flat"))
+    truth.add_with_ids(vectors, ids)
+    _, truth_ids = truth.search(queries, k)
+
+    rows = []
+    for kind in INDEX_TYPES:
+        params = default_params(type=kind, nlist=nlist, pq_m=pq_m)
+        start = time.time()
+        builder = IndexBuilder(params)
+        builder.add(ids, vectors)
+        index = builder.finish()
+        build_s = time.time() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        grid = [("nprobe", p) for p in nprobes] if kind.startswith("ivf") else \
+               [("ef_search", e) for e in ef_searches] if kind == "hnsw" else [("-", None)]
+        for name, value in grid:
+            tune_index(index, nprobe=value if name == "nprobe" else None,
+                       ef_search=value if name == "ef_search" else None)
+            recall, p50, p95 = _measure(index, queries, k, truth_ids)
+            rows.append({"type": kind, "param": f"{name}={value}" if value else "-", "recall": recall,
+                         "p50_ms": p50, "p95_ms": p95, "build_s": build_s, "size_mb": size_mb})
+    return rows
+
+def check_incremental(dim=32, n=3000, seed=0):
+    """Ajout -> suppression -> recherche pour chaque type d'index (chemin de l'ingestion incrémentale).
+    Renvoie {type: erreur ou None} ; un identifiant supprimé ne doit plus être retrouvé."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.random((n, dim), dtype="float32")
+    ids = np.arange(n, dtype="int64")
+    removed, results = ids[: n // 10], {}
+    for kind in INDEX_TYPES:
+        try:
+            builder = IndexBuilder(default_params(type=kind, nlist=8, pq_m=8, pq_nbits=6))
+            builder.add(ids, vectors)
+            builder.finish()
+            builder.remove(removed)
+            index = tune_index(builder.index, nprobe=8, ef_search=64)
+            if index.ntotal != n - len(removed):
+                raise AssertionError(f"{index.ntotal} vecteurs après suppression, {n - len(removed)} attendus")
+            _, found = index.search(vectors[: len(removed)], 5)
+            if np.isin(found, removed).any(): raise AssertionError("identifiant supprimé encore retrouvé")
+            _, found = index.search(vectors[len(removed):len(removed) + 10], 1)
+            if (found[:, 0] < len(removed)).any(): raise AssertionError("recherche incohérente après suppression")
+            results[kind] = None
+        except Exception as e:
+            results[kind] = f"{type(e).__name__}: {e}"
+    return results
+
+def print_report(rows, k):
+    print(f"{'type':<9} {'réglage':<14} {'rappel@'+str(k):>10} {'p50 ms':>8} {'p95 ms':>8} {'build s':>8} {'Mo':>8}")
+    for r in rows:
+        print(f"{r['type']:<9} {r['param']:<14} {r['recall']:>10.3f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} "
+              f"{r['build_s']:>8.2f} {r['size_mb']:>8.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rapport rappel / latence des types d'index FAISS")
+    parser.add_argument("--vectorstore", default="vectorstore", help="Dossier contenant index.faiss")
+    parser.add_argument("--k", type=int, default=10, help="Nombre de voisins évalués")
+    parser.add_argument("--queries", type=int, default=200, help="Nombre de requêtes échantillonnées")
+    parser.add_argument("--nlist", type=int, default=None, help="nlist des index IVF (défaut: 4*sqrt(n))")
+    parser.add_argument("--check", action="store_true",
+                        help="Vérifie ajout -> suppression -> recherche pour chaque type (sans vectorstore)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.check:
+        results = check_incremental()
+        for kind, error in results.items(): print(f"{kind:<9} {'OK' if error is None else error}")
+        return 1 if any(results.values()) else 0
+    index = faiss.read_index(os.path.join(args.vectorstore, "index.faiss"))
+    print_report(recall_latency_report(_all_vectors(index), k=args.k, n_queries=args.queries, nlist=args.nlist), args.k)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# === web_cache.py - CACHE PERSISTANT DES RECHERCHES WEB (SERPER) ===
+# Remplace le dictionnaire WEB_SEARCH_CACHE en mémoire par une base SQLite :
+# - survit aux redémarrages de Streamlit
+# - partagée entre processus (mode WAL, une connexion par thread)
+# - expiration des entrées (TTL) et taille bornée (éviction des moins récemment lues)
+
+# === Importations ===
+import os, time, sqlite3, logging, threading  # Fichiers, horodatage, base SQLite, logs, connexions par thread
+
+logger = logging.getLogger(__name__)
+
+# === Configuration par défaut ===
+WEB_CACHE_DB = os.environ.get("WEB_CACHE_DB", "web_cache.sqlite")                 # Fichier SQLite partagé
+WEB_CACHE_TTL = float(os.environ.get("WEB_CACHE_TTL", str(24 * 3600)))            # Durée de vie (s)
+WEB_CACHE_MAX_ENTRIES = int(os.environ.get("WEB_CACHE_MAX_ENTRIES", "10000"))     # Nombre max d'entrées
+
+class WebSearchCache:
+    """Cache requête -> résultat formaté, sur disque et partagé entre processus"""
+
+    def __init__(self, path=WEB_CACHE_DB, ttl=WEB_CACHE_TTL, max_entries=WEB_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()  # sqlite3 : une connexion par thread
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)  # autocommit
+            conn.execute("PRAGMA journal_mode=WAL")    # Lecteurs et écrivain concurrents (multi-processus)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS web_cache (
+                                query TEXT PRIMARY KEY, result TEXT NOT NULL,
+                                created_at REAL NOT NULL, last_access REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_web_cache_access ON web_cache(last_access)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, query):
+        """Résultat en cache (non expiré) ou None"""
+        try:
+            conn, now = self._conn(), time.time()
+            row = conn.execute("SELECT result FROM web_cache WHERE query=? AND created_at>?",
+                               (query, now - self.ttl)).fetchone()
+            if row is None: return None
+            conn.execute("UPDATE web_cache SET last_access=? WHERE query=?", (now, query))
+            return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"Erreur lecture cache web: {e}")
+            return None
+
+    def set(self, query, result):
+        try:
+            conn, now = self._conn(), time.time()
+            conn.execute("INSERT OR REPLACE INTO web_cache(query, result, created_at, last_access) VALUES (?,?,?,?)",
+                         (query, result, now, now))
+            self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.error(f"Erreur écriture cache web: {e}")
+
+    def _evict(self, conn, now):
+        """Supprime les entrées expirées puis les moins récemment lues au-delà de max_entries"""
+        conn.execute("DELETE FROM web_cache WHERE created_at<=?", (now - self.ttl,))
+        excess = conn.execute("SELECT COUNT(*) FROM web_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute("""DELETE FROM web_cache WHERE query IN (
+                                SELECT query FROM web_cache ORDER BY last_access ASC LIMIT ?)""", (excess,))
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM web_cache").fetchone()[0]